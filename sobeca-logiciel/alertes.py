@@ -0,0 +1,177 @@
+# Échéances des contrôles périodiques des véhicules (CT, mines, tachygraphe, VGP...)
+#
+# Les types de contrôle sont décrits dans data/delais_controles.json :
+#     {"ct": {"libelle": "Contrôle technique", "champ": "date_dernier_ct",
+#             "periode": 365, "attention": 60, "urgent": 30}, ...}
+# "champ" est le champ du véhicule qui porte la date du dernier contrôle.
+# Le prochain contrôle de chaque véhicule et de chaque type est gardé dans une
+# liste triée par date : les contrôles à faire d'ici N jours sont une recherche
+# par intervalle. La liste suit les collections du cache : lorsque les
+# véhicules ont changé, seuls ceux dont les dates de contrôle ont changé sont
+# mis à jour ; lorsque les délais ont changé, elle est reconstruite.
+import bisect
+import threading
+import logging
+from datetime import date, timedelta
+
+logger = logging.getLogger(__name__)
+
+# Types connus, pour les fichiers de délais qui ne les décrivent pas
+TYPES_CONTROLE = {
+    'ct': {'libelle': 'Contrôle technique', 'champ': 'date_dernier_ct'},
+    'mine': {'libelle': 'Mines', 'champ': 'date_dernier_mine'},
+    'tachy': {'libelle': 'Tachygraphe', 'champ': 'date_dernier_tachy'},
+    'vgp': {'libelle': 'VGP', 'champ': 'date_dernier_vgp'}
+}
+
+# Ordre d'affichage des niveaux d'urgence
+URGENCES = ('urgent', 'attention', 'ok')
+
+
+# Types de contrôle décrits par les délais : {code: {'libelle', 'champ', 'periode', 'attention', 'urgent'}}
+def types_controle(delais):
+    types = {}
+    if not isinstance(delais, dict):
+        return types
+    for code, delai in delais.items():
+        if not isinstance(delai, dict) or 'periode' not in delai:
+            continue
+        defaut = TYPES_CONTROLE.get(code, {})
+        types[code] = {
+            'libelle': delai.get('libelle', defaut.get('libelle', code.upper())),
+            'champ': delai.get('champ', defaut.get('champ', f'date_dernier_{code}')),
+            'periode': int(delai['periode']),
+            'attention': int(delai.get('attention', 0)),
+            'urgent': int(delai.get('urgent', 0))
+        }
+    return types
+
+
+def urgence(type_controle, jours_restants):
+    if jours_restants <= type_controle['urgent']:
+        return 'urgent'
+    if jours_restants <= type_controle['attention']:
+        return 'attention'
+    return 'ok'
+
+
+class EcheancesControles:
+    """Prochains contrôles de tous les véhicules, triés par date.
+
+    `charger` retourne la collection partagée d'un fichier (load_data en
+    lecture seule) ; les délais sont lus dans `chemin_delais`.
+    """
+
+    def __init__(self, charger, chemin_vehicules, chemin_delais):
+        self._charger = charger
+        self.chemin_vehicules = chemin_vehicules
+        self.chemin_delais = chemin_delais
+        self._verrou = threading.Lock()
+        self._vehicules = None
+        self._delais = None
+        self.types = {}
+        # (date du prochain contrôle, id du véhicule, type), triés
+        self._echeances = []
+        # id du véhicule -> {type: (date du dernier contrôle, date du prochain)}
+        self._par_vehicule = {}
+
+    # Prochains contrôles d'un véhicule : {type: (dernier, prochain)}
+    def _controles(self, vehicule):
+        controles = {}
+        for code, type_controle in self.types.items():
+            dernier = vehicule.get(type_controle['champ'])
+            if not dernier:
+                continue
+            try:
+                prochain = date.fromisoformat(str(dernier)[:10]) + timedelta(days=type_controle['periode'])
+            except ValueError:
+                logger.warning("Date de contrôle %s invalide pour le véhicule %s : %r",
+                               code, vehicule.get('id'), dernier)
+                continue
+            controles[code] = (dernier, prochain.isoformat())
+        return controles
+
+    def _retirer(self, vehicule_id):
+        for code, (_, prochain) in self._par_vehicule.pop(vehicule_id, {}).items():
+            position = bisect.bisect_left(self._echeances, (prochain, vehicule_id, code))
+            if position < len(self._echeances) and self._echeances[position] == (prochain, vehicule_id, code):
+                del self._echeances[position]
+
+    def _indexer(self, vehicule_id, controles):
+        for code, (_, prochain) in controles.items():
+            bisect.insort(self._echeances, (prochain, vehicule_id, code))
+        if controles:
+            self._par_vehicule[vehicule_id] = controles
+
+    # Met les échéances à jour d'après les collections actuelles
+    def rafraichir(self):
+        vehicules = self._charger(self.chemin_vehicules)
+        delais = self._charger(self.chemin_delais)
+        with self._verrou:
+            if vehicules is self._vehicules and delais is self._delais:
+                return
+            if delais is not self._delais:
+                # Nouveaux délais : toutes les dates sont à recalculer
+                self.types = types_controle(delais)
+                self._par_vehicule = {}
+                self._echeances = []
+                for vehicule in vehicules:
+                    if vehicule.get('id') is not None:
+                        controles = self._controles(vehicule)
+                        if controles:
+                            self._par_vehicule[vehicule['id']] = controles
+                            self._echeances.extend((prochain, vehicule['id'], code)
+                                                   for code, (_, prochain) in controles.items())
+                self._echeances.sort()
+            else:
+                presents = set()
+                for vehicule in vehicules:
+                    vehicule_id = vehicule.get('id')
+                    if vehicule_id is None:
+                        continue
+                    presents.add(vehicule_id)
+                    controles = self._controles(vehicule)
+                    if controles != self._par_vehicule.get(vehicule_id, {}):
+                        self._retirer(vehicule_id)
+                        self._indexer(vehicule_id, controles)
+                for vehicule_id in self._par_vehicule.keys() - presents:
+                    self._retirer(vehicule_id)
+            self._vehicules = vehicules
+            self._delais = delais
+
+    # Contrôles dont le prochain passage tombe au plus tard `jours` jours après
+    # `aujourd_hui` (tous si jours est None), triés par date :
+    #     [{'id', 'vehicule', 'type', 'libelle', 'dernier_controle', 'prochain_controle',
+    #       'jours_restants', 'urgence'}, ...]
+    def echeances(self, jours=None, aujourd_hui=None):
+        self.rafraichir()
+        aujourd_hui = aujourd_hui or date.today()
+        with self._verrou:
+            if jours is None:
+                selection = list(self._echeances)
+            else:
+                limite = (aujourd_hui + timedelta(days=jours)).isoformat()
+                fin = bisect.bisect_right(self._echeances, limite, key=lambda echeance: echeance[0])
+                selection = self._echeances[:fin]
+            # Le rafraîchissement modifie _par_vehicule sur place : les dates sont lues sous le verrou
+            selection = [(prochain, vehicule_id, code, self._par_vehicule[vehicule_id][code][0])
+                         for prochain, vehicule_id, code in selection]
+            vehicules = self._vehicules
+            types = self.types
+        resultat = []
+        for prochain, vehicule_id, code, dernier in selection:
+            vehicule = vehicules.obtenir(vehicule_id)
+            if vehicule is None:
+                continue
+            jours_restants = (date.fromisoformat(prochain) - aujourd_hui).days
+            resultat.append({
+                'id': f'{code}_{vehicule_id}',
+                'vehicule': vehicule,
+                'type': code,
+                'libelle': types[code]['libelle'],
+                'dernier_controle': dernier,
+                'prochain_controle': prochain,
+                'jours_restants': jours_restants,
+                'urgence': urgence(types[code], jours_restants)
+            })
+        return resultat
@@ -1,12 +1,29 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session, send_from_directory
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session, send_from_directory, Response, g
+from flask import before_render_template, template_rendered
+import hashlib
 import json
 import os
+import time
 from datetime import datetime, timedelta, date
 import uuid
 from werkzeug.security import generate_password_hash, check_password_hash
-from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
+from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 from functools import wraps
 import logging
+from alertes import EcheancesControles, URGENCES
+from bilans import BilansVehicules
+from flux import flux_json, negocier_encodage
+from heures import FeuillesHeures, PERIODES
+import inventaire
+from mesures import MesuresRequetes, TAILLE_ECHANTILLON
+from notifications import CanalNotifications
+from previsions import PrevisionsStock
+from recherche import IndexRecherche
+import registre
+from registre import RegistreStock, cout_unitaire
+from statistiques import Agregats
+from taches import Planificateur
+from stockage import CacheCollections, Collection, StockageJSON, StockageSQLite, cle_tri, compteurs_thread, copier, migrer_vers_sqlite
 
 app = Flask(__name__)
 app.secret_key = 'garage_automobile_secret_key'
@@ -60,9 +77,100 @@ PLANNINGS_FILE = os.path.join(DATA_DIR, 'plannings.json')
 DELAIS_CONTROLES_FILE = os.path.join(DATA_DIR, 'delais_controles.json')
 UNREAD_MESSAGES_FILE = os.path.join(DATA_DIR, 'unread_messages.json')
 HISTORIQUE_STOCK_FILE = os.path.join(DATA_DIR, 'historique_stock.json')
+INVENTAIRES_FILE = os.path.join(DATA_DIR, 'inventaires.json')
+COMPTAGES_INVENTAIRE_FILE = os.path.join(DATA_DIR, 'comptages_inventaire.json')
+
+CONFIG_FILE = os.path.join(DATA_DIR, 'config.json')
+SQLITE_FILE = os.path.join(DATA_DIR, 'sobeca.db')
+JOURNAL_DIR = os.path.join(DATA_DIR, 'journal')
+NOTIFICATIONS_FILE = os.path.join(DATA_DIR, 'notifications.db')
+TACHES_FILE = os.path.join(DATA_DIR, 'taches.db')
+MESURES_FILE = os.path.join(DATA_DIR, 'mesures.db')
+REQUETES_LENTES_FILE = os.path.join(DATA_DIR, 'requetes_lentes.log')
+
+# Toutes les collections de l'application
+COLLECTIONS = [
+    USERS_FILE, VEHICULES_FILE, STOCK_FILE, SORTIES_FILE, INTERVENTIONS_FILE,
+    CLIENTS_FILE, CONVERSATIONS_FILE, MESSAGES_FILE, REPORTS_FILE, FOURNISSEURS_FILE,
+    PLANNINGS_FILE, DELAIS_CONTROLES_FILE, UNREAD_MESSAGES_FILE, HISTORIQUE_STOCK_FILE,
+    INVENTAIRES_FILE, COMPTAGES_INVENTAIRE_FILE
+]
+
+# Champs indexés dans la base SQLite
+INDEX_COLLECTIONS = {
+    VEHICULES_FILE: ('client_id',),
+    INTERVENTIONS_FILE: ('vehicule_id', 'client_id', 'technicien'),
+    SORTIES_FILE: ('piece_id', 'vehicule_id', 'intervention_id'),
+    STOCK_FILE: ('fournisseur_id',),
+    MESSAGES_FILE: ('conversation_id',),
+    REPORTS_FILE: ('status',),
+    PLANNINGS_FILE: ('vehicule_id',),
+    HISTORIQUE_STOCK_FILE: ('piece_id',),
+    COMPTAGES_INVENTAIRE_FILE: ('inventaire_id',)
+}
+
+# Collections qui ne font que grandir : chaque mouvement ajoute une ligne (mode JSON)
+JOURNAUX_COLLECTIONS = (SORTIES_FILE, HISTORIQUE_STOCK_FILE, COMPTAGES_INVENTAIRE_FILE)
 
-# Seuil pour le stock faible
-STOCK_FAIBLE_SEUIL = 5
+# Fonction pour charger la configuration (data/config.json)
+def load_config():
+    try:
+        with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        app.logger.error(f"Erreur lors du chargement de {CONFIG_FILE}: {str(e)}")
+        return {}
+
+config = load_config()
+
+# Mode de stockage : "json" (un fichier par collection, par défaut) ou "sqlite"
+if config.get('stockage') == 'sqlite':
+    stockage = StockageSQLite(SQLITE_FILE, index=INDEX_COLLECTIONS)
+else:
+    # Les mouvements de stock peuvent être tenus en journal d'événements (data/sorties/, ...),
+    # une fois importés par `flask migrer-journaux`
+    stockage = StockageJSON(JOURNAL_DIR, journaux=JOURNAUX_COLLECTIONS)
+
+# Terminer les transactions interrompues par un arrêt brutal
+stockage.recuperer(COLLECTIONS)
+
+# Cache en mémoire des collections (revalidé à chaque accès)
+cache_donnees = CacheCollections(stockage)
+
+# Notifications en temps réel (flux /api/evenements), partagées entre les workers
+notifications = CanalNotifications(NOTIFICATIONS_FILE)
+
+# Mesures des requêtes par route (page /admin/performances et /metrics) ;
+# les requêtes plus longues que "seuil_requete_lente_ms" sont journalisées
+mesures_requetes = MesuresRequetes(MESURES_FILE, REQUETES_LENTES_FILE,
+                                   seuil_lent=config.get('seuil_requete_lente_ms', 1000) / 1000)
+
+@app.before_request
+def debut_mesure_requete():
+    mesures_requetes.debut()
+    g.compteurs_stockage = compteurs_thread()
+
+@app.after_request
+def fin_mesure_requete(response):
+    debut = g.get('compteurs_stockage')
+    if debut is not None:
+        for nom, avant, apres in zip(('octets_lus', 'octets_ecrits', 'parcours'), debut, compteurs_thread()):
+            mesures_requetes.ajouter(nom, apres - avant)
+    mesures_requetes.fin(request.endpoint or 'inconnue', request.method, request.full_path.rstrip('?'),
+                         response.status_code)
+    return response
+
+@before_render_template.connect_via(app)
+def debut_rendu_template(sender, template, context, **extra):
+    g.setdefault('debuts_rendu', []).append(time.perf_counter())
+
+@template_rendered.connect_via(app)
+def fin_rendu_template(sender, template, context, **extra):
+    debuts = g.get('debuts_rendu')
+    if debuts:
+        mesures_requetes.ajouter('rendu', time.perf_counter() - debuts.pop())
 
 # Constantes pour les statuts de planning
 PLANNING_STATUTS = {
@@ -77,8 +185,15 @@ PLANNING_STATUTS = {
 DELAI_URGENT = 30  # 30 jours
 DELAI_ATTENTION = 60  # 60 jours
 
-# Classe User pour Flask-Login
-class User(UserMixin):
+# Utilisateur connecté (interface attendue par flask-login, comme UserMixin)
+# Les objets sont partagés entre les requêtes par l'annuaire : ne pas les modifier.
+class User:
+    __slots__ = ('id', 'username', 'password', 'name', 'role')
+
+    is_active = True
+    is_authenticated = True
+    is_anonymous = False
+
     def __init__(self, id, username, password, name, role):
         self.id = id
         self.username = username
@@ -86,51 +201,209 @@ class User(UserMixin):
         self.name = name
         self.role = role
 
+    def get_id(self):
+        return str(self.id)
+
+    def __eq__(self, other):
+        if isinstance(other, User):
+            return self.get_id() == other.get_id()
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(self.get_id())
+
     def check_password(self, password):
         return check_password_hash(self.password, password)
 
+# Annuaire des utilisateurs : (collection, {id: User}, {username: User})
+# Il est reconstruit lorsque la collection du cache change : après create_account,
+# admin_modifier_mdp, delete_user... dans ce processus comme dans les autres.
+_annuaire = (None, {}, {})
+
+def annuaire_utilisateurs():
+    global _annuaire
+    users = load_data(USERS_FILE, lecture_seule=True)
+    annuaire = _annuaire
+    if annuaire[0] is not users:
+        par_id = {}
+        par_nom = {}
+        for user_data in users:
+            user = User(
+                id=user_data['id'],
+                username=user_data['username'],
+                password=user_data['password'],
+                name=user_data.get('name', user_data['username']),
+                role=user_data.get('role', 'user')
+            )
+            par_id.setdefault(user.id, user)
+            par_nom.setdefault(user.username, user)
+        annuaire = _annuaire = (users, par_id, par_nom)
+    return annuaire
+
 # Fonction pour charger un utilisateur
 @login_manager.user_loader
 def load_user(user_id):
-    users = load_data(USERS_FILE)
-    user_data = next((u for u in users if u['id'] == user_id), None)
-    if not user_data:
-        return None
-    return User(
-        id=user_data['id'],
-        username=user_data['username'],
-        password=user_data['password'],
-        name=user_data.get('name', user_data['username']),
-        role=user_data.get('role', 'user')
-    )
-
-# Fonction pour charger les données JSON
-def load_data(file_path):
+    return annuaire_utilisateurs()[1].get(user_id)
+
+# Fonction pour charger les données d'une collection
+# La collection n'est relue que si elle a changé depuis la dernière lecture
+# (elle est créée vide si elle n'existe pas) ; l'appelant reçoit une copie
+# qu'il peut modifier puis passer à save_data.
+# Avec lecture_seule=True, la collection partagée du cache est retournée
+# telle quelle (avec ses index) : elle ne doit alors pas être modifiée.
+def load_data(file_path, lecture_seule=False):
+    debut = time.perf_counter()
     try:
-        if not os.path.exists(file_path):
-            # Si le fichier n'existe pas, créer un fichier vide avec une liste vide
-            with open(file_path, 'w', encoding='utf-8') as f:
-                json.dump([], f)
-            return []
-            
-        with open(file_path, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        donnees = cache_donnees.charger(file_path)
+        if lecture_seule:
+            return donnees
+        return donnees.copie() if isinstance(donnees, Collection) else copier(donnees)
     except Exception as e:
         app.logger.error(f"Erreur lors du chargement de {file_path}: {str(e)}")
         # En cas d'erreur, retourner une liste vide
-        return []
+        return Collection()
+    finally:
+        mesures_requetes.ajouter('load_data', time.perf_counter() - debut)
+
+# Transaction sur plusieurs collections : elles restent verrouillées pendant le bloc
+# et les collections enregistrées sont écrites ensemble (ou pas du tout) à la fin.
+#     with transaction(STOCK_FILE, SORTIES_FILE) as tx:
+#         pieces = tx.charger(STOCK_FILE)
+#         ...
+#         tx.enregistrer(STOCK_FILE, pieces)
+#         tx.ajouter(SORTIES_FILE, nouvelle_sortie)  # ajout seul, sans charger les sorties
+def transaction(*file_paths):
+    return cache_donnees.transaction(file_paths)
+
+# Nom du propriétaire d'un véhicule à partir de la collection des clients
+def nom_proprietaire(vehicule, clients):
+    client = clients.obtenir(vehicule['client_id']) if 'client_id' in vehicule else None
+    if client:
+        return f"{client['nom']} {client['prenom']}"
+    return "Non spécifié"
+
+# Pagination des pages de liste : ?page=, ?par_page=, ?tri=, ?ordre=asc|desc et ?q= (recherche)
+TAILLES_PAGE = (25, 50, 100, 200)
+TAILLE_PAGE_DEFAUT = 50
+app.jinja_env.globals['tailles_page'] = TAILLES_PAGE
+
+# Lit les paramètres de liste de la requête ; `tris` contient les champs de tri autorisés
+# (sans tri demandé ni tri par défaut, l'ordre d'enregistrement est conservé)
+def parametres_liste(tris, tri_defaut=None, ordre_defaut='asc'):
+    tri = request.args.get('tri', tri_defaut)
+    if tri not in tris:
+        tri = tri_defaut
+    ordre = request.args.get('ordre', ordre_defaut)
+    if ordre not in ('asc', 'desc'):
+        ordre = ordre_defaut
+    par_page = request.args.get('par_page', TAILLE_PAGE_DEFAUT, type=int)
+    if par_page not in TAILLES_PAGE:
+        par_page = TAILLE_PAGE_DEFAUT
+    return {
+        'tri': tri,
+        'ordre': ordre,
+        'par_page': par_page,
+        'page': max(request.args.get('page', 1, type=int), 1),
+        'q': request.args.get('q', '').strip()
+    }
 
-# Fonction pour sauvegarder les données JSON
+# Enregistrements dans l'ordre demandé ; l'ordre trié d'une collection complète est gardé en cache
+def trier_liste(elements, parametres):
+    tri = parametres['tri']
+    if not tri:
+        return elements
+    inverse = parametres['ordre'] == 'desc'
+    if isinstance(elements, Collection):
+        return elements.trier(tri, inverse)
+    return sorted(elements, key=lambda element: cle_tri(element.get(tri)), reverse=inverse)
+
+# Découpe des enregistrements déjà triés et filtrés ; retourne (enregistrements de la page, pagination)
+def paginer(elements, parametres):
+    if not isinstance(elements, list):
+        elements = list(elements)
+    total = len(elements)
+    par_page = parametres['par_page']
+    pages = max((total + par_page - 1) // par_page, 1)
+    page = min(parametres['page'], pages)
+    debut = (page - 1) * par_page
+    pagination = {
+        **parametres,
+        'page': page,
+        'pages': pages,
+        'total': total,
+        'debut': debut + 1 if total else 0,
+        'fin': min(debut + par_page, total)
+    }
+    return elements[debut:debut + par_page], pagination
+
+# Vrai si l'une des valeurs contient la recherche (sans tenir compte de la casse)
+def correspond(recherche, *valeurs):
+    recherche = recherche.casefold()
+    return any(recherche in str(valeur).casefold() for valeur in valeurs if valeur is not None)
+
+# URL de la page de liste courante avec des paramètres modifiés (utilisée par templates/pagination.html)
+# Changer de tri, de filtre ou de taille de page ramène à la première page.
+@app.template_global()
+def url_liste(**changements):
+    arguments = request.args.to_dict()
+    if 'page' not in changements:
+        arguments.pop('page', None)
+    arguments.update(changements)
+    arguments = {cle: valeur for cle, valeur in arguments.items() if valeur not in (None, '')}
+    return url_for(request.endpoint, **(request.view_args or {}), **arguments)
+
+# Fonction pour sauvegarder les données d'une collection
+# En mode SQLite, seuls les enregistrements modifiés sont réécrits.
 def save_data(file_path, data):
+    debut = time.perf_counter()
     try:
-        # Créer le répertoire parent s'il n'existe pas
-        os.makedirs(os.path.dirname(file_path), exist_ok=True)
-        
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=4)
+        cache_donnees.enregistrer(file_path, data)
     except Exception as e:
         app.logger.error(f"Erreur lors de la sauvegarde dans {file_path}: {str(e)}")
         raise
+    finally:
+        mesures_requetes.ajouter('save_data', time.perf_counter() - debut)
+
+# Version du code et des templates : les pages mises en cache avant un déploiement sont renvoyées
+def version_application():
+    dates = [os.stat(os.path.join(app.root_path, 'app.py')).st_mtime_ns]
+    for repertoire, _, fichiers in os.walk(os.path.join(app.root_path, app.template_folder)):
+        dates.extend(os.stat(os.path.join(repertoire, nom)).st_mtime_ns for nom in fichiers)
+    return max(dates)
+
+VERSION_APPLICATION = version_application()
+
+# Réponses conditionnelles (ETag / If-None-Match) des pages et API construites à partir de collections
+#     @app.route('/vehicules')
+#     @login_required
+#     @selon_collections(VEHICULES_FILE, CLIENTS_FILE)
+# L'ETag combine la version de ces collections (elle change à chaque save_data,
+# quel que soit le worker), celle des utilisateurs, l'utilisateur connecté et la
+# date du jour. Si le client présente le même ETag, la réponse est 304 Not
+# Modified, sans lire les collections ni rendre la page.
+def selon_collections(*chemins):
+    chemins = (USERS_FILE,) + chemins
+    def decorateur(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            # Messages flash en attente : ils sont affichés une seule fois, la page n'est pas réutilisable
+            if request.method not in ('GET', 'HEAD') or '_flashes' in session:
+                return f(*args, **kwargs)
+            etag = hashlib.sha1(repr((
+                VERSION_APPLICATION, current_user.get_id(), date.today().isoformat(),
+                [cache_donnees.version(chemin) for chemin in chemins]
+            )).encode()).hexdigest()[:20]
+            if request.if_none_match.contains_weak(etag):
+                reponse = Response(status=304)
+            else:
+                reponse = app.make_response(f(*args, **kwargs))
+                if reponse.status_code != 200:
+                    return reponse
+            reponse.set_etag(etag, weak=True)
+            reponse.headers['Cache-Control'] = 'private, no-cache'
+            return reponse
+        return decorated_function
+    return decorateur
 
 # Routes pour l'authentification
 @app.route('/login', methods=['GET', 'POST'])
@@ -145,17 +418,9 @@ def login():
         password = request.form['password']
         remember = 'remember' in request.form
         
-        users = load_data(USERS_FILE)
-        user_data = next((u for u in users if u['username'] == username), None)
+        user = annuaire_utilisateurs()[2].get(username)
         
-        if user_data and check_password_hash(user_data['password'], password):
-            user = User(
-                id=user_data['id'],
-                username=user_data['username'],
-                password=user_data['password'],
-                name=user_data.get('name', user_data['username']),
-                role=user_data.get('role', 'user')
-            )
+        if user and user.check_password(password):
             login_user(user, remember=remember)
             
             # Redirection vers la page demandée initialement ou la page d'accueil
@@ -183,21 +448,10 @@ def logout():
 def index():
     now = datetime.now()
     
-    # Charger les données nécessaires
-    interventions = load_data(INTERVENTIONS_FILE)
-    vehicules = load_data(VEHICULES_FILE)
-    clients = load_data(CLIENTS_FILE)
-    
-    # Associer les noms des propriétaires aux véhicules
-    for vehicule in vehicules:
-        if 'client_id' in vehicule:
-            client = next((c for c in clients if c['id'] == vehicule['client_id']), None)
-            if client:
-                vehicule['proprietaire'] = f"{client['nom']} {client['prenom']}"
-            else:
-                vehicule['proprietaire'] = "Non spécifié"
-        else:
-            vehicule['proprietaire'] = "Non spécifié"
+    # Charger les données nécessaires (collections partagées, non modifiées)
+    interventions = load_data(INTERVENTIONS_FILE, lecture_seule=True)
+    vehicules = load_data(VEHICULES_FILE, lecture_seule=True)
+    clients = load_data(CLIENTS_FILE, lecture_seule=True)
     
     # Filtrer les interventions en cours (des 7 derniers jours)
     date_limite = (now - timedelta(days=7)).strftime('%Y-%m-%d')
@@ -205,12 +459,13 @@ def index():
     
     for intervention in interventions:
         if intervention['date'] >= date_limite:
+            intervention = dict(intervention)
             # Ajouter les informations du véhicule si disponible
             if intervention.get('vehicule_id'):
-                vehicule = next((v for v in vehicules if v['id'] == intervention['vehicule_id']), None)
+                vehicule = vehicules.obtenir(intervention['vehicule_id'])
                 if vehicule:
                     intervention['vehicule_info'] = f"{vehicule['marque']} {vehicule['modele']} ({vehicule['immatriculation']})"
-                    intervention['client_info'] = vehicule['proprietaire']  # Utiliser le propriétaire déjà associé
+                    intervention['client_info'] = nom_proprietaire(vehicule, clients)
                 else:
                     intervention['vehicule_info'] = 'Véhicule non trouvé'
                     intervention['client_info'] = 'Client non trouvé'
@@ -230,23 +485,27 @@ def index():
 # Routes pour la gestion des véhicules
 @app.route('/vehicules')
 @login_required
+@selon_collections(VEHICULES_FILE, CLIENTS_FILE)
 def liste_vehicules():
-    vehicules = load_data(VEHICULES_FILE)
-    clients = load_data(CLIENTS_FILE)
+    vehicules = load_data(VEHICULES_FILE, lecture_seule=True)
+    clients = load_data(CLIENTS_FILE, lecture_seule=True)
     now = datetime.now()
+    parametres = parametres_liste(('immatriculation', 'code_parc', 'numero_serie', 'marque', 'modele', 'annee', 'kilometrage'))
     
-    # Associer les noms des propriétaires aux véhicules
-    for vehicule in vehicules:
-        if 'client_id' in vehicule:
-            client = next((c for c in clients if c['id'] == vehicule['client_id']), None)
-            if client:
-                vehicule['proprietaire'] = f"{client['nom']} {client['prenom']}"
-            else:
-                vehicule['proprietaire'] = "Non spécifié"
-        else:
-            vehicule['proprietaire'] = "Non spécifié"
+    vehicules = trier_liste(vehicules, parametres)
+    if parametres['q']:
+        vehicules = [
+            vehicule for vehicule in vehicules
+            if correspond(parametres['q'], vehicule.get('immatriculation'), vehicule.get('code_parc'),
+                          vehicule.get('numero_serie'), vehicule.get('marque'), vehicule.get('modele'),
+                          vehicule.get('annee'), nom_proprietaire(vehicule, clients))
+        ]
+    vehicules, pagination = paginer(vehicules, parametres)
+    
+    # Associer les noms des propriétaires aux véhicules de la page
+    vehicules = [{**vehicule, 'proprietaire': nom_proprietaire(vehicule, clients)} for vehicule in vehicules]
     
-    return render_template('vehicules/liste.html', vehicules=vehicules, now=now)
+    return render_template('vehicules/liste.html', vehicules=vehicules, now=now, pagination=pagination)
 
 @app.route('/vehicules/ajouter', methods=['GET', 'POST'])
 @login_required
@@ -298,45 +557,76 @@ def ajouter_vehicule():
     clients = load_data(CLIENTS_FILE)
     return render_template('vehicules/ajouter.html', clients=clients)
 
+# Taux horaire de la main-d'œuvre (€)
+TAUX_HORAIRE = 60.0
+
+# Interventions, heures et coûts par véhicule, tenus à jour d'après les interventions et les sorties
+bilans_vehicules = BilansVehicules(lambda chemin: load_data(chemin, lecture_seule=True),
+                                   INTERVENTIONS_FILE, SORTIES_FILE, STOCK_FILE, TAUX_HORAIRE)
+
+# Page de l'historique d'un véhicule (?page=, ?par_page=), les interventions les plus récentes d'abord
+def historique_vehicule(vehicule_id):
+    interventions = load_data(INTERVENTIONS_FILE, lecture_seule=True)
+    ids, pagination = paginer(bilans_vehicules.historique(vehicule_id), parametres_liste(()))
+    historique = [intervention for intervention in map(interventions.obtenir, ids) if intervention]
+    return historique, pagination
+
 @app.route('/vehicules/<vehicule_id>')
 @login_required
 def details_vehicule(vehicule_id):
-    vehicules = load_data(VEHICULES_FILE)
-    vehicule = next((v for v in vehicules if v['id'] == vehicule_id), None)
+    vehicules = load_data(VEHICULES_FILE, lecture_seule=True)
+    vehicule = vehicules.obtenir(vehicule_id)
     
     if not vehicule:
         flash('Véhicule non trouvé', 'danger')
         return redirect(url_for('liste_vehicules'))
     
-    # Charger les interventions
-    interventions = load_data(INTERVENTIONS_FILE)
-    historique = [i for i in interventions if i.get('vehicule_id') == vehicule_id]
-    
-    # Trier l'historique par date (plus anciennes en premier)
-    historique.sort(key=lambda x: x.get('date', ''))
-    
-    # Calculer les statistiques
-    total_interventions = len(historique)
-    total_cout = sum(float(i.get('cout_total', 0)) for i in historique)
-    derniere_intervention = historique[-1] if historique else None
+    historique, pagination = historique_vehicule(vehicule_id)
+    bilan = bilans_vehicules.bilan(vehicule_id)
+    derniere_intervention = None
+    if bilan['derniere_intervention']:
+        derniere_intervention = load_data(INTERVENTIONS_FILE, lecture_seule=True).obtenir(bilan['derniere_intervention'])
     
     return render_template('vehicules/details.html',
                          vehicule=vehicule,
                          historique=historique,
-                         total_interventions=total_interventions,
-                         total_cout=total_cout,
+                         pagination=pagination,
+                         bilan=bilan,
+                         total_interventions=bilan['nombre_interventions'],
+                         total_cout=bilan['cout_total'],
                          derniere_intervention=derniere_intervention)
 
+# Bilan et historique paginé d'un véhicule :
+#     {'bilan': {...}, 'interventions': [...], 'page', 'pages', 'total'}
+@app.route('/api/vehicules/<vehicule_id>/historique')
+@login_required
+@selon_collections(VEHICULES_FILE, INTERVENTIONS_FILE, SORTIES_FILE, STOCK_FILE)
+def api_historique_vehicule(vehicule_id):
+    if not load_data(VEHICULES_FILE, lecture_seule=True).obtenir(vehicule_id):
+        return jsonify({'error': 'Véhicule non trouvé'}), 404
+    historique, pagination = historique_vehicule(vehicule_id)
+    return jsonify({
+        'bilan': bilans_vehicules.bilan(vehicule_id),
+        'interventions': historique,
+        'page': pagination['page'],
+        'pages': pagination['pages'],
+        'total': pagination['total']
+    })
+
 @app.route('/vehicules/<vehicule_id>/modifier', methods=['GET', 'POST'])
 @login_required
 def modifier_vehicule(vehicule_id):
     vehicules = load_data(VEHICULES_FILE)
-    vehicule = next((v for v in vehicules if v['id'] == vehicule_id), None)
+    vehicule = vehicules.obtenir(vehicule_id)
     
     if vehicule is None:
         flash('Véhicule non trouvé.', 'danger')
         return redirect(url_for('liste_vehicules'))
     
+    # Types de contrôle décrits dans les délais des contrôles (voir alertes.py)
+    echeances_controles.rafraichir()
+    types_controle = echeances_controles.types
+    
     if request.method == 'POST':
         try:
             # Mettre à jour les informations de base
@@ -351,25 +641,12 @@ def modifier_vehicule(vehicule_id):
             vehicule['kilometrage'] = int(request.form['kilometrage'])
             
             # Mettre à jour les dates de contrôle
-            if 'date_dernier_ct' in request.form and request.form['date_dernier_ct']:
-                vehicule['date_dernier_ct'] = request.form['date_dernier_ct']
-            elif 'date_dernier_ct' in vehicule:
-                del vehicule['date_dernier_ct']
-            
-            if 'date_dernier_mine' in request.form and request.form['date_dernier_mine']:
-                vehicule['date_dernier_mine'] = request.form['date_dernier_mine']
-            elif 'date_dernier_mine' in vehicule:
-                del vehicule['date_dernier_mine']
-            
-            if 'date_dernier_tachy' in request.form and request.form['date_dernier_tachy']:
-                vehicule['date_dernier_tachy'] = request.form['date_dernier_tachy']
-            elif 'date_dernier_tachy' in vehicule:
-                del vehicule['date_dernier_tachy']
-            
-            if 'date_dernier_vgp' in request.form and request.form['date_dernier_vgp']:
-                vehicule['date_dernier_vgp'] = request.form['date_dernier_vgp']
-            elif 'date_dernier_vgp' in vehicule:
-                del vehicule['date_dernier_vgp']
+            for type_controle in types_controle.values():
+                champ = type_controle['champ']
+                if request.form.get(champ):
+                    vehicule[champ] = request.form[champ]
+                else:
+                    vehicule.pop(champ, None)
             
             save_data(VEHICULES_FILE, vehicules)
             flash('Véhicule modifié avec succès!', 'success')
@@ -378,87 +655,154 @@ def modifier_vehicule(vehicule_id):
             flash(f'Erreur lors de la modification du véhicule : {str(e)}', 'danger')
     
     clients = load_data(CLIENTS_FILE)
-    return render_template('vehicules/modifier.html', vehicule=vehicule, clients=clients)
+    return render_template('vehicules/modifier.html', vehicule=vehicule, clients=clients,
+                           types_controle=types_controle)
+
+# Valeur du stock au coût moyen pondéré, au total et par fournisseur (voir registre.py)
+registre_stock = RegistreStock(lambda chemin: load_data(chemin, lecture_seule=True),
+                               STOCK_FILE, SORTIES_FILE, HISTORIQUE_STOCK_FILE)
+
+# Consommation des pièces et ruptures prévues (voir previsions.py), réglées par "previsions" dans data/config.json :
+#     {"methode": "exponentielle" ou "moyenne", "fenetre": 90, "jours_moyenne": 30, "alpha": 0.1,
+#      "delai_reappro": 14, "couverture": 30}
+reglages_previsions = config.get('previsions', {})
+previsions_stock = PrevisionsStock(lambda chemin: load_data(chemin, lecture_seule=True),
+                                   STOCK_FILE, SORTIES_FILE,
+                                   methode=reglages_previsions.get('methode', 'exponentielle'),
+                                   fenetre=reglages_previsions.get('fenetre', 90),
+                                   jours_moyenne=reglages_previsions.get('jours_moyenne', 30),
+                                   alpha=reglages_previsions.get('alpha', 0.1),
+                                   delai=reglages_previsions.get('delai_reappro', 14),
+                                   couverture=reglages_previsions.get('couverture', 30))
 
 # Routes pour la gestion du stock
 @app.route('/stock')
 @login_required
+@selon_collections(STOCK_FILE, FOURNISSEURS_FILE, SORTIES_FILE, HISTORIQUE_STOCK_FILE)
 def liste_stock():
-    pieces = load_data(STOCK_FILE)
-    fournisseurs = load_data(FOURNISSEURS_FILE)
-    vehicules = load_data(VEHICULES_FILE)
-    sorties = load_data(SORTIES_FILE)
-    
-    # Calculer le nombre de pièces en stock faible
-    stock_faible = len([p for p in pieces if p['quantite'] < p.get('quantite_min', 0)])
-    
-    # Calculer la valeur totale du stock
-    valeur_stock = sum(p['quantite'] * p['prix_achat'] for p in pieces)
-    
-    # Ajouter les informations des sorties récentes
-    for piece in pieces:
-        piece['sorties_recentes'] = []
-        for sortie in sorties:
-            if sortie['piece_id'] == piece['id']:
-                vehicule = next((v for v in vehicules if v['id'] == sortie['vehicule_id']), None)
-                if vehicule:
-                    sortie['vehicule_info'] = f"{vehicule['marque']} {vehicule['modele']} ({vehicule['immatriculation']})"
-                    sortie['client_info'] = vehicule.get('proprietaire', 'Propriétaire non spécifié')  # Gérer en toute sécurité l'accès à la clé 'proprietaire'
-                    piece['sorties_recentes'].append(sortie)
+    pieces = load_data(STOCK_FILE, lecture_seule=True)
+    fournisseurs = load_data(FOURNISSEURS_FILE, lecture_seule=True)
+    parametres = parametres_liste(('reference', 'nom', 'quantite', 'quantite_min', 'prix_achat', 'prix_vente'))
+    etat = request.args.get('etat', 'all')
+    
+    # Nombre de pièces, pièces en stock faible et valeur du stock, tenus à jour par le registre
+    totaux = registre_stock.totaux()
+    stock_faible = totaux['stock_faible']
+    valeur_stock = totaux['valeur_stock']
+    nombre_pieces = totaux['nombre_pieces']
+    
+    # Filtrer, trier puis paginer
+    pieces = trier_liste(pieces, parametres)
+    if etat == 'low':
+        pieces = [p for p in pieces if registre.en_stock_faible(p)]
+    elif etat == 'out':
+        pieces = [p for p in pieces if p['quantite'] == 0]
+    if parametres['q']:
+        pieces = [p for p in pieces if correspond(parametres['q'], p.get('reference'), p.get('nom'), p.get('description'))]
+    pieces, pagination = paginer(pieces, parametres)
+    pagination['etat'] = etat
+    
+    # Derniers mouvements et rupture prévue des pièces de la page
+    previsions = {ligne['piece']['id']: ligne for ligne in previsions_stock.previsions(pieces)}
+    pieces = [{**piece, 'mouvements_recents': registre_stock.mouvements(piece['id']),
+               'prevision': previsions.get(piece['id'])} for piece in pieces]
     
     return render_template('stock/liste.html', 
                          pieces=pieces, 
                          fournisseurs=fournisseurs,
                          stock_faible=stock_faible,
-                         valeur_stock=valeur_stock)
+                         valeur_stock=valeur_stock,
+                         nombre_pieces=nombre_pieces,
+                         previsions_disponibles=previsions_stock.disponible,
+                         pagination=pagination)
+
+# Rapport de réapprovisionnement : pièces dont la rupture est prévue avant la fin du délai, ou en stock faible
+@app.route('/stock/reapprovisionnement')
+@login_required
+@selon_collections(STOCK_FILE, FOURNISSEURS_FILE, SORTIES_FILE)
+def reapprovisionnement():
+    fournisseurs = load_data(FOURNISSEURS_FILE, lecture_seule=True)
+    fournisseur_id = request.args.get('fournisseur_id') or None
+    lignes = previsions_stock.a_commander()
+    if fournisseur_id:
+        lignes = [ligne for ligne in lignes if ligne['piece'].get('fournisseur_id') == fournisseur_id]
+    for ligne in lignes:
+        fournisseur = fournisseurs.obtenir(ligne['piece'].get('fournisseur_id'))
+        ligne['fournisseur'] = fournisseur.get('nom') if fournisseur else None
+        ligne['cout_estime'] = round(ligne['quantite_suggeree'] * (ligne['piece'].get('prix_achat') or 0), 2)
+    return render_template('stock/reapprovisionnement.html',
+                         lignes=lignes,
+                         fournisseurs=fournisseurs,
+                         fournisseur_id=fournisseur_id,
+                         total_estime=round(sum(ligne['cout_estime'] for ligne in lignes), 2),
+                         previsions=previsions_stock)
 
 @app.route('/stock/historique')
 @login_required
 def historique_sorties():
-    sorties = load_data(SORTIES_FILE)
-    pieces = load_data(STOCK_FILE)
-    vehicules = load_data(VEHICULES_FILE)
-    interventions = load_data(INTERVENTIONS_FILE)
-    clients = load_data(CLIENTS_FILE)
-    
-    # Associer les noms des propriétaires aux véhicules
-    for vehicule in vehicules:
-        if 'client_id' in vehicule:
-            client = next((c for c in clients if c['id'] == vehicule['client_id']), None)
-            if client:
-                vehicule['proprietaire'] = f"{client['nom']} {client['prenom']}"
-            else:
-                vehicule['proprietaire'] = "Non spécifié"
-        else:
-            vehicule['proprietaire'] = "Non spécifié"
+    sorties = load_data(SORTIES_FILE, lecture_seule=True)
+    pieces = load_data(STOCK_FILE, lecture_seule=True)
+    vehicules = load_data(VEHICULES_FILE, lecture_seule=True)
+    interventions = load_data(INTERVENTIONS_FILE, lecture_seule=True)
+    clients = load_data(CLIENTS_FILE, lecture_seule=True)
+    parametres = parametres_liste(('date_sortie', 'quantite'), 'date_sortie', 'desc')
+    piece_id = request.args.get('piece_id', '')
+    periode = request.args.get('periode', '')
+    
+    # Filtres utilisant l'index par pièce, puis la période
+    if piece_id:
+        sorties = sorties.filtrer('piece_id', piece_id)
+    sorties = trier_liste(sorties, parametres)
+    if periode in ('today', 'week', 'month'):
+        aujourd_hui = date.today()
+        debut = {
+            'today': aujourd_hui,
+            'week': aujourd_hui - timedelta(days=aujourd_hui.weekday()),
+            'month': aujourd_hui.replace(day=1)
+        }[periode].strftime('%Y-%m-%d')
+        sorties = [s for s in sorties if s.get('date_sortie', '') >= debut]
     
     # Ajouter les informations complètes pour chaque sortie
-    for sortie in sorties:
+    def detailler(sortie):
+        sortie = dict(sortie)
         # Informations de la pièce
         sortie['valeur'] = 0  # Initialiser la valeur à 0 par défaut
-        piece = next((p for p in pieces if p['id'] == sortie['piece_id']), None)
+        piece = pieces.obtenir(sortie['piece_id'])
         if piece:
             sortie['piece_info'] = f"{piece['nom']} ({piece['reference']})"
-            sortie['valeur'] = sortie['quantite'] * piece['prix_achat']  # Mettre à jour la valeur
+            # Valeur au coût de la sortie (coût moyen actuel pour les sorties plus anciennes que le registre)
+            sortie['valeur'] = sortie['quantite'] * sortie.get('cout_unitaire', cout_unitaire(piece))
         
         # Informations du véhicule et du client
-        vehicule = next((v for v in vehicules if v['id'] == sortie['vehicule_id']), None)
+        vehicule = vehicules.obtenir(sortie['vehicule_id'])
         if vehicule:
             sortie['vehicule_info'] = f"{vehicule['marque']} {vehicule['modele']} ({vehicule['immatriculation']})"
-            sortie['client_info'] = vehicule['proprietaire']  # Utiliser le propriétaire déjà associé
+            sortie['client_info'] = nom_proprietaire(vehicule, clients)
         
         # Informations de l'intervention
         if sortie.get('intervention_id'):
-            intervention = next((i for i in interventions if i['id'] == sortie['intervention_id']), None)
+            intervention = interventions.obtenir(sortie['intervention_id'])
             if intervention:
                 sortie['intervention_info'] = f"{intervention['type']} - {intervention['date']}"
-    
-    # Trier les sorties par date (plus récentes en premier)
-    sorties.sort(key=lambda x: x['date_sortie'], reverse=True)
+        return sortie
+    
+    if parametres['q']:
+        # La recherche porte aussi sur les pièces, véhicules et clients associés
+        sorties = [
+            s for s in map(detailler, sorties)
+            if correspond(parametres['q'], s.get('date_sortie'), s.get('piece_info'), s.get('vehicule_info'),
+                          s.get('client_info'), s.get('intervention_info'), s.get('utilisateur'))
+        ]
+        sorties, pagination = paginer(sorties, parametres)
+    else:
+        sorties, pagination = paginer(sorties, parametres)
+        sorties = [detailler(s) for s in sorties]
+    pagination.update(piece_id=piece_id, periode=periode)
     
     return render_template('stock/historique.html', 
                          sorties=sorties,
-                         pieces=pieces)
+                         pieces=pieces,
+                         pagination=pagination)
 
 @app.route('/stock/ajouter', methods=['GET', 'POST'])
 @login_required
@@ -495,6 +839,7 @@ def ajouter_piece():
                 'quantite': int(request.form['quantite']),
                 'quantite_min': int(request.form['quantite_min']),
                 'prix_achat': prix_achat,
+                'cout_moyen': prix_achat,
                 'prix_vente': prix_vente,
                 'fournisseur_id': fournisseur_id,
                 'date_creation': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
@@ -513,9 +858,8 @@ def ajouter_piece():
 @app.route('/stock/modifier/<id>', methods=['GET', 'POST'])
 @login_required
 def modifier_piece(id):
-    pieces = load_data(STOCK_FILE)
-    piece = next((p for p in pieces if p['id'] == id), None)
-    fournisseurs = load_data(FOURNISSEURS_FILE)
+    piece = load_data(STOCK_FILE, lecture_seule=True).obtenir(id)
+    fournisseurs = load_data(FOURNISSEURS_FILE, lecture_seule=True)
     
     if not piece:
         flash('Pièce non trouvée', 'danger')
@@ -535,16 +879,23 @@ def modifier_piece(id):
             prix_achat = round(float(request.form['prix_achat']), 2)
             prix_vente = round(float(request.form['prix_vente']), 2)
             
-            piece['reference'] = request.form['reference']
-            piece['nom'] = request.form['nom']
-            piece['description'] = request.form['description']
-            piece['quantite'] = int(request.form['quantite'])
-            piece['quantite_min'] = int(request.form['quantite_min'])
-            piece['prix_achat'] = prix_achat
-            piece['prix_vente'] = prix_vente
-            piece['fournisseur_id'] = fournisseur_id
-            
-            save_data(STOCK_FILE, pieces)
+            # Le stock reste verrouillé jusqu'à l'écriture : une sortie concurrente n'est pas perdue
+            with transaction(STOCK_FILE) as tx:
+                pieces = tx.charger(STOCK_FILE)
+                piece = pieces.obtenir(id)
+                if not piece:
+                    flash('Pièce non trouvée', 'danger')
+                    return redirect(url_for('liste_stock'))
+                piece['reference'] = request.form['reference']
+                piece['nom'] = request.form['nom']
+                piece['description'] = request.form['description']
+                # Les pièces ajoutées entrent au nouveau prix d'achat
+                registre.ajuster(piece, int(request.form['quantite']), prix_achat)
+                piece['quantite_min'] = int(request.form['quantite_min'])
+                piece['prix_achat'] = prix_achat
+                piece['prix_vente'] = prix_vente
+                piece['fournisseur_id'] = fournisseur_id
+                tx.enregistrer(STOCK_FILE, pieces)
             flash('Pièce modifiée avec succès!', 'success')
             return redirect(url_for('liste_stock'))
         except Exception as e:
@@ -555,58 +906,58 @@ def modifier_piece(id):
 @app.route('/stock/ajuster/<piece_id>', methods=['POST'])
 @login_required
 def ajuster_stock(piece_id):
-    stock = load_data(STOCK_FILE)
-    piece = next((p for p in stock if p['id'] == piece_id), None)
-    
-    if not piece:
-        return jsonify({'success': False, 'message': 'Pièce non trouvée!'})
-    
     quantite = int(request.form['quantite'])
-    piece['quantite'] = quantite
-    
-    save_data(STOCK_FILE, stock)
+    with transaction(STOCK_FILE) as tx:
+        stock = tx.charger(STOCK_FILE)
+        piece = stock.obtenir(piece_id)
+        if not piece:
+            return jsonify({'success': False, 'message': 'Pièce non trouvée!'})
+        registre.ajuster(piece, quantite, piece.get('prix_achat'))
+        tx.enregistrer(STOCK_FILE, stock)
     return jsonify({'success': True, 'message': 'Stock ajusté avec succès!'})
 
 @app.route('/stock/sortie', methods=['POST'])
 @login_required
 def sortir_piece():
     try:
-        pieces = load_data(STOCK_FILE)
-        vehicules = load_data(VEHICULES_FILE)
-        sorties = load_data(SORTIES_FILE)
-        
         piece_id = request.form['piece_id']
         vehicule_id = request.form['vehicule_id']
         quantite = int(request.form['quantite'])
         intervention_id = request.form.get('intervention_id')  # Nouveau champ
         
-        # Vérifier si la pièce existe et si le stock est suffisant
-        piece = next((p for p in pieces if p['id'] == piece_id), None)
-        if not piece or piece['quantite'] < quantite:
-            return jsonify({'success': False, 'message': 'Stock insuffisant!'})
-        
         # Vérifier si le véhicule existe
-        vehicule = next((v for v in vehicules if v['id'] == vehicule_id), None)
+        vehicules = load_data(VEHICULES_FILE, lecture_seule=True)
+        vehicule = vehicules.obtenir(vehicule_id)
         if not vehicule:
             return jsonify({'success': False, 'message': 'Véhicule non trouvé!'})
         
-        # Mettre à jour le stock
-        piece['quantite'] -= quantite
-        
-        # Créer la sortie
-        nouvelle_sortie = {
-            'id': str(uuid.uuid4()),
-            'piece_id': piece_id,
-            'vehicule_id': vehicule_id,
-            'quantite': quantite,
-            'date_sortie': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-            'utilisateur': current_user.name,
-            'intervention_id': intervention_id  # Ajouter l'ID de l'intervention
-        }
-        
-        sorties.append(nouvelle_sortie)
-        save_data(SORTIES_FILE, sorties)
-        save_data(STOCK_FILE, pieces)
+        # Le stock et les sorties restent verrouillés jusqu'à l'écriture
+        with transaction(STOCK_FILE, SORTIES_FILE) as tx:
+            pieces = tx.charger(STOCK_FILE)
+            
+            # Vérifier si la pièce existe et si le stock est suffisant
+            piece = pieces.obtenir(piece_id)
+            if not piece or piece['quantite'] < quantite:
+                return jsonify({'success': False, 'message': 'Stock insuffisant!'})
+            
+            # Mettre à jour le stock (la sortie est valorisée au coût moyen)
+            cout = registre.sortie(piece, quantite)
+            
+            # Créer la sortie
+            nouvelle_sortie = {
+                'id': str(uuid.uuid4()),
+                'piece_id': piece_id,
+                'vehicule_id': vehicule_id,
+                'quantite': quantite,
+                'cout_unitaire': cout,
+                'date_sortie': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                'utilisateur': current_user.name,
+                'intervention_id': intervention_id  # Ajouter l'ID de l'intervention
+            }
+            
+            # La sortie est ajoutée à la fin de l'historique, sans le réécrire
+            tx.ajouter(SORTIES_FILE, nouvelle_sortie)
+            tx.enregistrer(STOCK_FILE, pieces)
         
         return jsonify({'success': True, 'message': 'Pièce sortie avec succès!'})
     except Exception as e:
@@ -615,42 +966,67 @@ def sortir_piece():
 # Routes pour la gestion des interventions
 @app.route('/interventions')
 @login_required
+@selon_collections(INTERVENTIONS_FILE, VEHICULES_FILE, CLIENTS_FILE)
 def liste_interventions():
-    interventions = load_data(INTERVENTIONS_FILE)
-    vehicules = load_data(VEHICULES_FILE)
-    clients = load_data(CLIENTS_FILE)
+    interventions = load_data(INTERVENTIONS_FILE, lecture_seule=True)
+    vehicules = load_data(VEHICULES_FILE, lecture_seule=True)
+    clients = load_data(CLIENTS_FILE, lecture_seule=True)
     now = datetime.now()
+    parametres = parametres_liste(('date', 'type', 'technicien', 'statut'), 'date', 'desc')
+    statut = request.args.get('statut', '')
+
+    # Filtres exacts : le premier utilise l'index de la collection, les suivants filtrent le résultat
+    for champ in ('vehicule_id', 'client_id', 'statut'):
+        valeur = request.args.get(champ)
+        if valeur:
+            if isinstance(interventions, Collection):
+                interventions = interventions.filtrer(champ, valeur)
+            else:
+                interventions = [i for i in interventions if i.get(champ) == valeur]
+    interventions = trier_liste(interventions, parametres)
 
-    for intervention in interventions:
+    def detailler(intervention):
+        intervention = dict(intervention)
         if intervention.get('vehicule_id'):
-            vehicule = next((v for v in vehicules if v['id'] == intervention['vehicule_id']), None)
+            vehicule = vehicules.obtenir(intervention['vehicule_id'])
             if vehicule:
                 intervention['vehicule_marque'] = vehicule['marque']
                 intervention['vehicule_modele'] = vehicule['modele']
                 intervention['vehicule_code_parc'] = vehicule.get('code_parc', 'N/A')
         
         if intervention.get('client_id'):
-            client = next((c for c in clients if c['id'] == intervention['client_id']), None)
+            client = clients.obtenir(intervention['client_id'])
             if client:
                 intervention['client_nom'] = f"{client['nom']} {client['prenom']}"
-    
-    interventions.sort(key=lambda x: x.get('date', ''), reverse=True)
-    return render_template('interventions/liste.html', interventions=interventions)
+        return intervention
+    
+    if parametres['q']:
+        # La recherche porte aussi sur le véhicule et le client associés
+        interventions = [
+            i for i in map(detailler, interventions)
+            if correspond(parametres['q'], i.get('vehicule_code_parc'), i.get('date'), i.get('client_nom'),
+                          i.get('vehicule_marque'), i.get('vehicule_modele'), i.get('type'),
+                          i.get('description'), i.get('technicien'), i.get('statut'))
+        ]
+        interventions, pagination = paginer(interventions, parametres)
+    else:
+        interventions, pagination = paginer(interventions, parametres)
+        interventions = [detailler(i) for i in interventions]
+    pagination['statut'] = statut
+    return render_template('interventions/liste.html', interventions=interventions, pagination=pagination)
 
 @app.route('/interventions/ajouter', methods=['GET', 'POST'])
 @login_required
 def ajouter_intervention():
-    vehicules = load_data(VEHICULES_FILE)
-    clients = load_data(CLIENTS_FILE)
-    stock = load_data(STOCK_FILE)
-    sorties = load_data(SORTIES_FILE)
-    interventions = load_data(INTERVENTIONS_FILE)
-    users = load_data(USERS_FILE)
+    vehicules = load_data(VEHICULES_FILE, lecture_seule=True)
+    clients = load_data(CLIENTS_FILE, lecture_seule=True)
+    stock = load_data(STOCK_FILE, lecture_seule=True)
+    users = load_data(USERS_FILE, lecture_seule=True)
     now = datetime.now()
 
     if request.method == 'POST':
         # Récupérer les informations du véhicule
-        vehicule = next((v for v in vehicules if v['id'] == request.form['vehicule_id']), None)
+        vehicule = vehicules.obtenir(request.form['vehicule_id'])
         if not vehicule:
             flash('Véhicule non trouvé!', 'danger')
             return redirect(url_for('liste_interventions'))
@@ -664,7 +1040,7 @@ def ajouter_intervention():
                 return redirect(url_for('ajouter_intervention'))
 
         # Récupérer le technicien
-        technicien = next((u for u in users if u['id'] == request.form['technicien']), None)
+        technicien = users.obtenir(request.form['technicien'])
         if not technicien:
             flash('Technicien non trouvé!', 'danger')
             return redirect(url_for('liste_interventions'))
@@ -689,53 +1065,59 @@ def ajouter_intervention():
         piece_ids = request.form.getlist('piece_id[]')
         quantites = request.form.getlist('quantite[]')
         
-        for piece_id, quantite in zip(piece_ids, quantites):
-            if piece_id and quantite and int(quantite) > 0:
-                quantite = int(quantite)
-                piece = next((p for p in stock if p['id'] == piece_id), None)
-                
-                if piece and piece['quantite'] >= quantite:
-                    # Ajouter la pièce à l'intervention
-                    nouvelle_intervention['pieces_utilisees'].append({
-                        'piece_id': piece_id,
-                        'nom': piece['nom'],
-                        'prix_unitaire': piece['prix_vente'],
-                        'quantite': quantite,
-                        'total': float(piece['prix_vente']) * quantite
-                    })
-                    
-                    # Mettre à jour le stock
-                    piece['quantite'] -= quantite
+        # Le stock, les sorties et les interventions sont écrits ensemble
+        with transaction(INTERVENTIONS_FILE, STOCK_FILE, SORTIES_FILE, VEHICULES_FILE) as tx:
+            stock = tx.charger(STOCK_FILE)
+            sorties = []
+            
+            for piece_id, quantite in zip(piece_ids, quantites):
+                if piece_id and quantite and int(quantite) > 0:
+                    quantite = int(quantite)
+                    piece = stock.obtenir(piece_id)
                     
-                    # Créer une sortie de pièce
-                    nouvelle_sortie = {
-                        'id': str(uuid.uuid4()),
-                        'piece_id': piece_id,
-                        'vehicule_id': request.form['vehicule_id'],
-                        'quantite': quantite,
-                        'date_sortie': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                        'utilisateur': current_user.name,
-                        'intervention_id': nouvelle_intervention['id']
-                    }
-                    sorties.append(nouvelle_sortie)
-                else:
-                    flash(f'Stock insuffisant pour la pièce {piece["nom"]}!', 'danger')
-                    return redirect(url_for('ajouter_intervention'))
-
-        # Sauvegarder les modifications
-        interventions.append(nouvelle_intervention)
-        save_data(INTERVENTIONS_FILE, interventions)
-        save_data(STOCK_FILE, stock)
-        save_data(SORTIES_FILE, sorties)
-
-        # Mettre à jour le kilométrage du véhicule
-        if 'kilometrage' in request.form and request.form['kilometrage']:
-            # Trouver et mettre à jour le véhicule
-            for v in vehicules:
-                if v['id'] == request.form['vehicule_id']:
-                    v['kilometrage'] = request.form['kilometrage']
-                    break
-            save_data(VEHICULES_FILE, vehicules)
+                    if piece and piece['quantite'] >= quantite:
+                        # Ajouter la pièce à l'intervention
+                        nouvelle_intervention['pieces_utilisees'].append({
+                            'piece_id': piece_id,
+                            'nom': piece['nom'],
+                            'prix_unitaire': piece['prix_vente'],
+                            'quantite': quantite,
+                            'total': float(piece['prix_vente']) * quantite
+                        })
+                        
+                        # Mettre à jour le stock (la sortie est valorisée au coût moyen)
+                        cout = registre.sortie(piece, quantite)
+                        
+                        # Créer une sortie de pièce
+                        nouvelle_sortie = {
+                            'id': str(uuid.uuid4()),
+                            'piece_id': piece_id,
+                            'vehicule_id': request.form['vehicule_id'],
+                            'quantite': quantite,
+                            'cout_unitaire': cout,
+                            'date_sortie': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                            'utilisateur': current_user.name,
+                            'intervention_id': nouvelle_intervention['id']
+                        }
+                        sorties.append(nouvelle_sortie)
+                    else:
+                        flash(f'Stock insuffisant pour la pièce {piece["nom"] if piece else "inconnue"}!', 'danger')
+                        return redirect(url_for('ajouter_intervention'))
+
+            # Sauvegarder les modifications
+            interventions = tx.charger(INTERVENTIONS_FILE)
+            interventions.append(nouvelle_intervention)
+            tx.enregistrer(INTERVENTIONS_FILE, interventions)
+            tx.enregistrer(STOCK_FILE, stock)
+            tx.ajouter(SORTIES_FILE, *sorties)
+
+            # Mettre à jour le kilométrage du véhicule
+            if 'kilometrage' in request.form and request.form['kilometrage']:
+                vehicules = tx.charger(VEHICULES_FILE)
+                vehicule = vehicules.obtenir(request.form['vehicule_id'])
+                if vehicule:
+                    vehicule['kilometrage'] = request.form['kilometrage']
+                    tx.enregistrer(VEHICULES_FILE, vehicules)
 
         flash('Intervention ajoutée avec succès!', 'success')
         return redirect(url_for('liste_interventions'))
@@ -771,8 +1153,8 @@ def details_intervention(intervention_id):
     if technicien:
         intervention['technicien'] = technicien['name']
     
-    # Calculer le coût de la main d'œuvre (taux horaire fixé à 60€)
-    taux_horaire = 60.0
+    # Calculer le coût de la main d'œuvre
+    taux_horaire = TAUX_HORAIRE
     intervention['cout_main_oeuvre'] = intervention['heures'] * taux_horaire
     
     # Calculer le total des pièces
@@ -795,19 +1177,14 @@ def modifier_statut_intervention(intervention_id):
         if not nouveau_statut:
             return jsonify({'success': False, 'message': 'Statut manquant'})
         
-        interventions = load_data(INTERVENTIONS_FILE)
-        intervention_trouvee = False
-        
-        for intervention in interventions:
-            if intervention['id'] == intervention_id:
-                intervention['statut'] = nouveau_statut
-                intervention_trouvee = True
-                break
-        
-        if not intervention_trouvee:
-            return jsonify({'success': False, 'message': 'Intervention non trouvée'})
-        
-        save_data(INTERVENTIONS_FILE, interventions)
+        # Verrouillées jusqu'à l'écriture, pour ne pas écraser une intervention enregistrée entre-temps
+        with transaction(INTERVENTIONS_FILE) as tx:
+            interventions = tx.charger(INTERVENTIONS_FILE)
+            intervention = interventions.obtenir(intervention_id)
+            if not intervention:
+                return jsonify({'success': False, 'message': 'Intervention non trouvée'})
+            intervention['statut'] = nouveau_statut
+            tx.enregistrer(INTERVENTIONS_FILE, interventions)
         return jsonify({'success': True, 'message': 'Statut mis à jour avec succès'})
     except Exception as e:
         return jsonify({'success': False, 'message': f'Erreur lors de la mise à jour : {str(e)}'})
@@ -815,22 +1192,22 @@ def modifier_statut_intervention(intervention_id):
 @app.route('/interventions/modifier/<intervention_id>', methods=['GET', 'POST'])
 @login_required
 def modifier_intervention(intervention_id):
-    interventions = load_data(INTERVENTIONS_FILE)
-    intervention = next((i for i in interventions if i['id'] == intervention_id), None)
+    interventions = load_data(INTERVENTIONS_FILE, lecture_seule=True)
+    intervention = interventions.obtenir(intervention_id)
     
     if not intervention:
         flash('Intervention non trouvée!', 'danger')
         return redirect(url_for('liste_interventions'))
     
-    vehicules = load_data(VEHICULES_FILE)
-    clients = load_data(CLIENTS_FILE)
-    stock = load_data(STOCK_FILE)
-    users = load_data(USERS_FILE)
+    vehicules = load_data(VEHICULES_FILE, lecture_seule=True)
+    clients = load_data(CLIENTS_FILE, lecture_seule=True)
+    stock = load_data(STOCK_FILE, lecture_seule=True)
+    users = load_data(USERS_FILE, lecture_seule=True)
     now = datetime.now()
 
     if request.method == 'POST':
         # Récupérer les informations du véhicule
-        vehicule = next((v for v in vehicules if v['id'] == request.form['vehicule_id']), None)
+        vehicule = vehicules.obtenir(request.form['vehicule_id'])
         if not vehicule:
             flash('Véhicule non trouvé!', 'danger')
             return redirect(url_for('modifier_intervention', intervention_id=intervention_id))
@@ -843,78 +1220,87 @@ def modifier_intervention(intervention_id):
                 flash(f'Le kilométrage saisi ({nouveau_km} km) ne peut pas être inférieur au kilométrage actuel du véhicule ({ancien_km} km)!', 'danger')
                 return redirect(url_for('modifier_intervention', intervention_id=intervention_id))
 
-        # Mettre à jour l'intervention
-        anciennes_pieces = intervention.get('pieces_utilisees', [])
-        intervention.update({
-            'vehicule_id': request.form['vehicule_id'],
-            'client_id': request.form['client_id'],
-            'date': request.form['date'],
-            'type': request.form['type'],
-            'description': request.form['description'],
-            'kilometrage': request.form['kilometrage'],
-            'technicien': request.form['technicien'],
-            'heures': float(request.form['heures']),
-            'pieces_utilisees': anciennes_pieces  # Garder les anciennes pièces
-        })
-
         # Traiter les nouvelles pièces
         piece_ids = request.form.getlist('piece_id[]')
         quantites = request.form.getlist('quantite[]')
-        sorties = load_data(SORTIES_FILE)  # Charger le fichier des sorties
         
-        for piece_id, quantite in zip(piece_ids, quantites):
-            if piece_id and quantite and int(quantite) > 0:
-                quantite = int(quantite)
-                piece = next((p for p in stock if p['id'] == piece_id), None)
-                
-                if piece and piece['quantite'] >= quantite:
-                    # Ajouter la pièce à l'intervention
-                    intervention['pieces_utilisees'].append({
-                        'piece_id': piece_id,
-                        'nom': piece['nom'],
-                        'prix_unitaire': piece['prix_vente'],
-                        'quantite': quantite,
-                        'total': float(piece['prix_vente']) * quantite
-                    })
+        # Le stock, les sorties et les interventions sont écrits ensemble
+        with transaction(INTERVENTIONS_FILE, STOCK_FILE, SORTIES_FILE, VEHICULES_FILE) as tx:
+            interventions = tx.charger(INTERVENTIONS_FILE)
+            intervention = interventions.obtenir(intervention_id)
+            if not intervention:
+                flash('Intervention non trouvée!', 'danger')
+                return redirect(url_for('liste_interventions'))
+            stock = tx.charger(STOCK_FILE)
+            sorties = []  # Nouvelles sorties, ajoutées à l'historique à la fin
+
+            # Mettre à jour l'intervention
+            anciennes_pieces = intervention.get('pieces_utilisees', [])
+            intervention.update({
+                'vehicule_id': request.form['vehicule_id'],
+                'client_id': request.form['client_id'],
+                'date': request.form['date'],
+                'type': request.form['type'],
+                'description': request.form['description'],
+                'kilometrage': request.form['kilometrage'],
+                'technicien': request.form['technicien'],
+                'heures': float(request.form['heures']),
+                'pieces_utilisees': anciennes_pieces  # Garder les anciennes pièces
+            })
+            
+            for piece_id, quantite in zip(piece_ids, quantites):
+                if piece_id and quantite and int(quantite) > 0:
+                    quantite = int(quantite)
+                    piece = stock.obtenir(piece_id)
                     
-                    # Mettre à jour le stock
-                    piece['quantite'] -= quantite
-
-                    # Ajouter dans l'historique des sorties
-                    nouvelle_sortie = {
-                        'id': str(uuid.uuid4()),
-                        'piece_id': piece_id,
-                        'vehicule_id': request.form['vehicule_id'],
-                        'quantite': quantite,
-                        'date_sortie': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                        'utilisateur': current_user.name,
-                        'intervention_id': intervention_id
-                    }
-                    sorties.append(nouvelle_sortie)
-                else:
-                    flash(f'Stock insuffisant pour la pièce {piece["nom"] if piece else "inconnue"}!', 'danger')
-                    return redirect(url_for('modifier_intervention', intervention_id=intervention_id))
-
-        # Sauvegarder les modifications
-        save_data(INTERVENTIONS_FILE, interventions)
-        save_data(STOCK_FILE, stock)
-        save_data(SORTIES_FILE, sorties)  # Sauvegarder l'historique des sorties
-        
-        # Mettre à jour le kilométrage du véhicule
-        if 'kilometrage' in request.form and request.form['kilometrage']:
-            # Trouver et mettre à jour le véhicule
-            for v in vehicules:
-                if v['id'] == request.form['vehicule_id']:
-                    v['kilometrage'] = request.form['kilometrage']
-                    break
-            save_data(VEHICULES_FILE, vehicules)
+                    if piece and piece['quantite'] >= quantite:
+                        # Ajouter la pièce à l'intervention
+                        intervention['pieces_utilisees'].append({
+                            'piece_id': piece_id,
+                            'nom': piece['nom'],
+                            'prix_unitaire': piece['prix_vente'],
+                            'quantite': quantite,
+                            'total': float(piece['prix_vente']) * quantite
+                        })
+                        
+                        # Mettre à jour le stock (la sortie est valorisée au coût moyen)
+                        cout = registre.sortie(piece, quantite)
+
+                        # Ajouter dans l'historique des sorties
+                        nouvelle_sortie = {
+                            'id': str(uuid.uuid4()),
+                            'piece_id': piece_id,
+                            'vehicule_id': request.form['vehicule_id'],
+                            'quantite': quantite,
+                            'cout_unitaire': cout,
+                            'date_sortie': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                            'utilisateur': current_user.name,
+                            'intervention_id': intervention_id
+                        }
+                        sorties.append(nouvelle_sortie)
+                    else:
+                        flash(f'Stock insuffisant pour la pièce {piece["nom"] if piece else "inconnue"}!', 'danger')
+                        return redirect(url_for('modifier_intervention', intervention_id=intervention_id))
+
+            # Sauvegarder les modifications
+            tx.enregistrer(INTERVENTIONS_FILE, interventions)
+            tx.enregistrer(STOCK_FILE, stock)
+            tx.ajouter(SORTIES_FILE, *sorties)  # Compléter l'historique des sorties
+            
+            # Mettre à jour le kilométrage du véhicule
+            if 'kilometrage' in request.form and request.form['kilometrage']:
+                vehicules = tx.charger(VEHICULES_FILE)
+                vehicule = vehicules.obtenir(request.form['vehicule_id'])
+                if vehicule:
+                    vehicule['kilometrage'] = request.form['kilometrage']
+                    tx.enregistrer(VEHICULES_FILE, vehicules)
         
         flash('Intervention modifiée avec succès!', 'success')
         return redirect(url_for('liste_interventions'))
 
     # Récupérer les informations du client et du véhicule
-    client = next((c for c in clients if c['id'] == intervention['client_id']), None)
-    vehicule = next((v for v in vehicules if v['id'] == intervention['vehicule_id']), None)
+    client = clients.obtenir(intervention.get('client_id'))
+    vehicule = vehicules.obtenir(intervention.get('vehicule_id'))
 
     return render_template('interventions/modifier.html',
                          intervention=intervention,
@@ -929,10 +1315,20 @@ def modifier_intervention(intervention_id):
 # Routes pour la gestion des clients
 @app.route('/clients')
 @login_required
+@selon_collections(CLIENTS_FILE)
 def liste_clients():
-    clients = load_data(CLIENTS_FILE)
+    clients = load_data(CLIENTS_FILE, lecture_seule=True)
     now = datetime.now()
-    return render_template('clients/liste.html', clients=clients, now=now)
+    parametres = parametres_liste(('nom', 'prenom', 'telephone', 'email', 'adresse'))
+    clients = trier_liste(clients, parametres)
+    if parametres['q']:
+        clients = [
+            c for c in clients
+            if correspond(parametres['q'], c.get('nom'), c.get('prenom'), c.get('telephone'),
+                          c.get('email'), c.get('adresse'))
+        ]
+    clients, pagination = paginer(clients, parametres)
+    return render_template('clients/liste.html', clients=clients, now=now, pagination=pagination)
 
 @app.route('/clients/ajouter', methods=['GET', 'POST'])
 @login_required
@@ -958,25 +1354,25 @@ def ajouter_client():
 @app.route('/clients/<client_id>')
 @login_required
 def details_client(client_id):
-    clients = load_data(CLIENTS_FILE)  # Charge les données des clients
-    vehicules = load_data(VEHICULES_FILE)  # Charge les données des véhicules
-    interventions = load_data(INTERVENTIONS_FILE)  # Charge les données des interventions
+    clients = load_data(CLIENTS_FILE, lecture_seule=True)  # Charge les données des clients
+    vehicules = load_data(VEHICULES_FILE, lecture_seule=True)  # Charge les données des véhicules
+    interventions = load_data(INTERVENTIONS_FILE, lecture_seule=True)  # Charge les données des interventions
     now = datetime.now()
     
     # Trouver le client correspondant
-    client = next((c for c in clients if c['id'] == client_id), None)
+    client = clients.obtenir(client_id)
     if not client:
         flash('Client non trouvé!', 'danger')
         return redirect(url_for('liste_clients'))
     
     # Filtrer les véhicules appartenant au client
-    vehicules_client = [v for v in vehicules if v.get('client_id') == client_id]
+    vehicules_client = vehicules.filtrer('client_id', client_id)
     
     # Récupérer toutes les interventions pour les véhicules du client
     interventions_client = [
-        {**intervention, 'vehicule': next((v for v in vehicules if v['id'] == intervention['vehicule_id']), None)}
-        for intervention in interventions
-        if intervention.get('vehicule_id') in [v['id'] for v in vehicules_client]
+        {**intervention, 'vehicule': vehicule}
+        for vehicule in vehicules_client
+        for intervention in interventions.filtrer('vehicule_id', vehicule['id'])
     ]
     
     # Trier les interventions par date (plus récentes en premier)
@@ -1022,29 +1418,96 @@ def modifier_client(client_id):
     
     return render_template('clients/modifier.html', client=client)
 
+# Réponse envoyée au fil de l'eau pour les exports en masse des /api :
+#   ?format=ndjson      un enregistrement JSON par ligne (tableau JSON sinon)
+#   ?fields=id,nom      seuls ces champs sont envoyés
+# La réponse est compressée (gzip, ou brotli si disponible) si le client l'accepte.
+# `elements` est une collection en lecture seule : elle n'est jamais modifiée
+# et peut donc être parcourue après la fin de la requête.
+def reponse_flux(elements):
+    ndjson = request.args.get('format') == 'ndjson'
+    champs = request.args.get('fields')
+    if champs is not None:
+        champs = [champ.strip() for champ in champs.split(',') if champ.strip()]
+    encodage = negocier_encodage(request.headers.get('Accept-Encoding'))
+    reponse = Response(flux_json(elements, champs, ndjson, encodage),
+                       mimetype='application/x-ndjson' if ndjson else 'application/json')
+    reponse.headers['Vary'] = 'Accept-Encoding'
+    if encodage:
+        reponse.headers['Content-Encoding'] = encodage
+    return reponse
+
 @app.route('/api/vehicules')
 @login_required
+@selon_collections(VEHICULES_FILE)
 def api_vehicules():
-    vehicules = load_data(VEHICULES_FILE)
-    return jsonify(vehicules)
+    vehicules = load_data(VEHICULES_FILE, lecture_seule=True)
+    return reponse_flux(vehicules)
 
 @app.route('/api/stock')
 @login_required
+@selon_collections(STOCK_FILE)
 def api_stock():
-    stock = load_data(STOCK_FILE)
-    return jsonify(stock)
+    stock = load_data(STOCK_FILE, lecture_seule=True)
+    return reponse_flux(stock)
 
 @app.route('/api/interventions')
 @login_required
+@selon_collections(INTERVENTIONS_FILE)
 def api_interventions():
-    interventions = load_data(INTERVENTIONS_FILE)
-    return jsonify(interventions)
+    interventions = load_data(INTERVENTIONS_FILE, lecture_seule=True)
+    return reponse_flux(interventions)
 
 @app.route('/api/clients')
 @login_required
+@selon_collections(CLIENTS_FILE)
 def api_clients():
-    clients = load_data(CLIENTS_FILE)
-    return jsonify(clients)
+    clients = load_data(CLIENTS_FILE, lecture_seule=True)
+    return reponse_flux(clients)
+
+# Index de recherche globale (barre de recherche du menu) : véhicules, clients, pièces, interventions
+index_recherche = IndexRecherche(lambda chemin: load_data(chemin, lecture_seule=True))
+index_recherche.ajouter_source('vehicule', VEHICULES_FILE,
+                               ('immatriculation', 'code_parc', 'numero_serie', 'marque', 'modele'),
+                               identifiants=('immatriculation', 'code_parc', 'numero_serie'))
+index_recherche.ajouter_source('client', CLIENTS_FILE, ('nom', 'prenom', 'telephone', 'email'),
+                               identifiants=('telephone',))
+index_recherche.ajouter_source('piece', STOCK_FILE, ('reference', 'nom'), identifiants=('reference',))
+index_recherche.ajouter_source('intervention', INTERVENTIONS_FILE, ('description', 'type'))
+
+# Recherche globale : /api/search?q=renau (chaque mot est cherché comme début de mot, sans accents)
+@app.route('/api/search')
+@login_required
+def api_search():
+    q = request.args.get('q', '').strip()
+    limite = min(max(request.args.get('limite', 8, type=int), 1), 50)
+    resultats = []
+    for resultat in index_recherche.rechercher(q, limite):
+        element = resultat['element']
+        if resultat['type'] == 'vehicule':
+            titre = f"{element.get('immatriculation', '')} - {element.get('marque', '')} {element.get('modele', '')}"
+            detail = f"Code parc {element.get('code_parc') or '-'} / N° série {element.get('numero_serie') or '-'}"
+            url = url_for('details_vehicule', vehicule_id=element['id'])
+        elif resultat['type'] == 'client':
+            titre = f"{element.get('nom', '')} {element.get('prenom', '')}"
+            detail = element.get('telephone') or element.get('email') or ''
+            url = url_for('details_client', client_id=element['id'])
+        elif resultat['type'] == 'piece':
+            titre = f"{element.get('reference', '')} - {element.get('nom', '')}"
+            detail = f"{element.get('quantite', 0)} en stock"
+            url = url_for('liste_stock', q=element.get('reference', ''))
+        else:
+            titre = f"{element.get('type', '')} - {element.get('date', '')}"
+            detail = (element.get('description') or '')[:100]
+            url = url_for('details_intervention', intervention_id=element['id'])
+        resultats.append({
+            'type': resultat['type'],
+            'id': element['id'],
+            'titre': titre,
+            'detail': detail,
+            'url': url
+        })
+    return jsonify({'q': q, 'resultats': resultats})
 
 @app.route('/api/users')
 @login_required
@@ -1092,7 +1555,6 @@ def create_conversation():
 def api_delete_conversation(conversation_id):
     try:
         conversations = load_data(CONVERSATIONS_FILE)
-        messages = load_data(MESSAGES_FILE)
         users = load_data(USERS_FILE)
         
         # Vérifier si l'utilisateur existe et est admin
@@ -1114,9 +1576,14 @@ def api_delete_conversation(conversation_id):
         conversations = [c for c in conversations if c['id'] != conversation_id]
         save_data(CONVERSATIONS_FILE, conversations)
         
-        # Supprimer les messages associés
-        messages = [m for m in messages if m['conversation_id'] != conversation_id]
-        save_data(MESSAGES_FILE, messages)
+        # Supprimer les messages associés et leurs compteurs de non lus
+        with transaction(MESSAGES_FILE, UNREAD_MESSAGES_FILE) as tx:
+            messages = [m for m in tx.charger(MESSAGES_FILE) if m['conversation_id'] != conversation_id]
+            tx.enregistrer(MESSAGES_FILE, messages)
+            compteurs = tx.charger(UNREAD_MESSAGES_FILE)
+            if oublier_conversation_non_lus(compteurs, conversation_id):
+                tx.enregistrer(UNREAD_MESSAGES_FILE, compteurs)
+        publier_non_lus(compteurs, conversation['participants'])
         
         return jsonify({'success': True})
     except Exception as e:
@@ -1217,6 +1684,7 @@ def reports():
 
 @app.route('/api/conversations')
 @login_required
+@selon_collections(CONVERSATIONS_FILE)
 def api_conversations():
     conversations = load_data(CONVERSATIONS_FILE)
     # Filtrer les conversations pour ne montrer que celles de l'utilisateur courant
@@ -1224,64 +1692,339 @@ def api_conversations():
         conversations = [c for c in conversations if current_user.id in c['participants']]
     return jsonify(conversations)
 
+# Longueur maximale de l'aperçu du dernier message
+LONGUEUR_APERCU = 80
+
+# Conversations de l'utilisateur avec leur nombre de messages non lus et un
+# aperçu du dernier message, les plus récemment actives d'abord :
+#     {'total': 3, 'conversations': [{'id', 'name', 'created_by', 'participants',
+#                                     'non_lus', 'dernier_message'}, ...]}
+# Remplace un appel à /api/messages/<id> par conversation pour les badges.
+@app.route('/api/conversations/resume')
+@login_required
+@selon_collections(CONVERSATIONS_FILE, MESSAGES_FILE, UNREAD_MESSAGES_FILE)
+def api_resume_conversations():
+    conversations = load_data(CONVERSATIONS_FILE, lecture_seule=True)
+    messages = load_data(MESSAGES_FILE, lecture_seule=True)
+    compteur = initialiser_non_lus(current_user.id)
+    non_lus = compteur.get('conversations', {})
+    
+    resume = []
+    for conversation in conversations:
+        if current_user.role != 'admin' and current_user.id not in conversation['participants']:
+            continue
+        derniers = messages.filtrer('conversation_id', conversation['id'])
+        dernier = derniers[-1] if derniers else None
+        resume.append({
+            'id': conversation['id'],
+            'name': conversation.get('name'),
+            'created_by': conversation.get('created_by'),
+            'participants': conversation['participants'],
+            'non_lus': non_lus.get(conversation['id'], 0),
+            'dernier_message': {
+                'sender_id': dernier['sender_id'],
+                'sender_name': dernier.get('sender_name'),
+                'content': dernier['content'][:LONGUEUR_APERCU],
+                'created_at': dernier['created_at']
+            } if dernier else None
+        })
+    resume.sort(key=lambda c: c['dernier_message']['created_at'] if c['dernier_message']
+                else conversations.obtenir(c['id']).get('created_at', ''), reverse=True)
+    return jsonify({'total': compteur['total'], 'conversations': resume})
+
+# Nombre de messages rendus par défaut (et au plus) par /api/messages/<id>
+MESSAGES_PAR_PAGE = 50
+MESSAGES_PAR_PAGE_MAX = 200
+
+# Messages d'une conversation, par curseur :
+#     ?after=<id ou date ISO>  messages postérieurs (les plus anciens d'abord)
+#     ?before=<id>             page précédant ce message
+#     sans curseur             dernière page
+#     &limit=                  taille de la page
+# Réponse : {'messages': [...], 'plus_anciens': bool, 'suite': bool}
+# ('suite' : d'autres messages suivent la page, à demander avec after=).
 @app.route('/api/messages/<conversation_id>')
 @login_required
+@selon_collections(CONVERSATIONS_FILE, MESSAGES_FILE, UNREAD_MESSAGES_FILE)
 def api_messages(conversation_id):
-    messages = load_data(MESSAGES_FILE)
-    conversations = load_data(CONVERSATIONS_FILE)
+    conversations = load_data(CONVERSATIONS_FILE, lecture_seule=True)
     
     # Vérifier si l'utilisateur a accès à cette conversation
-    conversation = next((c for c in conversations if c['id'] == conversation_id), None)
+    conversation = conversations.obtenir(conversation_id)
     if not conversation or (current_user.role != 'admin' and current_user.id not in conversation['participants']):
-        return jsonify([])
-    
-    conversation_messages = [m for m in messages if m['conversation_id'] == conversation_id]
-    return jsonify(conversation_messages)
+        return jsonify({'messages': [], 'plus_anciens': False, 'suite': False})
+    
+    messages = load_data(MESSAGES_FILE, lecture_seule=True)
+    # Messages de la conversation dans l'ordre d'envoi (index par conversation)
+    conversation_messages = messages.filtrer('conversation_id', conversation_id)
+    limite = min(max(request.args.get('limit', MESSAGES_PAR_PAGE, type=int), 1), MESSAGES_PAR_PAGE_MAX)
+    apres = request.args.get('after')
+    avant = request.args.get('before')
+    
+    if apres:
+        debut = messages.position('conversation_id', conversation_id, apres)
+        if debut is not None:
+            debut += 1
+        else:
+            # Date : les messages récents sont à la fin, la recherche part de là
+            debut = len(conversation_messages)
+            while debut > 0 and conversation_messages[debut - 1].get('created_at', '') > apres:
+                debut -= 1
+        fin = min(debut + limite, len(conversation_messages))
+    else:
+        fin = len(conversation_messages)
+        if avant:
+            position = messages.position('conversation_id', conversation_id, avant)
+            if position is not None:
+                fin = position
+        debut = max(fin - limite, 0)
+    
+    # Statut de lecture de l'utilisateur courant : 'lu' est complété d'après sa marque de lecture
+    compteur = load_data(UNREAD_MESSAGES_FILE, lecture_seule=True).obtenir(current_user.id)
+    dernier_lu = rang_lu(compteur, messages, conversation_id)
+    page = [dict(message, lu={**message.get('lu', {}),
+                              current_user.id: est_lu(message, current_user.id, rang, dernier_lu)})
+            for rang, message in enumerate(conversation_messages[debut:fin], start=debut)]
+    
+    return jsonify({
+        'messages': page,
+        'plus_anciens': debut > 0,
+        'suite': fin < len(conversation_messages)
+    })
+
+# Compteurs de messages non lus (UNREAD_MESSAGES_FILE), un enregistrement par utilisateur :
+#     {'id': user_id, 'total': 3, 'conversations': {conversation_id: 3},
+#      'lu_jusqu_a': {conversation_id: message_id}}
+# 'lu_jusqu_a' est la marque de lecture : les messages d'une conversation sont
+# lus jusqu'à ce message inclus (les anciens messages peuvent aussi porter un
+# dictionnaire 'lu'). Les compteurs sont tenus à jour par send_message,
+# marquer_conversation_lue et la suppression des conversations. Un utilisateur
+# sans compteur n'en a pas encore eu besoin : son compteur est calculé une fois
+# à partir des messages (initialiser_non_lus) et les messages ne mettent à jour
+# que les compteurs existants.
+
+# Rang du dernier message lu par l'utilisateur dans la conversation (-1 si aucun)
+def rang_lu(compteur, messages, conversation_id):
+    message_id = (compteur or {}).get('lu_jusqu_a', {}).get(conversation_id)
+    if message_id is None:
+        return -1
+    rang = messages.position('conversation_id', conversation_id, message_id)
+    return -1 if rang is None else rang
+
+def est_lu(message, user_id, rang, dernier_lu):
+    return (message['sender_id'] == user_id or rang <= dernier_lu or
+            message.get('lu', {}).get(user_id, False))
+
+# Messages non lus d'une conversation à partir du rang `debut`
+def compter_non_lus_conversation(user_id, messages, conversation_id, dernier_lu, debut=0):
+    conversation_messages = messages.filtrer('conversation_id', conversation_id)
+    return sum(1 for rang in range(max(debut, dernier_lu + 1), len(conversation_messages))
+               if not est_lu(conversation_messages[rang], user_id, rang, dernier_lu))
+
+def compter_non_lus(user_id, messages, conversations, compteur=None):
+    par_conversation = {}
+    for conversation in conversations:
+        if user_id not in conversation['participants']:
+            continue
+        nombre = compter_non_lus_conversation(user_id, messages, conversation['id'],
+                                              rang_lu(compteur, messages, conversation['id']))
+        if nombre:
+            par_conversation[conversation['id']] = nombre
+    resultat = {'id': user_id, 'total': sum(par_conversation.values()), 'conversations': par_conversation}
+    if compteur and compteur.get('lu_jusqu_a'):
+        resultat['lu_jusqu_a'] = compteur['lu_jusqu_a']
+    return resultat
+
+# Compteur de l'utilisateur, calculé et enregistré s'il n'existe pas encore
+def initialiser_non_lus(user_id):
+    compteurs = load_data(UNREAD_MESSAGES_FILE, lecture_seule=True)
+    compteur = compteurs.obtenir(user_id)
+    if compteur is not None:
+        return compteur
+    # Les messages restent verrouillés : aucun envoi ne peut échapper au calcul
+    with transaction(MESSAGES_FILE, UNREAD_MESSAGES_FILE) as tx:
+        compteur = tx.charger(UNREAD_MESSAGES_FILE).obtenir(user_id)
+        if compteur is None:
+            compteur = compter_non_lus(user_id,
+                                       load_data(MESSAGES_FILE, lecture_seule=True),
+                                       load_data(CONVERSATIONS_FILE, lecture_seule=True))
+            tx.ajouter(UNREAD_MESSAGES_FILE, compteur)
+    return compteur
+
+# Ajoute `delta` au compteur d'une conversation (compteurs chargés dans une transaction)
+# Retourne True si un compteur a changé.
+def modifier_non_lus(compteurs, user_id, conversation_id, delta):
+    compteur = compteurs.obtenir(user_id)
+    if compteur is None:
+        return False
+    par_conversation = compteur.setdefault('conversations', {})
+    nombre = max(par_conversation.get(conversation_id, 0) + delta, 0)
+    if nombre:
+        par_conversation[conversation_id] = nombre
+    else:
+        par_conversation.pop(conversation_id, None)
+    compteur['total'] = sum(par_conversation.values())
+    return True
+
+# Retire une conversation supprimée de tous les compteurs (et des marques de lecture)
+def oublier_conversation_non_lus(compteurs, conversation_id):
+    modifie = False
+    for compteur in compteurs:
+        par_conversation = compteur.get('conversations', {})
+        if conversation_id in par_conversation:
+            del par_conversation[conversation_id]
+            compteur['total'] = sum(par_conversation.values())
+            modifie = True
+        if compteur.get('lu_jusqu_a', {}).pop(conversation_id, None) is not None:
+            modifie = True
+    return modifie
+
+# Publie le compteur de non lus de chacun des utilisateurs (s'ils en ont un)
+def publier_non_lus(compteurs, utilisateurs):
+    for user_id in utilisateurs:
+        compteur = compteurs.obtenir(user_id)
+        if compteur is not None:
+            notifications.publier([user_id], 'non_lus', {
+                'total': compteur['total'],
+                'conversations': compteur.get('conversations', {})
+            })
 
+# Marque la conversation comme lue par l'utilisateur jusqu'au message `message_id`
+# inclus (jusqu'au dernier message par défaut). Seule la marque de lecture et le
+# compteur de l'utilisateur sont écrits, quel que soit le nombre de messages lus.
+# Retourne le compteur de l'utilisateur, ou None si le message n'existe pas.
+def marquer_conversation_lue(user_id, conversation, message_id=None):
+    initialiser_non_lus(user_id)
+    conversation_id = conversation['id']
+    with transaction(MESSAGES_FILE, UNREAD_MESSAGES_FILE) as tx:
+        # Lus sous le verrou : un message envoyé entre-temps est bien compté
+        messages = load_data(MESSAGES_FILE, lecture_seule=True)
+        conversation_messages = messages.filtrer('conversation_id', conversation_id)
+        if message_id is None:
+            rang = len(conversation_messages) - 1
+        else:
+            rang = messages.position('conversation_id', conversation_id, message_id)
+            if rang is None:
+                return None
+        compteurs = tx.charger(UNREAD_MESSAGES_FILE)
+        compteur = compteurs.obtenir(user_id)
+        dernier_lu = rang_lu(compteur, messages, conversation_id)
+        if rang <= dernier_lu:
+            return compteur
+        
+        compteur.setdefault('lu_jusqu_a', {})[conversation_id] = conversation_messages[rang]['id']
+        if user_id in conversation['participants']:
+            non_lus = compter_non_lus_conversation(user_id, messages, conversation_id, rang)
+            modifier_non_lus(compteurs, user_id, conversation_id,
+                             non_lus - compteur.get('conversations', {}).get(conversation_id, 0))
+        tx.enregistrer(UNREAD_MESSAGES_FILE, compteurs)
+    
+    # Accusé de lecture pour les participants, nouveau compteur pour le lecteur
+    notifications.publier(list(conversation['participants']) + [user_id], 'lu', {
+        'conversation_id': conversation_id,
+        'message_id': conversation_messages[rang]['id'],
+        'user_id': user_id
+    })
+    publier_non_lus(compteurs, [user_id])
+    return compteur
+
+# Marque la conversation comme lue : {"jusqu_a": "<message_id>"} (facultatif, dernier message par défaut)
+@app.route('/api/conversations/<conversation_id>/lu', methods=['POST'])
+@login_required
+def api_marquer_conversation_lue(conversation_id):
+    try:
+        data = request.get_json(silent=True) or {}
+        conversation = load_data(CONVERSATIONS_FILE, lecture_seule=True).obtenir(conversation_id)
+        if not conversation or (current_user.role != 'admin' and current_user.id not in conversation['participants']):
+            return jsonify({'error': 'Accès non autorisé'}), 403
+        
+        compteur = marquer_conversation_lue(current_user.id, conversation, data.get('jusqu_a'))
+        if compteur is None:
+            return jsonify({'error': 'Message non trouvé'}), 404
+        return jsonify({
+            'success': True,
+            'non_lus': compteur.get('conversations', {}).get(conversation_id, 0),
+            'total': compteur['total']
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# Marque un message comme lu, ainsi que ceux qui le précèdent dans la conversation
 @app.route('/messages/marquer_lu/<message_id>', methods=['POST'])
 @login_required
 def marquer_message_lu(message_id):
     try:
-        messages = load_data(MESSAGES_FILE)
-        message_updated = False
-        
-        for message in messages:
-            if message['id'] == message_id:
-                # Initialiser le dictionnaire 'lu' si nécessaire
-                if 'lu' not in message:
-                    message['lu'] = {}
-                # Marquer comme lu pour l'utilisateur courant
-                message['lu'][current_user.id] = True
-                message_updated = True
-                break
-        
-        if message_updated:
-            save_data(MESSAGES_FILE, messages)
-            return jsonify({'success': True})
-        else:
+        message = load_data(MESSAGES_FILE, lecture_seule=True).obtenir(message_id)
+        if not message:
             return jsonify({'error': 'Message non trouvé'}), 404
-            
+        conversation = load_data(CONVERSATIONS_FILE, lecture_seule=True).obtenir(message['conversation_id'])
+        if not conversation:
+            return jsonify({'error': 'Conversation non trouvée'}), 404
+        
+        marquer_conversation_lue(current_user.id, conversation, message_id)
+        return jsonify({'success': True})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/unread-count')
 @login_required
 def get_unread_count():
-    messages = load_data(MESSAGES_FILE)
-    conversations = load_data(CONVERSATIONS_FILE)
-    
-    # Compter les messages non lus
-    unread_count = 0
-    for message in messages:
-        # Vérifier si le message appartient à une conversation de l'utilisateur
-        conversation = next((c for c in conversations if c['id'] == message['conversation_id']), None)
-        if (conversation and 
-            current_user.id in conversation['participants'] and 
-            message['sender_id'] != current_user.id and 
-            not message.get('lu', {}).get(current_user.id, False)):
-            unread_count += 1
-            
-    return jsonify({'count': unread_count})
+    # Compteur tenu à jour à l'envoi et à la lecture des messages
+    compteur = initialiser_non_lus(current_user.id)
+    return jsonify({'count': compteur['total']})
+
+# Durée d'une connexion au flux : le navigateur se reconnecte ensuite de lui-même
+# (avec Last-Event-ID), ce qui libère régulièrement les workers
+DUREE_FLUX = 300
+INTERVALLE_PING = 15
+
+# Flux Server-Sent Events des notifications de l'utilisateur :
+#     event: message | lu | non_lus
+#     id: <numéro de la notification>
+#     data: {...}
+# Le premier événement est le compteur de non lus actuel. Sans flux (navigateur
+# ou serveur qui ne le permet pas, "notifications_temps_reel": false dans
+# data/config.json), les pages reviennent à l'interrogation périodique.
+@app.route('/api/evenements')
+@login_required
+def api_evenements():
+    if not config.get('notifications_temps_reel', True):
+        return '', 204
+    
+    user_id = current_user.id
+    curseur = request.headers.get('Last-Event-ID', type=int)
+    compteur = initialiser_non_lus(user_id)
+    abonnement = notifications.abonner(user_id)
+    
+    def evenement(type_evenement, donnees, numero=None):
+        lignes = [f'event: {type_evenement}']
+        if numero is not None:
+            lignes.append(f'id: {numero}')
+        lignes.append('data: ' + json.dumps(donnees, ensure_ascii=False))
+        return '\n'.join(lignes) + '\n\n'
+    
+    def flux():
+        with abonnement:
+            dernier = curseur or 0
+            yield 'retry: 5000\n'
+            yield evenement('non_lus', {'total': compteur['total'],
+                                        'conversations': compteur.get('conversations', {})})
+            # Reconnexion : rattraper ce qui a été publié pendant la coupure
+            if curseur is not None:
+                for notification in notifications.depuis(user_id, curseur):
+                    dernier = notification['n']
+                    yield evenement(notification['type'], notification['donnees'], notification['n'])
+            fin = time.monotonic() + DUREE_FLUX
+            while time.monotonic() < fin:
+                notification = abonnement.attendre(INTERVALLE_PING)
+                if notification is None:
+                    yield ': ping\n\n'
+                elif notification['n'] > dernier:
+                    dernier = notification['n']
+                    yield evenement(notification['type'], notification['donnees'], notification['n'])
+    
+    return Response(flux(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 @app.route('/api/reports', methods=['GET', 'POST'])
 @login_required
@@ -1350,27 +2093,37 @@ def send_message():
         if not data or 'content' not in data or 'conversation_id' not in data:
             return jsonify({'error': 'Données manquantes'}), 400
 
-        messages = load_data(MESSAGES_FILE)
-        conversations = load_data(CONVERSATIONS_FILE)
+        conversations = load_data(CONVERSATIONS_FILE, lecture_seule=True)
         
         # Vérifier si l'utilisateur a accès à cette conversation
-        conversation = next((c for c in conversations if c['id'] == data['conversation_id']), None)
+        conversation = conversations.obtenir(data['conversation_id'])
         if not conversation or current_user.id not in conversation['participants']:
             return jsonify({'error': 'Accès non autorisé'}), 403
         
-        # Créer le message avec un dictionnaire de statut de lecture
+        # Le message ne porte pas d'état de lecture : chaque participant a sa marque 'lu_jusqu_a'
         new_message = {
             'id': str(uuid.uuid4()),
             'conversation_id': data['conversation_id'],
             'sender_id': current_user.id,
             'sender_name': current_user.name,
             'content': data['content'],
-            'created_at': datetime.now().isoformat(),
-            'lu': {current_user.id: True}  # Le message est automatiquement lu par l'expéditeur
+            'created_at': datetime.now().isoformat()
         }
         
-        messages.append(new_message)
-        save_data(MESSAGES_FILE, messages)
+        # Le message est ajouté sans relire l'historique ; les autres participants
+        # ont un message non lu de plus
+        with transaction(MESSAGES_FILE, UNREAD_MESSAGES_FILE) as tx:
+            tx.ajouter(MESSAGES_FILE, new_message)
+            compteurs = tx.charger(UNREAD_MESSAGES_FILE)
+            modifie = False
+            for participant in conversation['participants']:
+                if participant != current_user.id:
+                    modifie = modifier_non_lus(compteurs, participant, data['conversation_id'], 1) or modifie
+            if modifie:
+                tx.enregistrer(UNREAD_MESSAGES_FILE, compteurs)
+        
+        notifications.publier(conversation['participants'], 'message', new_message)
+        publier_non_lus(compteurs, [p for p in conversation['participants'] if p != current_user.id])
         
         return jsonify(new_message)
     except Exception as e:
@@ -1408,8 +2161,6 @@ def api_create_conversation():
 @login_required
 def delete_conversation(conversation_id):
     conversations = load_data(CONVERSATIONS_FILE)
-    messages = load_data(MESSAGES_FILE)
-    unread_messages = load_data(UNREAD_MESSAGES_FILE)
     
     # Vérifier si l'utilisateur a accès à cette conversation
     conversation = next((c for c in conversations if c['id'] == conversation_id), None)
@@ -1420,119 +2171,146 @@ def delete_conversation(conversation_id):
     conversations = [c for c in conversations if c['id'] != conversation_id]
     save_data(CONVERSATIONS_FILE, conversations)
     
-    # Supprimer les messages associés
-    messages = [m for m in messages if m['conversation_id'] != conversation_id]
-    save_data(MESSAGES_FILE, messages)
-    
-    # Supprimer les messages non lus associés
-    unread_messages = [m for m in unread_messages if m['conversation_id'] != conversation_id]
-    save_data(UNREAD_MESSAGES_FILE, unread_messages)
+    # Supprimer les messages associés et leurs compteurs de non lus
+    with transaction(MESSAGES_FILE, UNREAD_MESSAGES_FILE) as tx:
+        messages = [m for m in tx.charger(MESSAGES_FILE) if m['conversation_id'] != conversation_id]
+        tx.enregistrer(MESSAGES_FILE, messages)
+        compteurs = tx.charger(UNREAD_MESSAGES_FILE)
+        if oublier_conversation_non_lus(compteurs, conversation_id):
+            tx.enregistrer(UNREAD_MESSAGES_FILE, compteurs)
+    publier_non_lus(compteurs, conversation['participants'])
     
     return jsonify({'success': True})
 
+# Agrégats du panel d'administration : recalculés seulement quand leur collection a changé
+statistiques = Agregats(lambda chemin: load_data(chemin, lecture_seule=True))
+statistiques.definir('total_users', USERS_FILE, len)
+statistiques.definir('total_vehicles', VEHICULES_FILE, len)
+statistiques.definir('total_clients', CLIENTS_FILE, len)
+statistiques.definir('total_interventions', INTERVENTIONS_FILE, len)
+statistiques.definir('total_stock', STOCK_FILE, len)
+statistiques.definir('total_fournisseurs', FOURNISSEURS_FILE, len)
+statistiques.definir('pending_reports', REPORTS_FILE,
+                     lambda reports: sum(1 for r in reports if r.get('status') == 'pending'))
+statistiques.definir('low_stock', STOCK_FILE,
+                     lambda stock: sum(1 for s in stock if registre.en_stock_faible(s)))
+
+# Tables du panel d'administration, chargées à la demande (voir admin_panel_table) :
+# nom -> (collection, champs de tri, tri par défaut, ordre par défaut, champs de recherche)
+TABLES_ADMIN = {
+    'users': (USERS_FILE, ('name', 'role'), 'name', 'asc', ('name', 'username', 'role')),
+    'vehicles': (VEHICULES_FILE, ('marque', 'modele', 'immatriculation'), 'marque', 'asc',
+                 ('marque', 'modele', 'immatriculation')),
+    'clients': (CLIENTS_FILE, ('nom', 'prenom', 'telephone', 'email'), 'nom', 'asc',
+                ('nom', 'prenom', 'telephone', 'email')),
+    'fournisseurs': (FOURNISSEURS_FILE, ('nom', 'contact', 'telephone', 'email'), 'nom', 'asc',
+                     ('nom', 'contact', 'telephone', 'email')),
+    'interventions': (INTERVENTIONS_FILE, ('date', 'technicien'), 'date', 'desc',
+                      ('date', 'description', 'technicien')),
+    'stock': (STOCK_FILE, ('nom', 'quantite', 'prix_unitaire'), 'nom', 'asc', ('nom', 'reference')),
+    'reports': (REPORTS_FILE, ('created_at', 'user_name', 'type', 'status'), 'created_at', 'desc',
+                ('user_name', 'type', 'content', 'status'))
+}
+
 @app.route('/admin/panel')
 @login_required
 @admin_required
 def admin_panel():
-    # Récupérer toutes les données nécessaires
-    users = load_data(USERS_FILE)
-    vehicles = load_data(VEHICULES_FILE)
-    clients = load_data(CLIENTS_FILE)
-    interventions = load_data(INTERVENTIONS_FILE)
-    stock = load_data(STOCK_FILE)
-    reports = load_data(REPORTS_FILE)
-    fournisseurs = load_data(FOURNISSEURS_FILE)
-    
-    # Statistiques
-    stats = {
-        'total_users': len(users),
-        'total_vehicles': len(vehicles),
-        'total_clients': len(clients),
-        'total_interventions': len(interventions),
-        'total_stock': len(stock),
-        'total_fournisseurs': len(fournisseurs),
-        'pending_reports': len([r for r in reports if r['status'] == 'pending']),
-        'low_stock': len([s for s in stock if s.get('quantite', 0) < STOCK_FAIBLE_SEUIL])}
-    
-    return render_template('admin/panel.html', 
-                         users=users,
-                         vehicles=vehicles,
-                         clients=clients,
-                         interventions=interventions,
-                         stock=stock,
-                         reports=reports,
-                         fournisseurs=fournisseurs,
-                         stats=stats)
+    # Les tables sont chargées par la page, section par section (admin_panel_table)
+    return render_template('admin/panel.html', stats=statistiques.valeurs(), tables=TABLES_ADMIN)
+
+# Une page d'une table du panel (fragment HTML inséré dans admin/panel.html)
+@app.route('/admin/panel/<table>')
+@login_required
+@admin_required
+def admin_panel_table(table):
+    if table not in TABLES_ADMIN:
+        return jsonify({'error': 'Table inconnue'}), 404
+    chemin, tris, tri_defaut, ordre_defaut, champs = TABLES_ADMIN[table]
+    parametres = parametres_liste(tris, tri_defaut, ordre_defaut)
+    
+    elements = trier_liste(load_data(chemin, lecture_seule=True), parametres)
+    if parametres['q']:
+        elements = [e for e in elements if correspond(parametres['q'], *(e.get(champ) for champ in champs))]
+    elements, pagination = paginer(elements, parametres)
+    
+    # Informations associées, pour les enregistrements de la page seulement
+    if table == 'vehicles':
+        clients = load_data(CLIENTS_FILE, lecture_seule=True)
+        elements = [{**vehicule, 'proprietaire': nom_proprietaire(vehicule, clients)} for vehicule in elements]
+    elif table == 'interventions':
+        vehicules = load_data(VEHICULES_FILE, lecture_seule=True)
+        def info_vehicule(intervention):
+            vehicule = vehicules.obtenir(intervention.get('vehicule_id'))
+            return f"{vehicule['marque']} {vehicule['modele']} ({vehicule.get('immatriculation', '')})" if vehicule else None
+        elements = [{**intervention, 'vehicule_info': info_vehicule(intervention)} for intervention in elements]
+    
+    return render_template('admin/panel_table.html', table=table, elements=elements, pagination=pagination)
+
+# Heures des techniciens au total et par jour/semaine/mois, tenues à jour d'après les interventions
+feuilles_heures = FeuillesHeures(lambda chemin: load_data(chemin, lecture_seule=True), INTERVENTIONS_FILE)
+
+# Période de la répartition des heures demandée par ?periode=jour|semaine|mois
+def periode_heures():
+    periode = request.args.get('periode', 'mois')
+    return periode if periode in PERIODES else 'mois'
 
 @app.route('/interventions/heures')
 @login_required
 def statistiques_heures():
-    interventions = load_data(INTERVENTIONS_FILE)
-    users = load_data(USERS_FILE)
-    vehicules = load_data(VEHICULES_FILE)
+    interventions = load_data(INTERVENTIONS_FILE, lecture_seule=True)
+    users = load_data(USERS_FILE, lecture_seule=True)
     now = datetime.now()
     
     # Calculer les statistiques par utilisateur
     stats_utilisateurs = {}
     for user in users:
         if user['role'] != 'admin':  # Ne pas inclure les admins
-            user_interventions = [i for i in interventions if i.get('technicien') == user['name']]
-            total_heures = sum(float(i.get('heures', 0)) for i in user_interventions)
-            
             stats_utilisateurs[user['name']] = {
-                'total_heures': total_heures,
-                'nombre_interventions': len(user_interventions),
-                'interventions': user_interventions
+                **feuilles_heures.technicien(user['name']),
+                'interventions': interventions.filtrer('technicien', user['name'])
             }
     
     # Trier les utilisateurs par nombre d'heures
     stats_utilisateurs = dict(sorted(stats_utilisateurs.items(), 
                                    key=lambda x: x[1]['total_heures'], 
                                    reverse=True))
+    repartition = feuilles_heures.repartition(periode_heures(), techniciens=list(stats_utilisateurs))
     
     return render_template('interventions/heures.html', 
                          stats_utilisateurs=stats_utilisateurs,
+                         repartition=repartition,
                          now=now)
 
 @app.route('/interventions/mes-heures')
 @login_required
 def mes_heures():
-    interventions = load_data(INTERVENTIONS_FILE)
-    vehicules = load_data(VEHICULES_FILE)
+    interventions = load_data(INTERVENTIONS_FILE, lecture_seule=True)
+    vehicules = load_data(VEHICULES_FILE, lecture_seule=True)
     now = datetime.now()
     
     # Filtrer les interventions pour l'utilisateur connecté
-    mes_interventions = [i for i in interventions if i.get('technicien') == current_user.name]
+    mes_interventions = [dict(i) for i in interventions.filtrer('technicien', current_user.name)]
     
     # Trier les interventions par date (plus anciennes en premier)
     mes_interventions.sort(key=lambda x: x.get('date', ''))
     
-    # Calculer les statistiques
-    total_heures = 0
+    # Ajouter les infos du véhicule
     for intervention in mes_interventions:
-        # S'assurer que heures est un nombre
-        try:
-            heures = float(intervention.get('heures', 0))
-        except (ValueError, TypeError):
-            heures = 0
-            
-        total_heures += heures
-        
-        # Ajouter les infos du véhicule
         if intervention.get('vehicule_id'):
-            vehicule = next((v for v in vehicules if v['id'] == intervention['vehicule_id']), None)
+            vehicule = vehicules.obtenir(intervention['vehicule_id'])
             if vehicule:
                 intervention['vehicule_info'] = f"{vehicule['marque']} {vehicule['modele']} ({vehicule['immatriculation']})"
     
     stats = {
-        'total_heures': total_heures,
-        'nombre_interventions': len(mes_interventions),
+        **feuilles_heures.technicien(current_user.name),
         'interventions': mes_interventions
     }
+    repartition = feuilles_heures.repartition(periode_heures(), techniciens=[current_user.name])
     
     return render_template('interventions/mes_heures.html', 
                          stats=stats,
-                         vehicules=vehicules,
+                         repartition=repartition,
                          now=now)
 
 @app.route('/interventions/heures_supplementaires', methods=['GET', 'POST'])
@@ -1657,41 +2435,39 @@ def admin_heures():
         return redirect(url_for('index'))
     
     # Récupérer toutes les interventions
-    interventions = load_data(INTERVENTIONS_FILE)
+    interventions = load_data(INTERVENTIONS_FILE, lecture_seule=True)
     
     # Récupérer tous les utilisateurs
-    users = load_data(USERS_FILE)
+    users = load_data(USERS_FILE, lecture_seule=True)
     
     # Récupérer tous les véhicules
-    vehicules = load_data(VEHICULES_FILE)
+    vehicules = load_data(VEHICULES_FILE, lecture_seule=True)
+    
+    # Calculer les statistiques par utilisateur
+    stats_utilisateurs = {
+        user['name']: feuilles_heures.technicien(user['name'])
+        for user in users if user['role'] != 'admin'  # Ne pas inclure les admins
+    }
+    repartition = feuilles_heures.repartition(periode_heures(), techniciens=list(stats_utilisateurs))
     
     # Associer les informations des véhicules aux interventions
+    interventions_affichees = []
     for intervention in interventions:
+        intervention = dict(intervention)
         if 'vehicule_id' in intervention:
-            vehicule = next((v for v in vehicules if v['id'] == intervention['vehicule_id']), None)
+            vehicule = vehicules.obtenir(intervention['vehicule_id'])
             if vehicule:
                 intervention['vehicule_info'] = f"{vehicule.get('marque', '')} {vehicule.get('modele', '')} - {vehicule.get('immatriculation', '')}"
             else:
                 intervention['vehicule_info'] = "Véhicule non trouvé"
         else:
             intervention['vehicule_info'] = "Non spécifié"
-    
-    # Calculer les statistiques par utilisateur
-    stats_utilisateurs = {}
-    for user in users:
-        if user['role'] != 'admin':  # Ne pas inclure les admins
-            user_interventions = [i for i in interventions if i.get('technicien') == user['name']]
-            total_heures = sum(float(i.get('heures', 0)) for i in user_interventions)
-            
-            stats_utilisateurs[user['name']] = {
-                'nombre_interventions': len(user_interventions),
-                'total_heures': total_heures,
-                'moyenne_heures': total_heures / len(user_interventions) if user_interventions else 0
-            }
+        interventions_affichees.append(intervention)
     
     return render_template('admin/heures.html', 
                          stats_utilisateurs=stats_utilisateurs,
-                         interventions=interventions,
+                         repartition=repartition,
+                         interventions=interventions_affichees,
                          users=users)
 
 @app.route('/admin/heures/ajuster', methods=['POST'])
@@ -1708,19 +2484,14 @@ def ajuster_heures():
         if not intervention_id:
             return jsonify({'success': False, 'message': 'ID d\'intervention manquant'})
         
-        interventions = load_data(INTERVENTIONS_FILE)
-        intervention_trouvee = False
-        
-        for intervention in interventions:
-            if intervention['id'] == intervention_id:
-                intervention['heures'] = heures
-                intervention_trouvee = True
-                break
-        
-        if not intervention_trouvee:
-            return jsonify({'success': False, 'message': 'Intervention non trouvée'})
-        
-        save_data(INTERVENTIONS_FILE, interventions)
+        # Les interventions restent verrouillées jusqu'à l'écriture
+        with transaction(INTERVENTIONS_FILE) as tx:
+            interventions = tx.charger(INTERVENTIONS_FILE)
+            intervention = interventions.obtenir(intervention_id)
+            if not intervention:
+                return jsonify({'success': False, 'message': 'Intervention non trouvée'})
+            intervention['heures'] = heures
+            tx.enregistrer(INTERVENTIONS_FILE, interventions)
         return jsonify({'success': True, 'message': 'Heures mises à jour avec succès'})
     except Exception as e:
         return jsonify({'success': False, 'message': f'Erreur lors de la mise à jour : {str(e)}'})
@@ -1783,22 +2554,21 @@ def modifier_fournisseur(id):
 @app.route('/fournisseurs/details/<id>')
 @login_required
 def details_fournisseur(id):
-    fournisseurs = load_data(FOURNISSEURS_FILE)
-    pieces = load_data(STOCK_FILE)
-    fournisseur = next((f for f in fournisseurs if f['id'] == id), None)
+    fournisseur = load_data(FOURNISSEURS_FILE, lecture_seule=True).obtenir(id)
     
     if not fournisseur:
         flash('Fournisseur non trouvé', 'danger')
         return redirect(url_for('liste_fournisseurs'))
     
-    # Filtrer les pièces associées à ce fournisseur
-    pieces_fournisseur = [p for p in pieces if p.get('fournisseur_id') == id]
+    # Pièces associées à ce fournisseur (index par fournisseur)
+    pieces_fournisseur = load_data(STOCK_FILE, lecture_seule=True).filtrer('fournisseur_id', id)
     
-    # Calculer les statistiques
+    # Statistiques tenues à jour par le registre du stock
+    totaux = registre_stock.totaux(id)
     stats = {
-        'nombre_pieces': len(pieces_fournisseur),
-        'valeur_stock': sum(p['quantite'] * p['prix_achat'] for p in pieces_fournisseur),
-        'pieces_stock_faible': len([p for p in pieces_fournisseur if p['quantite'] < p['quantite_min']])
+        'nombre_pieces': totaux['nombre_pieces'],
+        'valeur_stock': totaux['valeur_stock'],
+        'pieces_stock_faible': totaux['stock_faible']
     }
     
     return render_template('fournisseurs/details.html', 
@@ -1838,11 +2608,11 @@ def supprimer_fournisseur(id):
 @login_required
 def planning():
     plannings = load_data(PLANNINGS_FILE)
-    vehicules = load_data(VEHICULES_FILE)
+    vehicules = load_data(VEHICULES_FILE, lecture_seule=True)
     
     # Ajouter les informations du véhicule à chaque planning
     for planning in plannings:
-        vehicule = next((v for v in vehicules if v['id'] == planning['vehicule_id']), None)
+        vehicule = vehicules.obtenir(planning['vehicule_id'])
         if vehicule:
             planning['vehicule_marque'] = vehicule.get('marque', 'N/A')
             planning['vehicule_modele'] = vehicule.get('modele', 'N/A')
@@ -1959,8 +2729,8 @@ def supprimer_planning(id):
 @app.route('/api/vehicules/<vehicule_id>/interventions')
 @login_required
 def api_interventions_vehicule(vehicule_id):
-    interventions = load_data(INTERVENTIONS_FILE)
-    vehicule_interventions = [i for i in interventions if i.get('vehicule_id') == vehicule_id]
+    interventions = load_data(INTERVENTIONS_FILE, lecture_seule=True)
+    vehicule_interventions = interventions.filtrer('vehicule_id', vehicule_id)
     return jsonify(vehicule_interventions)
 
 @app.route('/admin/delete/fournisseur/<id>', methods=['DELETE'])
@@ -2003,53 +2773,53 @@ def ajouter_piece_intervention(intervention_id):
         if not piece_id or not quantite:
             return jsonify({'success': False, 'message': 'Données manquantes'})
         
-        # Charger les données
-        interventions = load_data(INTERVENTIONS_FILE)
-        stock = load_data(STOCK_FILE)
-        sorties = load_data(SORTIES_FILE)
-        
-        # Trouver l'intervention
-        intervention = next((i for i in interventions if i['id'] == intervention_id), None)
-        if not intervention:
-            return jsonify({'success': False, 'message': 'Intervention non trouvée'})
-        
-        # Trouver la pièce
-        piece = next((p for p in stock if p['id'] == piece_id), None)
-        if not piece:
-            return jsonify({'success': False, 'message': 'Pièce non trouvée'})
-        
-        # Vérifier le stock
-        if piece['quantite'] < quantite:
-            return jsonify({'success': False, 'message': 'Stock insuffisant'})
-        
-        # Ajouter la pièce à l'intervention
-        intervention['pieces_utilisees'].append({
-            'piece_id': piece_id,
-            'nom': piece['nom'],
-            'prix_unitaire': piece['prix_vente'],
-            'quantite': quantite,
-            'total': float(piece['prix_vente']) * quantite
-        })
-        
-        # Mettre à jour le stock
-        piece['quantite'] -= quantite
-        
-        # Créer une sortie de pièce
-        nouvelle_sortie = {
-            'id': str(uuid.uuid4()),
-            'piece_id': piece_id,
-            'vehicule_id': intervention['vehicule_id'],
-            'quantite': quantite,
-            'date_sortie': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-            'utilisateur': current_user.name,
-            'intervention_id': intervention_id
-        }
-        sorties.append(nouvelle_sortie)
-        
-        # Sauvegarder les modifications
-        save_data(INTERVENTIONS_FILE, interventions)
-        save_data(STOCK_FILE, stock)
-        save_data(SORTIES_FILE, sorties)
+        # Charger les données (verrouillées jusqu'à l'écriture)
+        with transaction(INTERVENTIONS_FILE, STOCK_FILE, SORTIES_FILE) as tx:
+            interventions = tx.charger(INTERVENTIONS_FILE)
+            stock = tx.charger(STOCK_FILE)
+            
+            # Trouver l'intervention
+            intervention = interventions.obtenir(intervention_id)
+            if not intervention:
+                return jsonify({'success': False, 'message': 'Intervention non trouvée'})
+            
+            # Trouver la pièce
+            piece = stock.obtenir(piece_id)
+            if not piece:
+                return jsonify({'success': False, 'message': 'Pièce non trouvée'})
+            
+            # Vérifier le stock
+            if piece['quantite'] < quantite:
+                return jsonify({'success': False, 'message': 'Stock insuffisant'})
+            
+            # Ajouter la pièce à l'intervention
+            intervention.setdefault('pieces_utilisees', []).append({
+                'piece_id': piece_id,
+                'nom': piece['nom'],
+                'prix_unitaire': piece['prix_vente'],
+                'quantite': quantite,
+                'total': float(piece['prix_vente']) * quantite
+            })
+            
+            # Mettre à jour le stock (la sortie est valorisée au coût moyen)
+            cout = registre.sortie(piece, quantite)
+            
+            # Créer une sortie de pièce
+            nouvelle_sortie = {
+                'id': str(uuid.uuid4()),
+                'piece_id': piece_id,
+                'vehicule_id': intervention.get('vehicule_id'),
+                'quantite': quantite,
+                'cout_unitaire': cout,
+                'date_sortie': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                'utilisateur': current_user.name,
+                'intervention_id': intervention_id
+            }
+            
+            # Sauvegarder les modifications
+            tx.enregistrer(INTERVENTIONS_FILE, interventions)
+            tx.enregistrer(STOCK_FILE, stock)
+            tx.ajouter(SORTIES_FILE, nouvelle_sortie)
         
         return jsonify({'success': True, 'message': 'Pièce ajoutée avec succès'})
     except Exception as e:
@@ -2059,37 +2829,38 @@ def ajouter_piece_intervention(intervention_id):
 @login_required
 def supprimer_piece_intervention(intervention_id, piece_id):
     try:
-        # Charger les données
-        interventions = load_data(INTERVENTIONS_FILE)
-        stock = load_data(STOCK_FILE)
-        sorties = load_data(SORTIES_FILE)
-        
-        # Trouver l'intervention
-        intervention = next((i for i in interventions if i['id'] == intervention_id), None)
-        if not intervention:
-            return jsonify({'success': False, 'message': 'Intervention non trouvée'})
-        
-        # Trouver la pièce dans l'intervention
-        piece_utilisee = next((p for p in intervention['pieces_utilisees'] if p['piece_id'] == piece_id), None)
-        if not piece_utilisee:
-            return jsonify({'success': False, 'message': 'Pièce non trouvée dans l\'intervention'})
-        
-        # Trouver la pièce dans le stock
-        piece = next((p for p in stock if p['id'] == piece_id), None)
-        if piece:
-            # Restaurer le stock
-            piece['quantite'] += piece_utilisee['quantite']
-            save_data(STOCK_FILE, stock)
-        
-        # Supprimer la pièce de l'intervention
-        intervention['pieces_utilisees'] = [p for p in intervention['pieces_utilisees'] if p['piece_id'] != piece_id]
-        
-        # Supprimer la sortie correspondante
-        sorties = [s for s in sorties if not (s['intervention_id'] == intervention_id and s['piece_id'] == piece_id)]
-        
-        # Sauvegarder les modifications
-        save_data(INTERVENTIONS_FILE, interventions)
-        save_data(SORTIES_FILE, sorties)
+        # Charger les données (verrouillées jusqu'à l'écriture)
+        with transaction(INTERVENTIONS_FILE, STOCK_FILE, SORTIES_FILE) as tx:
+            interventions = tx.charger(INTERVENTIONS_FILE)
+            stock = tx.charger(STOCK_FILE)
+            sorties = tx.charger(SORTIES_FILE)
+            
+            # Trouver l'intervention
+            intervention = interventions.obtenir(intervention_id)
+            if not intervention:
+                return jsonify({'success': False, 'message': 'Intervention non trouvée'})
+            
+            # Trouver la pièce dans l'intervention
+            piece_utilisee = next((p for p in intervention.get('pieces_utilisees', []) if p['piece_id'] == piece_id), None)
+            if not piece_utilisee:
+                return jsonify({'success': False, 'message': 'Pièce non trouvée dans l\'intervention'})
+            
+            # Trouver la pièce dans le stock
+            piece = stock.obtenir(piece_id)
+            if piece:
+                # Restaurer le stock
+                registre.entree(piece, piece_utilisee['quantite'])
+                tx.enregistrer(STOCK_FILE, stock)
+            
+            # Supprimer la pièce de l'intervention
+            intervention['pieces_utilisees'] = [p for p in intervention['pieces_utilisees'] if p['piece_id'] != piece_id]
+            
+            # Supprimer la sortie correspondante
+            sorties = [s for s in sorties if not (s.get('intervention_id') == intervention_id and s['piece_id'] == piece_id)]
+            
+            # Sauvegarder les modifications
+            tx.enregistrer(INTERVENTIONS_FILE, interventions)
+            tx.enregistrer(SORTIES_FILE, sorties)
         
         return jsonify({'success': True, 'message': 'Pièce supprimée avec succès'})
     except Exception as e:
@@ -2099,7 +2870,7 @@ def supprimer_piece_intervention(intervention_id, piece_id):
 @login_required
 def get_conversation_participants(conversation_id):
     # Récupérer la conversation
-    conversation = next((c for c in load_data(CONVERSATIONS_FILE) if c['id'] == conversation_id), None)
+    conversation = load_data(CONVERSATIONS_FILE, lecture_seule=True).obtenir(conversation_id)
     if not conversation:
         return jsonify({'error': 'Conversation non trouvée'}), 404
         
@@ -2108,9 +2879,10 @@ def get_conversation_participants(conversation_id):
         return jsonify({'error': 'Accès non autorisé'}), 403
         
     # Récupérer les informations des participants
+    users = load_data(USERS_FILE, lecture_seule=True)
     participants = []
     for user_id in conversation['participants']:
-        user = next((u for u in load_data(USERS_FILE) if u['id'] == user_id), None)
+        user = users.obtenir(user_id)
         if user:
             participants.append({
                 'id': str(user['id']),
@@ -2204,156 +2976,252 @@ def nl2br(value):
 
 @app.route('/api/pieces')
 def get_pieces():
-    pieces = load_data(STOCK_FILE)
-    return jsonify(pieces)
+    pieces = load_data(STOCK_FILE, lecture_seule=True)
+    return reponse_flux(pieces)
+
+# Porte les pièces aux quantités comptées (lignes de inventaire.ecarts), dans une transaction ouverte
+# sur le stock et son historique : une ligne d'historique par pièce dont la quantité change.
+# Retourne les lignes d'historique ajoutées.
+def ajuster_inventaire(tx, lignes, inventaire_id=None):
+    date_inventaire = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    entrees = []
+    for ligne in lignes:
+        if not ligne['ecart']:
+            continue
+        # Un surplus d'inventaire entre au coût moyen
+        registre.ajuster(ligne['piece'], ligne['quantite_comptee'])
+        entree = {
+            'id': str(uuid.uuid4()),
+            'piece_id': ligne['piece']['id'],
+            'type': 'inventaire',
+            'ancienne_quantite': ligne['quantite_systeme'],
+            'nouvelle_quantite': ligne['quantite_comptee'],
+            'date': date_inventaire,
+            'commentaire': f"Ajustement lors de l'inventaire (Écart: {ligne['ecart']})"
+        }
+        if inventaire_id:
+            entree['inventaire_id'] = inventaire_id
+        entrees.append(entree)
+    if entrees:
+        tx.ajouter(HISTORIQUE_STOCK_FILE, *entrees)
+    return entrees
 
 @app.route('/stock/inventaire', methods=['POST'])
 def update_inventaire():
     try:
         data = request.get_json()
-        pieces = load_data(STOCK_FILE)
+        quantites = {str(update['pieceId']): int(update['quantite']) for update in data['updates']}
         
-        # Mettre à jour les quantités
-        for update in data['updates']:
-            piece_id = update['pieceId']
-            nouvelle_quantite = int(update['quantite'])
-            
-            # Trouver et mettre à jour la pièce
-            for piece in pieces:
-                if str(piece['id']) == str(piece_id):
-                    ancienne_quantite = int(piece['quantite'])
-                    piece['quantite'] = nouvelle_quantite
-                    
-                    # Ajouter une entrée dans l'historique
-                    historique = load_data(HISTORIQUE_STOCK_FILE)
-                    nouvelle_entree = {
-                        'id': str(uuid.uuid4()),
-                        'piece_id': piece_id,
-                        'type': 'inventaire',
-                        'ancienne_quantite': ancienne_quantite,
-                        'nouvelle_quantite': nouvelle_quantite,
-                        'date': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                        'commentaire': f"Ajustement lors de l'inventaire (Écart: {nouvelle_quantite - ancienne_quantite})"
-                    }
-                    historique.append(nouvelle_entree)
-                    save_data(HISTORIQUE_STOCK_FILE, historique)
-                    break
-        
-        # Sauvegarder les modifications
-        save_data(STOCK_FILE, pieces)
+        # Le stock et son historique sont écrits ensemble à la fin
+        with transaction(STOCK_FILE, HISTORIQUE_STOCK_FILE) as tx:
+            pieces = tx.charger(STOCK_FILE)
+            ajuster_inventaire(tx, inventaire.ecarts(pieces, quantites))
+            tx.enregistrer(STOCK_FILE, pieces)
         
         return jsonify({'success': True})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
-@app.route('/vehicules/alertes')
-@login_required
-def alertes_controles():
-    vehicules = load_data(VEHICULES_FILE)
-    delais = load_data(DELAIS_CONTROLES_FILE)
-    today = date.today()
-    alertes = []
-    
-    for vehicule in vehicules:
-        # Contrôle technique
-        if 'date_dernier_ct' in vehicule:
-            dernier_ct = datetime.strptime(vehicule['date_dernier_ct'], '%Y-%m-%d').date()
-            prochain_ct = dernier_ct + timedelta(days=delais['ct']['periode'])
-            jours_restants = (prochain_ct - today).days
-            
-            if jours_restants <= delais['ct']['urgent']:
-                urgence = 'urgent'
-            elif jours_restants <= delais['ct']['attention']:
-                urgence = 'attention'
-            else:
-                urgence = 'ok'
-                
-            alertes.append({
-                'id': f"ct_{vehicule['id']}",
-                'vehicule': vehicule,
-                'type': 'ct',
-                'dernier_controle': vehicule['date_dernier_ct'],
-                'prochain_controle': prochain_ct.strftime('%Y-%m-%d'),
-                'jours_restants': jours_restants,
-                'urgence': urgence
-            })
-        
-        # Mines
-        if 'date_dernier_mine' in vehicule:
-            dernier_mine = datetime.strptime(vehicule['date_dernier_mine'], '%Y-%m-%d').date()
-            prochain_mine = dernier_mine + timedelta(days=delais['mine']['periode'])
-            jours_restants = (prochain_mine - today).days
+# Inventaires par session (voir inventaire.py) :
+#     POST /stock/inventaires                      ouvre un inventaire
+#     POST /stock/inventaires/<id>/comptages       enregistre des quantités comptées (JSON, NDJSON ou feuille CSV)
+#     GET  /stock/inventaires/<id>                 écarts entre le stock et les quantités comptées
+#     POST /stock/inventaires/<id>/valider         ajuste le stock et écrit l'historique en une seule transaction
+#     POST /stock/inventaires/<id>/annuler
+@app.route('/stock/inventaires', methods=['POST'])
+@login_required
+def ouvrir_inventaire():
+    data = request.get_json(silent=True) or {}
+    nouvel_inventaire = {
+        'id': str(uuid.uuid4()),
+        'statut': 'ouvert',
+        'ouvert_par': current_user.name,
+        'date_ouverture': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'non_comptees_a_zero': bool(data.get('non_comptees_a_zero')),
+        'commentaire': data.get('commentaire', '')
+    }
+    with transaction(INVENTAIRES_FILE) as tx:
+        tx.ajouter(INVENTAIRES_FILE, nouvel_inventaire)
+    return jsonify({'success': True, 'inventaire': nouvel_inventaire})
+
+# Quantités comptées envoyées avec la requête : [{'piece': id ou référence, 'quantite', 'mode', 'ligne'}], [erreurs]
+def comptages_requete():
+    if 'feuille' in request.files:
+        return inventaire.lire_feuille(request.files['feuille'].read().decode('utf-8-sig', errors='replace'))
+    if request.mimetype == 'text/csv':
+        return inventaire.lire_feuille(request.get_data(as_text=True))
+    if request.mimetype == 'application/x-ndjson':
+        elements = [json.loads(ligne) for ligne in request.get_data(as_text=True).splitlines() if ligne.strip()]
+    else:
+        data = request.get_json(silent=True)
+        if data is None:
+            raise ValueError('JSON, NDJSON ou feuille CSV attendu')
+        elements = data.get('comptages', [data]) if isinstance(data, dict) else data
+    lignes, erreurs = [], []
+    for numero, element in enumerate(elements, start=1):
+        piece = element.get('pieceId') or element.get('piece_id') or element.get('reference')
+        mode = element.get('mode', 'remplacer')
+        try:
+            quantite = int(element.get('quantite'))
+        except (TypeError, ValueError):
+            erreurs.append(f"Comptage {numero} : quantité invalide")
+            continue
+        if not piece or mode not in inventaire.MODES_COMPTAGE or (mode == 'remplacer' and quantite < 0):
+            erreurs.append(f"Comptage {numero} : pièce manquante, mode inconnu ou quantité négative")
+            continue
+        lignes.append({'piece': str(piece), 'quantite': quantite, 'mode': mode, 'ligne': numero})
+    return lignes, erreurs
+
+@app.route('/stock/inventaires/<id>/comptages', methods=['POST'])
+@login_required
+def compter_inventaire(id):
+    try:
+        lignes, erreurs = comptages_requete()
+    except (ValueError, AttributeError) as e:
+        return jsonify({'success': False, 'message': f'Comptages illisibles : {e}'}), 400
+    
+    # La pièce est désignée par son id ou sa référence
+    stock = load_data(STOCK_FILE, lecture_seule=True)
+    date_comptage = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    comptages = []
+    for ligne in lignes:
+        piece = stock.obtenir(ligne['piece']) or next(iter(stock.filtrer('reference', ligne['piece'])), None)
+        if not piece:
+            erreurs.append(f"Ligne {ligne['ligne']} : pièce inconnue ({ligne['piece']})")
+            continue
+        comptages.append({
+            'id': str(uuid.uuid4()),
+            'inventaire_id': id,
+            'piece_id': piece['id'],
+            'quantite': ligne['quantite'],
+            'mode': ligne.get('mode', 'remplacer'),
+            'date': date_comptage,
+            'utilisateur': current_user.name
+        })
+    
+    # L'inventaire reste verrouillé pendant l'ajout : il ne peut pas être validé entre-temps
+    with transaction(INVENTAIRES_FILE, COMPTAGES_INVENTAIRE_FILE) as tx:
+        inventaire_courant = tx.charger(INVENTAIRES_FILE).obtenir(id)
+        if not inventaire_courant:
+            return jsonify({'success': False, 'message': 'Inventaire non trouvé'}), 404
+        if inventaire_courant['statut'] != 'ouvert':
+            return jsonify({'success': False, 'message': "L'inventaire n'est plus ouvert"}), 409
+        if comptages:
+            tx.ajouter(COMPTAGES_INVENTAIRE_FILE, *comptages)
+    
+    return jsonify({'success': True, 'enregistres': len(comptages), 'erreurs': erreurs})
+
+# Écarts d'un inventaire ouvert ; ?tous=1 garde aussi les pièces comptées sans écart
+@app.route('/stock/inventaires/<id>')
+@login_required
+def ecarts_inventaire(id):
+    inventaire_courant = load_data(INVENTAIRES_FILE, lecture_seule=True).obtenir(id)
+    if not inventaire_courant:
+        return jsonify({'success': False, 'message': 'Inventaire non trouvé'}), 404
+    comptages = load_data(COMPTAGES_INVENTAIRE_FILE, lecture_seule=True).filtrer('inventaire_id', id)
+    quantites = inventaire.quantites_comptees(comptages)
+    lignes = inventaire.ecarts(load_data(STOCK_FILE, lecture_seule=True), quantites,
+                               inventaire_courant.get('non_comptees_a_zero'))
+    tous = request.args.get('tous') == '1'
+    ecarts = [{
+        'piece_id': ligne['piece']['id'],
+        'reference': ligne['piece'].get('reference'),
+        'nom': ligne['piece'].get('nom'),
+        'quantite_systeme': ligne['quantite_systeme'],
+        'quantite_comptee': ligne['quantite_comptee'],
+        'ecart': ligne['ecart'],
+        'valeur_ecart': round(ligne['ecart'] * cout_unitaire(ligne['piece']), 2)
+    } for ligne in lignes if tous or ligne['ecart']]
+    return jsonify({
+        'success': True,
+        'inventaire': inventaire_courant,
+        'nombre_comptages': len(comptages),
+        'pieces_comptees': len(quantites),
+        'ecarts': ecarts,
+        'valeur_ecarts': round(sum(ecart['valeur_ecart'] for ecart in ecarts if ecart['ecart']), 2)
+    })
+
+@app.route('/stock/inventaires/<id>/valider', methods=['POST'])
+@login_required
+def valider_inventaire(id):
+    try:
+        # Stock, historique et inventaire sont écrits ensemble, ou pas du tout
+        with transaction(STOCK_FILE, HISTORIQUE_STOCK_FILE, INVENTAIRES_FILE) as tx:
+            inventaires = tx.charger(INVENTAIRES_FILE)
+            inventaire_courant = inventaires.obtenir(id)
+            if not inventaire_courant:
+                return jsonify({'success': False, 'message': 'Inventaire non trouvé'}), 404
+            if inventaire_courant['statut'] != 'ouvert':
+                return jsonify({'success': False, 'message': "L'inventaire n'est plus ouvert"}), 409
             
-            if jours_restants <= delais['mine']['urgent']:
-                urgence = 'urgent'
-            elif jours_restants <= delais['mine']['attention']:
-                urgence = 'attention'
-            else:
-                urgence = 'ok'
-                
-            alertes.append({
-                'id': f"mine_{vehicule['id']}",
-                'vehicule': vehicule,
-                'type': 'mine',
-                'dernier_controle': vehicule['date_dernier_mine'],
-                'prochain_controle': prochain_mine.strftime('%Y-%m-%d'),
-                'jours_restants': jours_restants,
-                'urgence': urgence
-            })
-        
-        # Tachygraphe
-        if 'date_dernier_tachy' in vehicule:
-            dernier_tachy = datetime.strptime(vehicule['date_dernier_tachy'], '%Y-%m-%d').date()
-            prochain_tachy = dernier_tachy + timedelta(days=delais['tachy']['periode'])
-            jours_restants = (prochain_tachy - today).days
+            # Les comptages sont ajoutés sous le verrou de l'inventaire, tenu ici : la liste est complète
+            comptages = load_data(COMPTAGES_INVENTAIRE_FILE, lecture_seule=True).filtrer('inventaire_id', id)
+            quantites = inventaire.quantites_comptees(comptages)
+            pieces = tx.charger(STOCK_FILE)
+            lignes = inventaire.ecarts(pieces, quantites, inventaire_courant.get('non_comptees_a_zero'))
+            valeur_ecarts = sum(ligne['ecart'] * cout_unitaire(ligne['piece']) for ligne in lignes)
+            ajustements = ajuster_inventaire(tx, lignes, id)
             
-            if jours_restants <= delais['tachy']['urgent']:
-                urgence = 'urgent'
-            elif jours_restants <= delais['tachy']['attention']:
-                urgence = 'attention'
-            else:
-                urgence = 'ok'
-                
-            alertes.append({
-                'id': f"tachy_{vehicule['id']}",
-                'vehicule': vehicule,
-                'type': 'tachy',
-                'dernier_controle': vehicule['date_dernier_tachy'],
-                'prochain_controle': prochain_tachy.strftime('%Y-%m-%d'),
-                'jours_restants': jours_restants,
-                'urgence': urgence
+            inventaire_courant.update({
+                'statut': 'valide',
+                'valide_par': current_user.name,
+                'date_validation': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                'pieces_comptees': len(quantites),
+                'pieces_ajustees': len(ajustements),
+                'valeur_ecarts': round(valeur_ecarts, 2)
             })
+            tx.enregistrer(STOCK_FILE, pieces)
+            tx.enregistrer(INVENTAIRES_FILE, inventaires)
         
-        # VGP
-        if 'date_dernier_vgp' in vehicule:
-            dernier_vgp = datetime.strptime(vehicule['date_dernier_vgp'], '%Y-%m-%d').date()
-            prochain_vgp = dernier_vgp + timedelta(days=delais['vgp']['periode'])
-            jours_restants = (prochain_vgp - today).days
-            
-            if jours_restants <= delais['vgp']['urgent']:
-                urgence = 'urgent'
-            elif jours_restants <= delais['vgp']['attention']:
-                urgence = 'attention'
-            else:
-                urgence = 'ok'
-                
-            alertes.append({
-                'id': f"vgp_{vehicule['id']}",
-                'vehicule': vehicule,
-                'type': 'vgp',
-                'dernier_controle': vehicule['date_dernier_vgp'],
-                'prochain_controle': prochain_vgp.strftime('%Y-%m-%d'),
-                'jours_restants': jours_restants,
-                'urgence': urgence
-            })
-    
-    # Trier par urgence puis par date
-    alertes.sort(key=lambda x: (
-        0 if x['urgence'] == 'urgent' else 1 if x['urgence'] == 'attention' else 2,
-        x['prochain_controle']
-    ))
-    
-    return render_template('vehicules/alertes.html', alertes=alertes, delais=delais)
+        return jsonify({'success': True, 'inventaire': inventaire_courant})
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/stock/inventaires/<id>/annuler', methods=['POST'])
+@login_required
+def annuler_inventaire(id):
+    with transaction(INVENTAIRES_FILE) as tx:
+        inventaires = tx.charger(INVENTAIRES_FILE)
+        inventaire_courant = inventaires.obtenir(id)
+        if not inventaire_courant:
+            return jsonify({'success': False, 'message': 'Inventaire non trouvé'}), 404
+        if inventaire_courant['statut'] != 'ouvert':
+            return jsonify({'success': False, 'message': "L'inventaire n'est plus ouvert"}), 409
+        inventaire_courant['statut'] = 'annule'
+        tx.enregistrer(INVENTAIRES_FILE, inventaires)
+    return jsonify({'success': True})
+
+# Échéances des contrôles périodiques, triées par date (voir alertes.py)
+echeances_controles = EcheancesControles(lambda chemin: load_data(chemin, lecture_seule=True),
+                                         VEHICULES_FILE, DELAIS_CONTROLES_FILE)
+
+# Alertes de contrôle triées par urgence puis par date ; ?jours=N ne garde que
+# les contrôles à faire d'ici N jours
+def alertes_a_venir(jours=None):
+    par_urgence = {niveau: [] for niveau in URGENCES}
+    # Les échéances sont déjà triées par date : une répartition suffit
+    for alerte in echeances_controles.echeances(jours):
+        par_urgence[alerte['urgence']].append(alerte)
+    return [alerte for niveau in URGENCES for alerte in par_urgence[niveau]]
+
+@app.route('/vehicules/alertes')
+@login_required
+def alertes_controles():
+    jours = request.args.get('jours', type=int)
+    alertes = alertes_a_venir(jours)
+    return render_template('vehicules/alertes.html', alertes=alertes, jours=jours,
+                           types=echeances_controles.types)
+
+# Contrôles à faire d'ici ?jours=N (tous sans paramètre)
+@app.route('/api/alertes')
+@login_required
+def api_alertes():
+    jours = request.args.get('jours', type=int)
+    return jsonify([
+        {**alerte, 'vehicule': {champ: alerte['vehicule'].get(champ)
+                                for champ in ('id', 'marque', 'modele', 'immatriculation', 'code_parc')}}
+        for alerte in alertes_a_venir(jours)
+    ])
 
 @app.route('/vehicules/controle/effectue', methods=['POST'])
 @login_required
@@ -2364,23 +3232,19 @@ def marquer_controle_effectue():
         vehicule_id = data['vehicule_id']
         date = data['date']
         
-        type_controle = alerte_id.split('_')[0]  # ct, mine ou tachy
-        vehicules = load_data(VEHICULES_FILE)
-        
-        # Trouver et mettre à jour le véhicule
-        for vehicule in vehicules:
-            if vehicule['id'] == vehicule_id:
-                if type_controle == 'ct':
-                    vehicule['date_dernier_ct'] = date
-                elif type_controle == 'mine':
-                    vehicule['date_dernier_mine'] = date
-                elif type_controle == 'tachy':
-                    vehicule['date_dernier_tachy'] = date
-                elif type_controle == 'vgp':
-                    vehicule['date_dernier_vgp'] = date
-                break
-        
-        save_data(VEHICULES_FILE, vehicules)
+        type_controle = alerte_id.split('_')[0]  # ct, mine, tachy, vgp...
+        echeances_controles.rafraichir()
+        if type_controle not in echeances_controles.types:
+            return jsonify({'success': False, 'error': 'Type de contrôle inconnu'}), 400
+        champ = echeances_controles.types[type_controle]['champ']
+        
+        with transaction(VEHICULES_FILE) as tx:
+            vehicules = tx.charger(VEHICULES_FILE)
+            vehicule = vehicules.obtenir(vehicule_id)
+            if vehicule is None:
+                return jsonify({'success': False, 'error': 'Véhicule non trouvé'}), 404
+            vehicule[champ] = date
+            tx.enregistrer(VEHICULES_FILE, vehicules)
         return jsonify({'success': True})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -2389,43 +3253,162 @@ def marquer_controle_effectue():
 @login_required
 @admin_required
 def gerer_delais_controles():
+    echeances_controles.rafraichir()
+    types = echeances_controles.types
     if request.method == 'POST':
         delais = {
-            'ct': {
-                'attention': int(request.form['ct_attention']),
-                'urgent': int(request.form['ct_urgent']),
-                'periode': int(request.form['ct_periode'])
-            },
-            'mine': {
-                'attention': int(request.form['mine_attention']),
-                'urgent': int(request.form['mine_urgent']),
-                'periode': int(request.form['mine_periode'])
-            },
-            'tachy': {
-                'attention': int(request.form['tachy_attention']),
-                'urgent': int(request.form['tachy_urgent']),
-                'periode': int(request.form['tachy_periode'])
-            },
-            'vgp': {
-                'attention': int(request.form['vgp_attention']),
-                'urgent': int(request.form['vgp_urgent']),
-                'periode': int(request.form['vgp_periode'])
+            code: {
+                'libelle': type_controle['libelle'],
+                'champ': type_controle['champ'],
+                'attention': int(request.form[f'{code}_attention']),
+                'urgent': int(request.form[f'{code}_urgent']),
+                'periode': int(request.form[f'{code}_periode'])
             }
+            for code, type_controle in types.items()
         }
         save_data(DELAIS_CONTROLES_FILE, delais)
         flash('Les délais ont été mis à jour avec succès.', 'success')
         return redirect(url_for('alertes_controles'))
     
-    delais = load_data(DELAIS_CONTROLES_FILE)
-    return render_template('vehicules/delais_controles.html', delais=delais)
+    return render_template('vehicules/delais_controles.html', types=types)
 
 @app.route('/api/vehicules_client/<client_id>')
 @login_required
 def api_vehicules_client(client_id):
-    vehicules = load_data(VEHICULES_FILE)
-    vehicules_client = [v for v in vehicules if v.get('client_id') == client_id]
+    vehicules = load_data(VEHICULES_FILE, lecture_seule=True)
+    vehicules_client = vehicules.filtrer('client_id', client_id)
     return jsonify(vehicules_client)
 
+# Tâches planifiées (voir taches.py) ; "taches_planifiees": false dans data/config.json les désactive
+planificateur = Planificateur(TACHES_FILE)
+
+# Alertes de contrôle recalculées pour la date du jour
+def tache_alertes_controles():
+    alertes = echeances_controles.echeances(max(
+        (type_controle['attention'] for type_controle in echeances_controles.types.values()), default=0
+    ))
+    urgentes = sum(1 for alerte in alertes if alerte['urgence'] == 'urgent')
+    a_surveiller = sum(1 for alerte in alertes if alerte['urgence'] == 'attention')
+    return f"{urgentes} contrôle(s) urgent(s), {a_surveiller} à surveiller"
+
+# Journaux d'événements des mouvements de stock réécrits lorsqu'ils sont encombrés (mode JSON)
+def tache_compaction():
+    if stockage.nom != 'json':
+        return "Rien à compacter en mode SQLite"
+    compactes = []
+    for chemin in JOURNAUX_COLLECTIONS:
+        if stockage.journaux[chemin].a_compacter():
+            stockage.compacter(chemin)
+            compactes.append(os.path.basename(chemin))
+    return f"Compactés : {', '.join(compactes)}" if compactes else "Aucun journal à compacter"
+
+# Collections relues et index recalculés hors des requêtes, après une écriture d'un autre processus
+def tache_prechauffage():
+    for chemin in COLLECTIONS:
+        load_data(chemin, lecture_seule=True)
+    index_recherche.rafraichir()
+    statistiques.valeurs()
+    echeances_controles.rafraichir()
+    feuilles_heures.rafraichir()
+    bilans_vehicules.rafraichir()
+    registre_stock.rafraichir()
+    return f"{len(COLLECTIONS)} collections"
+
+# Taux de consommation des pièces recalculés lorsque le stock, les sorties ou le jour ont changé
+def tache_previsions():
+    if not previsions_stock.disponible:
+        return "NumPy n'est pas installé : prévisions désactivées"
+    nombre = previsions_stock.rafraichir()
+    return f"{nombre} pièces, {len(previsions_stock.a_commander())} à commander"
+
+planificateur.ajouter('alertes_controles', tache_alertes_controles, 3600, delai=30,
+                      description="Recalcul des alertes de contrôle")
+planificateur.ajouter('compaction', tache_compaction, 3600, delai=60,
+                      description="Compaction des historiques de stock")
+planificateur.ajouter('prechauffage', tache_prechauffage, 60, locale=True,
+                      description="Préchauffage des caches (collections, recherche, statistiques, heures, véhicules, stock)")
+planificateur.ajouter('previsions', tache_previsions, 300, delai=20, locale=True,
+                      description="Prévisions de consommation et de rupture des pièces")
+planificateur.ajouter('mesures', mesures_requetes.publier, 15, delai=15, locale=True,
+                      description="Publication des mesures des requêtes de chaque processus")
+
+# Le fil est lancé à la première requête de chaque processus (après le fork des workers)
+@app.before_request
+def demarrer_planificateur():
+    if config.get('taches_planifiees', True):
+        planificateur.demarrer()
+
+@app.route('/admin/taches')
+@login_required
+@admin_required
+def admin_taches():
+    taches = planificateur.etat()
+    for tache in taches:
+        tache['derniere_execution'] = (datetime.fromtimestamp(tache['debut']).strftime('%d/%m/%Y %H:%M:%S')
+                                       if tache['debut'] else None)
+    return render_template('admin/taches.html', taches=taches, processus=os.getpid(),
+                           meneur=planificateur.meneur)
+
+# Exécute une tâche tout de suite dans le processus qui reçoit la requête
+@app.route('/admin/taches/<nom>/executer', methods=['POST'])
+@login_required
+@admin_required
+def admin_executer_tache(nom):
+    try:
+        mesures = planificateur.executer(nom)
+    except KeyError:
+        flash('Tâche inconnue.', 'danger')
+        return redirect(url_for('admin_taches'))
+    if mesures['erreur']:
+        flash(f"Échec de la tâche : {mesures['erreur']}", 'danger')
+    else:
+        flash(f"Tâche exécutée en {mesures['duree'] * 1000:.0f} ms : {mesures['resultat']}", 'success')
+    return redirect(url_for('admin_taches'))
+
+# Durées par route (p50/p95/p99) et dernières requêtes lentes, tous processus confondus
+@app.route('/admin/performances')
+@login_required
+@admin_required
+def admin_performances():
+    return render_template('admin/performances.html', routes=mesures_requetes.resume(),
+                           lentes=mesures_requetes.requetes_lentes(),
+                           seuil=mesures_requetes.seuil_lent * 1000, taille_echantillon=TAILLE_ECHANTILLON)
+
+# Mesures au format Prometheus : réservées aux administrateurs, ou à un collecteur
+# qui présente "Authorization: Bearer <jeton_metriques>" (voir data/config.json)
+@app.route('/metrics')
+def metriques_prometheus():
+    jeton = config.get('jeton_metriques')
+    autorise = bool(jeton) and request.headers.get('Authorization') == f'Bearer {jeton}'
+    if not autorise and not (current_user.is_authenticated and current_user.role == 'admin'):
+        return Response('Accès non autorisé\n', status=403, mimetype='text/plain')
+    return Response(mesures_requetes.prometheus(), mimetype='text/plain; version=0.0.4')
+
+# Commande d'import des fichiers data/*.json dans la base SQLite
+# Usage : flask --app app migrer-sqlite
+@app.cli.command('migrer-sqlite')
+def migrer_sqlite():
+    cible = StockageSQLite(SQLITE_FILE, index=INDEX_COLLECTIONS)
+    # Les mouvements de stock sont relus depuis leur journal d'événements s'il existe
+    source = StockageJSON(JOURNAL_DIR, journaux=JOURNAUX_COLLECTIONS)
+    resultat = migrer_vers_sqlite(COLLECTIONS, cible, source)
+    for chemin, nombre in resultat.items():
+        print(f"{os.path.basename(chemin):25} {nombre:>8} enregistrement(s)")
+    print(f"Base {SQLITE_FILE} prête. Ajoutez \"stockage\": \"sqlite\" dans {CONFIG_FILE} pour l'utiliser.")
+
+@app.cli.command('migrer-journaux')
+def migrer_journaux():
+    if stockage.nom != 'json':
+        print("Le stockage SQLite n'utilise pas de journaux d'événements.")
+        return
+    resultat = stockage.importer_journaux()
+    for chemin, nombre in resultat.items():
+        print(f"{os.path.basename(chemin):25} {nombre:>8} enregistrement(s)")
+    if resultat:
+        print("Anciens fichiers renommés en *.importe : ils peuvent être archivés puis supprimés.")
+    else:
+        print("Aucune collection à importer.")
+
 @app.route('/static/manifest.json')
 def serve_manifest():
     return send_from_directory('static', 'manifest.json', mimetype='application/json')
@@ -0,0 +1,69 @@
+# Mesure du temps de rendu des pages qui joignent plusieurs collections
+#
+# Usage : python benchmarks/bench_jointures.py [--vehicules 10000] [--interventions 100000]
+#
+# Un dossier data/ synthétique est généré dans un répertoire temporaire,
+# puis chaque page est appelée via le client de test Flask. La première
+# requête (chargement des fichiers et construction des index) est mesurée
+# à part des suivantes, servies depuis le cache.
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+RACINE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RACINE)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from donnees_synthetiques import generer  # noqa: E402
+
+PAGES = ['/', '/interventions', '/stock', '/stock/historique', '/admin/heures']
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Temps de rendu des pages avec jointures')
+    parser.add_argument('--vehicules', type=int, default=10000)
+    parser.add_argument('--clients', type=int, default=1000)
+    parser.add_argument('--pieces', type=int, default=2000)
+    parser.add_argument('--interventions', type=int, default=100000)
+    parser.add_argument('--sorties', type=int, default=20000)
+    parser.add_argument('--repetitions', type=int, default=5)
+    args = parser.parse_args()
+
+    repertoire = tempfile.mkdtemp(prefix='sobeca-bench-')
+    try:
+        debut = time.perf_counter()
+        generer(os.path.join(repertoire, 'data'), vehicules=args.vehicules, clients=args.clients,
+                pieces=args.pieces, interventions=args.interventions, sorties=args.sorties)
+        print(f'Données générées en {time.perf_counter() - debut:.1f} s dans {repertoire}')
+
+        # DATA_DIR est relatif au répertoire courant
+        os.chdir(repertoire)
+        from app import app
+
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['_user_id'] = 'admin'
+            session['_fresh'] = True
+
+        print(f"{'page':25} {'1re requête':>12} {'médiane':>10}")
+        for page in PAGES:
+            durees = []
+            for _ in range(args.repetitions + 1):
+                debut = time.perf_counter()
+                reponse = client.get(page)
+                durees.append(time.perf_counter() - debut)
+                if reponse.status_code != 200:
+                    raise SystemExit(f'{page} : statut {reponse.status_code}')
+            suivantes = sorted(durees[1:])
+            mediane = suivantes[len(suivantes) // 2]
+            print(f'{page:25} {durees[0] * 1000:>10.0f} ms {mediane * 1000:>7.0f} ms')
+    finally:
+        os.chdir(RACINE)
+        shutil.rmtree(repertoire, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+# Mesure de la latence et de la mémoire des principales routes
+#
+# Usage : python benchmarks/bench_routes.py [--vehicules 10000] [--messages 50000]
+#             [--stockage json|sqlite] [--sortie resultats.json] [--reference ancien.json]
+#
+# Un dossier data/ synthétique est généré dans un répertoire temporaire (même
+# graine, mêmes données d'une exécution à l'autre), puis chaque route est
+# appelée via le client de test Flask :
+#   - la première requête (lecture des fichiers, construction des index) est
+#     mesurée à part ;
+#   - les `--repetitions` suivantes donnent la médiane et le p95 ;
+#   - une dernière requête, sous tracemalloc, donne le pic de mémoire allouée.
+# Avec --sortie, les résultats sont enregistrés en JSON ; avec --reference,
+# ils sont comparés à ceux d'une exécution précédente.
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+RACINE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RACINE)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from donnees_synthetiques import generer  # noqa: E402
+
+ROUTES = [
+    ('index', '/'),
+    ('liste_stock', '/stock'),
+    ('historique_sorties', '/stock/historique'),
+    ('alertes_controles', '/vehicules/alertes'),
+    ('admin_heures', '/admin/heures'),
+    ('get_unread_count', '/api/unread-count'),
+]
+
+
+def _percentile(durees, p):
+    durees = sorted(durees)
+    return durees[min(int(p / 100 * len(durees)), len(durees) - 1)]
+
+
+def _version_git():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=RACINE,
+                              capture_output=True, text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def mesurer(client, chemin, repetitions):
+    durees = []
+    for _ in range(repetitions + 1):
+        debut = time.perf_counter()
+        reponse = client.get(chemin)
+        durees.append(time.perf_counter() - debut)
+        if reponse.status_code != 200:
+            raise SystemExit(f'{chemin} : statut {reponse.status_code}')
+
+    tracemalloc.start()
+    try:
+        client.get(chemin)
+        _, pic = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    suivantes = durees[1:]
+    return {
+        'premiere_ms': durees[0] * 1000,
+        'mediane_ms': _percentile(suivantes, 50) * 1000,
+        'p95_ms': _percentile(suivantes, 95) * 1000,
+        'memoire_ko': pic / 1024
+    }
+
+
+def comparer(resultats, reference):
+    anciennes = reference.get('routes', {})
+    print()
+    print(f"{'route':22} {'médiane':>10} {'référence':>10} {'écart':>8}   {'mémoire':>10} {'référence':>10}")
+    for nom, mesure in resultats['routes'].items():
+        ancienne = anciennes.get(nom)
+        if ancienne is None:
+            continue
+        ecart = (mesure['mediane_ms'] / ancienne['mediane_ms'] - 1) * 100 if ancienne['mediane_ms'] else 0
+        print(f"{nom:22} {mesure['mediane_ms']:>7.1f} ms {ancienne['mediane_ms']:>7.1f} ms {ecart:>+7.0f}%"
+              f"   {mesure['memoire_ko']:>7.0f} Ko {ancienne['memoire_ko']:>7.0f} Ko")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Latence et mémoire des principales routes')
+    parser.add_argument('--vehicules', type=int, default=10000)
+    parser.add_argument('--clients', type=int, default=1000)
+    parser.add_argument('--pieces', type=int, default=2000)
+    parser.add_argument('--interventions', type=int, default=100000)
+    parser.add_argument('--sorties', type=int, default=20000)
+    parser.add_argument('--techniciens', type=int, default=10)
+    parser.add_argument('--conversations', type=int, default=50)
+    parser.add_argument('--messages', type=int, default=20000)
+    parser.add_argument('--graine', type=int, default=42)
+    parser.add_argument('--repetitions', type=int, default=10)
+    parser.add_argument('--stockage', choices=('json', 'sqlite'), default='json')
+    parser.add_argument('--sortie', help='fichier JSON où enregistrer les résultats')
+    parser.add_argument('--reference', help='résultats JSON d\'une exécution précédente à comparer')
+    args = parser.parse_args()
+    # Chemins relatifs au répertoire de lancement (le script change de répertoire)
+    sortie = os.path.abspath(args.sortie) if args.sortie else None
+    reference = os.path.abspath(args.reference) if args.reference else None
+
+    volumes = {nom: getattr(args, nom) for nom in
+               ('vehicules', 'clients', 'pieces', 'interventions', 'sorties', 'techniciens',
+                'conversations', 'messages')}
+    repertoire = tempfile.mkdtemp(prefix='sobeca-bench-')
+    try:
+        debut = time.perf_counter()
+        donnees = os.path.join(repertoire, 'data')
+        generer(donnees, graine=args.graine, **volumes)
+        if args.stockage == 'sqlite':
+            chemin_config = os.path.join(donnees, 'config.json')
+            with open(chemin_config, encoding='utf-8') as f:
+                config = json.load(f)
+            config['stockage'] = 'sqlite'
+            with open(chemin_config, 'w', encoding='utf-8') as f:
+                json.dump(config, f)
+        print(f'Données générées en {time.perf_counter() - debut:.1f} s dans {repertoire}')
+
+        # DATA_DIR est relatif au répertoire courant
+        os.chdir(repertoire)
+        from app import app
+
+        if args.stockage == 'sqlite':
+            resultat = app.test_cli_runner().invoke(args=['migrer-sqlite'])
+            if resultat.exit_code != 0:
+                raise SystemExit(resultat.output)
+
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['_user_id'] = 'admin'
+            session['_fresh'] = True
+
+        resultats = {
+            'date': datetime.now().isoformat(timespec='seconds'),
+            'version': _version_git(),
+            'python': platform.python_version(),
+            'stockage': args.stockage,
+            'volumes': volumes,
+            'repetitions': args.repetitions,
+            'routes': {}
+        }
+        print(f"{'route':22} {'1re requête':>12} {'médiane':>10} {'p95':>10} {'mémoire':>10}")
+        for nom, chemin in ROUTES:
+            mesure = mesurer(client, chemin, args.repetitions)
+            resultats['routes'][nom] = mesure
+            print(f"{nom:22} {mesure['premiere_ms']:>9.0f} ms {mesure['mediane_ms']:>7.1f} ms "
+                  f"{mesure['p95_ms']:>7.1f} ms {mesure['memoire_ko']:>7.0f} Ko")
+    finally:
+        os.chdir(RACINE)
+        shutil.rmtree(repertoire, ignore_errors=True)
+
+    if sortie:
+        with open(sortie, 'w', encoding='utf-8') as f:
+            json.dump(resultats, f, ensure_ascii=False, indent=4)
+        print(f'Résultats enregistrés dans {sortie}')
+    if reference:
+        with open(reference, encoding='utf-8') as f:
+            comparer(resultats, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,234 @@
+# Génération de jeux de données synthétiques pour les mesures de performance
+#
+# Produit un dossier data/ complet (mêmes fichiers et mêmes champs que
+# l'application) avec des volumes configurables. La génération est
+# déterministe pour une graine donnée.
+import json
+import os
+import random
+import uuid
+from datetime import date, datetime, timedelta
+
+from werkzeug.security import generate_password_hash
+
+MARQUES = [
+    ('Renault', ['Master', 'Trafic', 'Kangoo', 'Clio']),
+    ('Iveco', ['Daily', 'Eurocargo', 'Stralis']),
+    ('BOMAG', ['BW 120', 'BW 80']),
+    ('Warcker Neuson', ['DPU 4545HE', 'WP 1550 AW']),
+    ('Peugeot', ['Partner', 'Boxer', 'Expert']),
+]
+TYPES_VEHICULE = ['voiture', 'camion', 'utilitaire', 'engin', 'remorque', 'materiel']
+TYPES_INTERVENTION = ['Vidange', 'Freinage', 'Pneumatiques', 'Diagnostic', 'Carrosserie', 'Révision']
+
+DELAIS_CONTROLES = {
+    'ct': {'attention': 60, 'urgent': 30, 'periode': 365},
+    'mine': {'attention': 60, 'urgent': 30, 'periode': 365},
+    'tachy': {'attention': 60, 'urgent': 30, 'periode': 730},
+    'vgp': {'attention': 60, 'urgent': 30, 'periode': 60},
+}
+
+
+def _identifiant(alea):
+    return str(uuid.UUID(int=alea.getrandbits(128), version=4))
+
+
+def _date(alea, debut, jours):
+    return debut + timedelta(days=alea.randrange(jours))
+
+
+def _ecrire(repertoire, nom, donnees):
+    with open(os.path.join(repertoire, nom), 'w', encoding='utf-8') as f:
+        json.dump(donnees, f, ensure_ascii=False, indent=4)
+
+
+# Génère un dossier de données et retourne le nombre d'enregistrements par fichier
+def generer(repertoire, vehicules=1000, clients=100, pieces=500, interventions=10000,
+            sorties=5000, techniciens=10, conversations=20, messages=2000, graine=42):
+    alea = random.Random(graine)
+    os.makedirs(repertoire, exist_ok=True)
+    aujourd_hui = date.today()
+    debut = aujourd_hui - timedelta(days=5 * 365)
+    jours = (aujourd_hui - debut).days + 1
+
+    # Le hachage du mot de passe est coûteux : un seul pour tous les comptes
+    mot_de_passe = generate_password_hash('admin')
+    liste_users = [{
+        'id': 'admin', 'username': 'admin', 'password': mot_de_passe,
+        'name': 'Administrateur', 'role': 'admin'
+    }]
+    for n in range(techniciens):
+        liste_users.append({
+            'id': _identifiant(alea), 'username': f'tech{n}', 'password': mot_de_passe,
+            'name': f'Technicien {n}', 'role': 'user'
+        })
+
+    liste_clients = [{
+        'id': _identifiant(alea),
+        'nom': f'Client{n}',
+        'prenom': f'Site{n % 17}',
+        'telephone': f'06{n:08d}',
+        'email': f'client{n}@exemple.fr',
+        'adresse': f'{n} rue des Garages',
+        'date_ajout': _date(alea, debut, jours).strftime('%Y-%m-%d 08:00:00')
+    } for n in range(clients)]
+
+    liste_vehicules = []
+    for n in range(vehicules):
+        marque, modeles = alea.choice(MARQUES)
+        type_vehicule = alea.choice(TYPES_VEHICULE)
+        vehicule = {
+            'id': _identifiant(alea),
+            'marque': marque,
+            'modele': alea.choice(modeles),
+            'immatriculation': f'{chr(65 + n % 26)}{chr(65 + n // 26 % 26)}-{n % 1000:03d}-{chr(65 + n // 676 % 26)}Z',
+            'code_parc': f'PAV{n:05d}',
+            'numero_serie': f'{alea.randrange(10 ** 8):08d}',
+            'client_id': alea.choice(liste_clients)['id'] if liste_clients else '',
+            'type_vehicule': type_vehicule,
+            'annee': str(alea.randrange(1995, aujourd_hui.year + 1)),
+            'kilometrage': alea.randrange(300000),
+            'date_ajout': _date(alea, debut, jours).strftime('%Y-%m-%d')
+        }
+        if type_vehicule in ('voiture', 'camion', 'utilitaire'):
+            vehicule['date_dernier_ct'] = _date(alea, aujourd_hui - timedelta(days=400), 400).strftime('%Y-%m-%d')
+        if type_vehicule == 'camion':
+            vehicule['date_dernier_mine'] = _date(alea, aujourd_hui - timedelta(days=400), 400).strftime('%Y-%m-%d')
+            vehicule['date_dernier_tachy'] = _date(alea, aujourd_hui - timedelta(days=800), 800).strftime('%Y-%m-%d')
+        if type_vehicule == 'engin':
+            vehicule['date_dernier_vgp'] = _date(alea, aujourd_hui - timedelta(days=90), 90).strftime('%Y-%m-%d')
+        liste_vehicules.append(vehicule)
+
+    liste_pieces = []
+    for n in range(pieces):
+        prix_achat = round(alea.uniform(1, 400), 2)
+        liste_pieces.append({
+            'id': _identifiant(alea),
+            'reference': f'REF-{n:06d}',
+            'nom': f'Pièce {n}',
+            'description': f'Pièce détachée numéro {n}',
+            'quantite': alea.randrange(0, 200),
+            'quantite_min': alea.randrange(0, 20),
+            'prix_achat': prix_achat,
+            'prix_vente': round(prix_achat * 1.3, 2),
+            'fournisseur_id': '',
+            'date_creation': _date(alea, debut, jours).strftime('%Y-%m-%d 08:00:00')
+        })
+
+    noms_techniciens = [u['name'] for u in liste_users if u['role'] != 'admin']
+    liste_interventions = []
+    for n in range(interventions):
+        vehicule = alea.choice(liste_vehicules) if liste_vehicules else None
+        jour = _date(alea, debut, jours).strftime('%Y-%m-%d')
+        liste_interventions.append({
+            'id': _identifiant(alea),
+            'vehicule_id': vehicule['id'] if vehicule else '',
+            'client_id': vehicule['client_id'] if vehicule else '',
+            'date': jour,
+            'type': alea.choice(TYPES_INTERVENTION),
+            'description': f'Intervention {n} sur le véhicule',
+            'kilometrage': str(vehicule['kilometrage'] if vehicule else 0),
+            'technicien': alea.choice(noms_techniciens) if noms_techniciens else 'Administrateur',
+            'heures': round(alea.uniform(0.5, 8), 1),
+            'pieces_utilisees': [],
+            'date_creation': f'{jour} 08:00:00',
+            'statut': alea.choice(['En cours', 'Terminée'])
+        })
+
+    liste_sorties = []
+    for n in range(sorties):
+        piece = alea.choice(liste_pieces) if liste_pieces else None
+        intervention = alea.choice(liste_interventions) if liste_interventions else None
+        if not piece or not intervention:
+            break
+        quantite = alea.randrange(1, 5)
+        intervention['pieces_utilisees'].append({
+            'piece_id': piece['id'],
+            'nom': piece['nom'],
+            'prix_unitaire': piece['prix_vente'],
+            'quantite': quantite,
+            'total': float(piece['prix_vente']) * quantite
+        })
+        liste_sorties.append({
+            'id': _identifiant(alea),
+            'piece_id': piece['id'],
+            'vehicule_id': intervention['vehicule_id'],
+            'quantite': quantite,
+            'date_sortie': f"{intervention['date']} 09:00:00",
+            'utilisateur': intervention['technicien'],
+            'intervention_id': intervention['id']
+        })
+
+    # Conversations entre l'administrateur et quelques techniciens, messages répartis au hasard
+    liste_conversations = []
+    for n in range(conversations if len(liste_users) > 1 else 0):
+        participants = ['admin'] + [u['id'] for u in alea.sample(liste_users[1:], min(3, len(liste_users) - 1))]
+        liste_conversations.append({
+            'id': _identifiant(alea),
+            'name': f'Conversation {n}',
+            'participants': participants,
+            'created_at': datetime.combine(debut, datetime.min.time()).isoformat(),
+            'created_by': 'admin'
+        })
+    noms = {u['id']: u['name'] for u in liste_users}
+    liste_messages = []
+    instant = datetime.combine(aujourd_hui - timedelta(days=365), datetime.min.time())
+    for n in range(messages if liste_conversations else 0):
+        conversation = alea.choice(liste_conversations)
+        auteur = alea.choice(conversation['participants'])
+        instant += timedelta(seconds=alea.randrange(1, 3600))
+        liste_messages.append({
+            'id': _identifiant(alea),
+            'conversation_id': conversation['id'],
+            'sender_id': auteur,
+            'sender_name': noms[auteur],
+            'content': f'Message {n} : intervention à prévoir',
+            'created_at': instant.isoformat()
+        })
+
+    collections = {
+        'users.json': liste_users,
+        'clients.json': liste_clients,
+        'vehicules.json': liste_vehicules,
+        'stock.json': liste_pieces,
+        'interventions.json': liste_interventions,
+        'sorties.json': liste_sorties,
+        'fournisseurs.json': [],
+        'plannings.json': [],
+        'conversations.json': liste_conversations,
+        'messages.json': liste_messages,
+        'reports.json': [],
+        'unread_messages.json': [],
+        'historique_stock.json': [],
+    }
+    for nom, donnees in collections.items():
+        _ecrire(repertoire, nom, donnees)
+    _ecrire(repertoire, 'delais_controles.json', DELAIS_CONTROLES)
+    # Pas de tâches en arrière-plan pendant les mesures
+    _ecrire(repertoire, 'config.json', {'afficher_tva': True, 'afficher_prix': True,
+                                        'taches_planifiees': False, 'notifications_temps_reel': False})
+
+    return {nom: len(donnees) for nom, donnees in collections.items()}
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Génère un dossier data/ synthétique')
+    parser.add_argument('repertoire')
+    parser.add_argument('--vehicules', type=int, default=1000)
+    parser.add_argument('--clients', type=int, default=100)
+    parser.add_argument('--pieces', type=int, default=500)
+    parser.add_argument('--interventions', type=int, default=10000)
+    parser.add_argument('--sorties', type=int, default=5000)
+    parser.add_argument('--techniciens', type=int, default=10)
+    parser.add_argument('--conversations', type=int, default=20)
+    parser.add_argument('--messages', type=int, default=2000)
+    parser.add_argument('--graine', type=int, default=42)
+    args = parser.parse_args()
+
+    volumes = generer(args.repertoire, args.vehicules, args.clients, args.pieces,
+                      args.interventions, args.sorties, args.techniciens, args.conversations,
+                      args.messages, args.graine)
+    for nom, nombre in volumes.items():
+        print(f'{nom:25} {nombre:>8}')
@@ -0,0 +1,242 @@
+# Bilans d'entretien des véhicules : interventions, heures et coûts par véhicule
+#
+# Pour chaque véhicule sont gardés en mémoire : ses interventions triées par
+# date (historique paginé sans parcourir toutes les interventions), le total
+# des heures de main-d'œuvre, le coût des pièces et leur répartition par
+# année. Le coût des pièces comprend :
+#   - les pièces utilisées des interventions (au prix enregistré avec l'intervention) ;
+#   - les sorties de stock faites pour le véhicule hors intervention, au prix
+#     de vente actuel de la pièce (la sortie n'enregistre pas de prix).
+# Les sorties rattachées à une intervention sont déjà comptées avec elle.
+#
+# Comme les feuilles d'heures, les bilans suivent les collections du cache :
+# lorsqu'une collection a changé, seuls les enregistrements modifiés sont
+# retirés puis rajoutés. Les sorties ne font normalement que grandir : seules
+# les nouvelles sont alors lues.
+import bisect
+import threading
+
+
+def _nombre(valeur):
+    try:
+        return float(valeur or 0)
+    except (ValueError, TypeError):
+        return 0.0
+
+
+def _annee(valeur):
+    annee = str(valeur or '')[:4]
+    return annee if len(annee) == 4 and annee.isdigit() else None
+
+
+class BilanVehicule:
+    """Totaux d'un véhicule, mis à jour enregistrement par enregistrement."""
+
+    __slots__ = ('interventions', 'heures', 'cout_pieces', 'annees', 'sorties')
+
+    def __init__(self):
+        # (date, id) des interventions, triés
+        self.interventions = []
+        self.heures = 0.0
+        # Pièces des interventions
+        self.cout_pieces = 0.0
+        # année -> [nombre d'interventions, heures, coût des pièces des interventions]
+        self.annees = {}
+        # (année, id de la pièce) -> quantité sortie hors intervention
+        self.sorties = {}
+
+    def vide(self):
+        return not self.interventions and not self.sorties
+
+
+class BilansVehicules:
+    """Bilans de tous les véhicules, tenus à jour d'après les interventions et les sorties.
+
+    `charger` retourne la collection partagée d'un fichier (load_data en
+    lecture seule) ; le coût de la main-d'œuvre est compté à `taux_horaire`.
+    """
+
+    def __init__(self, charger, chemin_interventions, chemin_sorties, chemin_stock, taux_horaire):
+        self._charger = charger
+        self.chemin_interventions = chemin_interventions
+        self.chemin_sorties = chemin_sorties
+        self.chemin_stock = chemin_stock
+        self.taux_horaire = taux_horaire
+        self._verrou = threading.Lock()
+        self._interventions = None
+        self._sorties = None
+        # id de l'intervention -> (vehicule_id, date, heures, coût des pièces)
+        self._contributions = {}
+        # clé de la sortie -> (vehicule_id, année, piece_id, quantité)
+        self._sorties_comptees = {}
+        # (nombre de sorties lues, id de la première, id de la dernière)
+        self._sorties_lues = (0, None, None)
+        self._bilans = {}
+
+    def _bilan(self, vehicule_id):
+        bilan = self._bilans.get(vehicule_id)
+        if bilan is None:
+            bilan = self._bilans[vehicule_id] = BilanVehicule()
+        return bilan
+
+    def _liberer(self, vehicule_id, bilan):
+        if bilan.vide():
+            del self._bilans[vehicule_id]
+
+    @staticmethod
+    def _contribution(intervention):
+        vehicule_id = intervention.get('vehicule_id')
+        if not vehicule_id:
+            return None
+        cout_pieces = sum(_nombre(piece.get('total')) for piece in intervention.get('pieces_utilisees') or ()
+                          if isinstance(piece, dict))
+        return (vehicule_id, str(intervention.get('date') or ''), _nombre(intervention.get('heures')), cout_pieces)
+
+    def _compter_intervention(self, intervention_id, contribution, signe):
+        vehicule_id, jour, heures, cout_pieces = contribution
+        bilan = self._bilan(vehicule_id)
+        if signe > 0:
+            bisect.insort(bilan.interventions, (jour, intervention_id))
+        else:
+            position = bisect.bisect_left(bilan.interventions, (jour, intervention_id))
+            if position < len(bilan.interventions) and bilan.interventions[position] == (jour, intervention_id):
+                del bilan.interventions[position]
+        bilan.heures += signe * heures
+        bilan.cout_pieces += signe * cout_pieces
+        annee = _annee(jour)
+        if annee is not None:
+            case = bilan.annees.setdefault(annee, [0, 0.0, 0.0])
+            case[0] += signe
+            case[1] += signe * heures
+            case[2] += signe * cout_pieces
+            if not case[0]:
+                del bilan.annees[annee]
+        if not bilan.interventions:
+            # Repartir de zéro évite de garder les écarts d'arrondi des soustractions
+            bilan.heures = bilan.cout_pieces = 0.0
+        self._liberer(vehicule_id, bilan)
+
+    @staticmethod
+    def _sortie(sortie):
+        # Les sorties d'une intervention sont comptées avec ses pièces utilisées
+        if sortie.get('intervention_id') or not sortie.get('vehicule_id') or not sortie.get('piece_id'):
+            return None
+        return (sortie['vehicule_id'], _annee(sortie.get('date_sortie')), sortie['piece_id'],
+                int(_nombre(sortie.get('quantite'))))
+
+    def _compter_sortie(self, contribution, signe):
+        vehicule_id, annee, piece_id, quantite = contribution
+        bilan = self._bilan(vehicule_id)
+        cle = (annee, piece_id)
+        quantite = bilan.sorties.get(cle, 0) + signe * quantite
+        if quantite:
+            bilan.sorties[cle] = quantite
+        else:
+            bilan.sorties.pop(cle, None)
+        self._liberer(vehicule_id, bilan)
+
+    def _rafraichir_interventions(self, interventions):
+        presentes = {}
+        for intervention in interventions:
+            intervention_id = intervention.get('id')
+            if intervention_id is None or intervention_id in presentes:
+                continue
+            contribution = self._contribution(intervention)
+            if contribution is not None:
+                presentes[intervention_id] = contribution
+            ancienne = self._contributions.get(intervention_id)
+            if contribution != ancienne:
+                if ancienne is not None:
+                    self._compter_intervention(intervention_id, ancienne, -1)
+                if contribution is not None:
+                    self._compter_intervention(intervention_id, contribution, 1)
+        for intervention_id in self._contributions.keys() - presentes.keys():
+            self._compter_intervention(intervention_id, self._contributions[intervention_id], -1)
+        self._contributions = presentes
+
+    def _rafraichir_sorties(self, sorties):
+        nombre, premiere, derniere = self._sorties_lues
+        if nombre and len(sorties) >= nombre and sorties[0].get('id') == premiere \
+                and sorties[nombre - 1].get('id') == derniere:
+            # Sorties ajoutées à la fin : seules les nouvelles sont lues
+            for rang in range(nombre, len(sorties)):
+                contribution = self._sortie(sorties[rang])
+                if contribution is not None:
+                    cle = sorties[rang].get('id')
+                    if cle is None or cle in self._sorties_comptees:
+                        cle = ('rang', rang)
+                    self._sorties_comptees[cle] = contribution
+                    self._compter_sortie(contribution, 1)
+        else:
+            presentes = {}
+            for rang, sortie in enumerate(sorties):
+                contribution = self._sortie(sortie)
+                if contribution is not None:
+                    cle = sortie.get('id')
+                    presentes[('rang', rang) if cle is None or cle in presentes else cle] = contribution
+            for cle in self._sorties_comptees.keys() | presentes.keys():
+                ancienne = self._sorties_comptees.get(cle)
+                nouvelle = presentes.get(cle)
+                if ancienne != nouvelle:
+                    if ancienne is not None:
+                        self._compter_sortie(ancienne, -1)
+                    if nouvelle is not None:
+                        self._compter_sortie(nouvelle, 1)
+            self._sorties_comptees = presentes
+        self._sorties_lues = (len(sorties), sorties[0].get('id') if sorties else None,
+                              sorties[-1].get('id') if sorties else None)
+
+    # Met les bilans à jour d'après les collections actuelles
+    def rafraichir(self):
+        interventions = self._charger(self.chemin_interventions)
+        sorties = self._charger(self.chemin_sorties)
+        with self._verrou:
+            if interventions is not self._interventions:
+                self._rafraichir_interventions(interventions)
+                self._interventions = interventions
+            if sorties is not self._sorties:
+                self._rafraichir_sorties(sorties)
+                self._sorties = sorties
+
+    # Bilan d'un véhicule :
+    #     {'nombre_interventions', 'heures', 'cout_pieces', 'cout_main_oeuvre', 'cout_total',
+    #      'derniere_intervention' (id ou None),
+    #      'annees': [{'annee', 'interventions', 'heures', 'cout_pieces', 'cout_main_oeuvre',
+    #                  'cout_total'}, ...] (dans l'ordre chronologique)}
+    def bilan(self, vehicule_id):
+        self.rafraichir()
+        stock = self._charger(self.chemin_stock)
+        with self._verrou:
+            bilan = self._bilans.get(vehicule_id) or BilanVehicule()
+            nombre = len(bilan.interventions)
+            derniere = bilan.interventions[-1][1] if bilan.interventions else None
+            heures, cout_pieces = bilan.heures, bilan.cout_pieces
+            annees = {annee: list(case) for annee, case in bilan.annees.items()}
+            sorties = dict(bilan.sorties)
+
+        for (annee, piece_id), quantite in sorties.items():
+            piece = stock.obtenir(piece_id)
+            cout = quantite * _nombre(piece.get('prix_vente')) if piece else 0.0
+            cout_pieces += cout
+            if annee is not None:
+                annees.setdefault(annee, [0, 0.0, 0.0])[2] += cout
+
+        def couts(heures, pieces):
+            main_oeuvre = round(heures * self.taux_horaire, 2)
+            return {'heures': round(heures, 2), 'cout_pieces': round(pieces, 2),
+                    'cout_main_oeuvre': main_oeuvre, 'cout_total': round(pieces + main_oeuvre, 2)}
+
+        return {
+            'nombre_interventions': nombre,
+            **couts(heures, cout_pieces),
+            'derniere_intervention': derniere,
+            'annees': [{'annee': annee, 'interventions': case[0], **couts(case[1], case[2])}
+                       for annee, case in sorted(annees.items())]
+        }
+
+    # Ids des interventions d'un véhicule, les plus récentes d'abord
+    def historique(self, vehicule_id):
+        self.rafraichir()
+        with self._verrou:
+            bilan = self._bilans.get(vehicule_id)
+            return [intervention_id for _, intervention_id in reversed(bilan.interventions)] if bilan else []
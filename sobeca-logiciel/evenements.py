@@ -0,0 +1,289 @@
+# Journal d'événements en segments JSON Lines (ajout seulement)
+#
+# Utilisé pour les collections qui ne font que grandir (sorties de stock,
+# historique des inventaires) : enregistrer un mouvement ajoute une ligne à la
+# fin du segment actif au lieu de réécrire toute la collection.
+#
+# Chaque ligne est un événement numéroté :
+#     {"n": 12, "ajout": {...}}
+#     {"n": 13, "remplacement": {...}}
+#     {"n": 14, "suppression": "<id>"}
+# Les segments sont nommés d'après le numéro de leur premier événement
+# (000000000001.jsonl, ...). Un nouveau segment est ouvert lorsque le segment
+# actif dépasse `taille_segment`. La compaction réécrit l'état courant dans un
+# segment compacté nommé d'après le dernier numéro qu'il contient
+# (000000000350.compacte.jsonl), commençant par la ligne
+# {"compaction": <dernier numéro>}. Les lecteurs partent du segment compacté
+# le plus récent et ignorent les segments plus anciens, que la compaction
+# supprime ensuite : une lecture concurrente n'a pas à les trouver.
+import json
+import os
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+EXTENSION = '.jsonl'
+COMPACTE = '.compacte' + EXTENSION
+
+
+def _nom_segment(premier):
+    return f'{premier:012d}{EXTENSION}'
+
+
+def _numero(nom):
+    return int(nom[:12])
+
+
+def _cle(element):
+    identifiant = element.get('id') if isinstance(element, dict) else None
+    if identifiant is None or isinstance(identifiant, (dict, list)):
+        raise ValueError("Les enregistrements d'un journal d'événements doivent avoir un 'id'")
+    return str(identifiant)
+
+
+class JournalEvenements:
+    """Collection stockée sous forme d'événements dans un répertoire de segments.
+
+    L'état (enregistrements vivants, dans l'ordre d'ajout) est tenu en mémoire
+    et rattrapé en ne lisant que les octets ajoutés depuis la dernière lecture.
+    Les écritures doivent être faites sous le verrou de fichier de la
+    collection (voir StockageJSON) ; les lectures n'en ont pas besoin.
+    """
+
+    def __init__(self, repertoire, taille_segment=4 * 1024 * 1024):
+        self.repertoire = repertoire
+        self.taille_segment = taille_segment
+        self._verrou = threading.RLock()
+        self._reinitialiser()
+
+    def _reinitialiser(self):
+        # Segments lus : [nom, inode, octets consommés, compacté]
+        self._segments = []
+        # Clé -> (numéro du dernier événement, enregistrement)
+        self._elements = {}
+        self._dernier = 0
+        # Événements qui ne contribuent plus à l'état (remplacés ou supprimés)
+        self._inutiles = 0
+
+    def existe(self):
+        return os.path.isdir(self.repertoire)
+
+    # Segments à lire, dans l'ordre : le segment compacté le plus récent, puis ceux qui le suivent
+    def _noms_segments(self):
+        noms = sorted(nom for nom in os.listdir(self.repertoire) if nom.endswith(EXTENSION))
+        compactes = [nom for nom in noms if nom.endswith(COMPACTE)]
+        if not compactes:
+            return noms
+        debut = _numero(compactes[-1])
+        return [compactes[-1]] + [nom for nom in noms if not nom.endswith(COMPACTE) and _numero(nom) > debut]
+
+    # Signature : liste des segments et taille du dernier (FileNotFoundError si absent)
+    def signature(self):
+        noms = self._noms_segments()
+        if not noms:
+            return ()
+        stat = os.stat(os.path.join(self.repertoire, noms[-1]))
+        return (tuple(noms), stat.st_ino, stat.st_size)
+
+    @property
+    def dernier(self):
+        return self._dernier
+
+    def __len__(self):
+        return len(self._elements)
+
+    # Enregistrements vivants, dans l'ordre d'ajout
+    def elements(self):
+        with self._verrou:
+            self._rattraper()
+            return [element for _, element in self._elements.values()]
+
+    def _appliquer(self, evenement, filtrer=True):
+        n = evenement['n']
+        if filtrer and n <= self._dernier:
+            return
+        if 'ajout' in evenement or 'remplacement' in evenement:
+            element = evenement.get('ajout', evenement.get('remplacement'))
+            cle = _cle(element)
+            if cle in self._elements:
+                self._inutiles += 1
+            self._elements[cle] = (n, element)
+        elif 'suppression' in evenement:
+            if self._elements.pop(str(evenement['suppression']), None) is not None:
+                self._inutiles += 1
+            self._inutiles += 1
+        self._dernier = max(self._dernier, n)
+
+    # Lit les lignes complètes d'un segment à partir de `debut` ; retourne la position atteinte
+    def _lire_segment(self, nom, debut, compacte):
+        chemin = os.path.join(self.repertoire, nom)
+        with open(chemin, 'rb') as f:
+            inode = os.fstat(f.fileno()).st_ino
+            f.seek(debut)
+            contenu = f.read()
+        # Une ligne incomplète (écriture en cours ou interrompue) est ignorée
+        fin = contenu.rfind(b'\n') + 1
+        for ligne in contenu[:fin].splitlines():
+            if not ligne.strip():
+                continue
+            evenement = json.loads(ligne)
+            if 'compaction' in evenement:
+                # Segment compacté : il contient tout l'état jusqu'à ce numéro
+                self._elements = {}
+                self._inutiles = 0
+                self._dernier = evenement['compaction']
+                compacte = True
+            elif compacte:
+                self._appliquer(evenement, filtrer=False)
+            else:
+                self._appliquer(evenement)
+        return inode, debut + fin, compacte
+
+    # Met l'état en mémoire à jour avec ce qui a été écrit depuis la dernière lecture
+    def _rattraper(self):
+        while True:
+            try:
+                noms = self._noms_segments() if self.existe() else []
+                connus = [segment[0] for segment in self._segments]
+                if noms[:len(connus)] != connus:
+                    # Segments compactés ou supprimés : relire depuis le début
+                    self._reinitialiser()
+                    connus = []
+
+                # Reprendre le dernier segment connu là où sa lecture s'était arrêtée
+                if self._segments:
+                    segment = self._segments[-1]
+                    inode, position, compacte = self._lire_segment(segment[0], segment[2], segment[3])
+                    if inode != segment[1]:
+                        self._reinitialiser()
+                        continue
+                    segment[2] = position
+
+                for nom in noms[len(connus):]:
+                    inode, position, compacte = self._lire_segment(nom, 0, False)
+                    self._segments.append([nom, inode, position, compacte])
+                return
+            except FileNotFoundError:
+                # Segment supprimé par une compaction concurrente : la liste relue
+                # commence par le nouveau segment compacté
+                self._reinitialiser()
+
+    # Prépare l'écriture d'une liste d'événements [('ajout', element), ('suppression', id), ...]
+    #
+    # Retourne (chemin du segment, position, texte) : le texte doit être écrit à
+    # cette position du segment (voir ecrire_a_position). Les numéros sont
+    # attribués ici ; l'appelant doit tenir le verrou de la collection.
+    def preparer(self, evenements):
+        with self._verrou:
+            self._rattraper()
+            os.makedirs(self.repertoire, exist_ok=True)
+            lignes = []
+            n = self._dernier
+            for type_evenement, valeur in evenements:
+                if type_evenement != 'suppression':
+                    _cle(valeur)
+                n += 1
+                lignes.append(json.dumps({'n': n, type_evenement: valeur}, ensure_ascii=False))
+            texte = '\n'.join(lignes) + '\n' if lignes else ''
+
+            segment = self._segments[-1] if self._segments else None
+            if segment is None or segment[3] or segment[2] >= self.taille_segment:
+                return os.path.join(self.repertoire, _nom_segment(self._dernier + 1)), 0, texte
+            return os.path.join(self.repertoire, segment[0]), segment[2], texte
+
+    # Ajoute des événements à la fin du journal ; l'appelant doit tenir le verrou de la collection
+    def ajouter(self, evenements):
+        with self._verrou:
+            chemin, position, texte = self.preparer(evenements)
+            if texte:
+                ecrire_a_position(chemin, position, texte)
+            self._rattraper()
+
+    # Différences entre l'état courant et une liste complète d'enregistrements
+    def differences(self, donnees):
+        with self._verrou:
+            self._rattraper()
+            evenements = []
+            cles = set()
+            for element in donnees:
+                cle = _cle(element)
+                cles.add(cle)
+                actuel = self._elements.get(cle)
+                if actuel is None:
+                    evenements.append(('ajout', element))
+                elif actuel[1] != element:
+                    evenements.append(('remplacement', element))
+            for cle, (_, element) in self._elements.items():
+                if cle not in cles:
+                    evenements.append(('suppression', element.get('id')))
+            return evenements
+
+    # Vrai lorsque la majorité des événements ne sert plus (ou trop de segments)
+    def a_compacter(self, seuil=1000, segments_max=16):
+        with self._verrou:
+            self._rattraper()
+            return (self._inutiles >= seuil and self._inutiles > len(self._elements)) \
+                or len(self._segments) > segments_max
+
+    # Réécrit l'état courant dans un seul segment ; l'appelant doit tenir le verrou de la collection
+    #
+    # Les segments remplacés sont supprimés après l'écriture du segment compacté. Sous Windows,
+    # un segment ouvert par un lecteur ne peut pas être supprimé : il est laissé à la
+    # compaction suivante, les lecteurs l'ignorant déjà.
+    def compacter(self):
+        with self._verrou:
+            self._rattraper()
+            if not self._segments:
+                return
+            lus = len(self._segments)
+            nom = f'{self._dernier:012d}{COMPACTE}'
+            chemin = os.path.join(self.repertoire, nom)
+            temporaire = chemin + '.tmp'
+            with open(temporaire, 'w', encoding='utf-8') as f:
+                f.write(json.dumps({'compaction': self._dernier}) + '\n')
+                for n, element in self._elements.values():
+                    f.write(json.dumps({'n': n, 'ajout': element}, ensure_ascii=False) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            remplacer(temporaire, chemin)
+            restants = 0
+            for ancien in os.listdir(self.repertoire):
+                if ancien == nom or not ancien.endswith(EXTENSION):
+                    continue
+                try:
+                    os.remove(os.path.join(self.repertoire, ancien))
+                except FileNotFoundError:
+                    pass
+                except PermissionError:
+                    restants += 1
+            logger.info("Journal %s compacté : %d segment(s), %d enregistrement(s)",
+                        self.repertoire, lus, len(self._elements))
+            if restants:
+                logger.warning("Journal %s : %d ancien(s) segment(s) encore ouvert(s), supprimé(s) "
+                               "à la prochaine compaction", self.repertoire, restants)
+            self._reinitialiser()
+            self._rattraper()
+
+
+# Écrit `texte` à la position donnée d'un segment, en tronquant ce qui suit
+# (reste d'une écriture interrompue). Rejouer la même écriture est sans effet.
+def ecrire_a_position(chemin, position, texte):
+    with open(chemin, 'a+b') as f:
+        f.truncate(position)
+        f.write(texte.encode('utf-8'))
+        f.flush()
+        os.fsync(f.fileno())
+
+
+# os.replace, en réessayant brièvement sous Windows si le fichier est ouvert en lecture
+def remplacer(source, destination):
+    for tentative in range(50):
+        try:
+            os.replace(source, destination)
+            return
+        except PermissionError:
+            if os.name != 'nt' or tentative == 49:
+                raise
+            time.sleep(0.02)
@@ -0,0 +1,91 @@
+# Réponses JSON produites au fil de l'eau (exports en masse des /api)
+#
+# Les enregistrements sont encodés par paquets et envoyés au fur et à mesure :
+# la mémoire utilisée ne dépend pas du nombre d'enregistrements et le client
+# reçoit les premiers octets tout de suite. Deux formats :
+#   - "json"   : un tableau JSON, comme jsonify ;
+#   - "ndjson" : un enregistrement JSON par ligne.
+# La compression (gzip, ou brotli si le module est installé) est faite paquet
+# par paquet ; chaque paquet compressé est vidé pour partir immédiatement.
+import json
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Taille visée d'un paquet avant envoi (octets, avant compression)
+TAILLE_PAQUET = 64 * 1024
+
+_encodeur = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+
+
+# Encodages acceptés par le client (en-tête Accept-Encoding), du préféré au moins bon
+def negocier_encodage(accept_encoding):
+    acceptes = {}
+    for partie in (accept_encoding or '').split(','):
+        nom, _, parametres = partie.strip().partition(';')
+        qualite = 1.0
+        parametres = parametres.strip()
+        if parametres.startswith('q='):
+            try:
+                qualite = float(parametres[2:])
+            except ValueError:
+                qualite = 0.0
+        if nom:
+            acceptes[nom.strip().lower()] = qualite
+    for encodage in (('br',) if brotli is not None else ()) + ('gzip',):
+        if acceptes.get(encodage, acceptes.get('*', 0)) > 0:
+            return encodage
+    return None
+
+
+def _projeter(element, champs):
+    if champs is None or not isinstance(element, dict):
+        return element
+    return {champ: element[champ] for champ in champs if champ in element}
+
+
+# Texte JSON des enregistrements, par paquets d'environ TAILLE_PAQUET octets
+def _paquets(elements, champs, ndjson):
+    debut, separateur, fin = ('', '\n', '\n') if ndjson else ('[', ',', ']')
+    paquet = [debut]
+    taille = 0
+    premier = True
+    for element in elements:
+        texte = _encodeur.encode(_projeter(element, champs))
+        if ndjson or not premier:
+            texte = (texte + separateur) if ndjson else (separateur + texte)
+        premier = False
+        paquet.append(texte)
+        taille += len(texte)
+        if taille >= TAILLE_PAQUET:
+            yield ''.join(paquet).encode('utf-8')
+            paquet = []
+            taille = 0
+    if not ndjson:
+        paquet.append(fin)
+    texte = ''.join(paquet)
+    if texte:
+        yield texte.encode('utf-8')
+
+
+# Octets de la réponse : `elements` est parcouru une seule fois, pendant l'envoi
+#
+# `champs` : noms des champs gardés (None pour tout envoyer) ; `encodage` :
+# None, 'gzip' ou 'br' (voir negocier_encodage).
+def flux_json(elements, champs=None, ndjson=False, encodage=None):
+    paquets = _paquets(elements, champs, ndjson)
+    if encodage == 'gzip':
+        compresseur = zlib.compressobj(6, zlib.DEFLATED, 31)
+        for paquet in paquets:
+            yield compresseur.compress(paquet) + compresseur.flush(zlib.Z_SYNC_FLUSH)
+        yield compresseur.flush()
+    elif encodage == 'br':
+        compresseur = brotli.Compressor(quality=4)
+        for paquet in paquets:
+            yield compresseur.process(paquet) + compresseur.flush()
+        yield compresseur.finish()
+    else:
+        yield from paquets
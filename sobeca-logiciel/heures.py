@@ -0,0 +1,156 @@
+# Feuilles d'heures des techniciens : heures d'intervention par jour, semaine et mois
+#
+# Chaque intervention compte pour son technicien (champ "technicien", le nom
+# de l'utilisateur) à la date de l'intervention. Les totaux par technicien et
+# par période sont gardés en mémoire et suivent la collection du cache :
+# lorsque les interventions ont changé (création, modification, ajustement
+# des heures, suppression, par ce processus ou un autre), seules celles dont
+# le technicien, la date ou les heures ont changé sont retirées des totaux
+# puis rajoutées. Les pages d'heures lisent les totaux sans parcourir les
+# interventions.
+import threading
+from datetime import date, timedelta
+
+# Périodes des totaux, de la plus fine à la plus large
+PERIODES = ('jour', 'semaine', 'mois')
+
+# Nombre de périodes affichées par défaut dans une répartition
+NOMBRE_PERIODES = {'jour': 14, 'semaine': 12, 'mois': 12}
+
+
+# Heures d'une intervention (0 si le champ est absent ou invalide)
+def heures_intervention(intervention):
+    try:
+        return float(intervention.get('heures') or 0)
+    except (ValueError, TypeError):
+        return 0.0
+
+
+# Clés des périodes d'un jour : {'jour': '2024-03-18', 'semaine': '2024-S12', 'mois': '2024-03'}
+def cles_periodes(jour):
+    annee, semaine, _ = jour.isocalendar()
+    return {
+        'jour': jour.isoformat(),
+        'semaine': f'{annee}-S{semaine:02d}',
+        'mois': f'{jour.year}-{jour.month:02d}'
+    }
+
+
+def _jour(valeur):
+    try:
+        return date.fromisoformat(str(valeur)[:10])
+    except ValueError:
+        return None
+
+
+# Clés des `nombre` périodes qui se terminent par celle de `aujourd_hui`, dans l'ordre chronologique
+def dernieres_periodes(periode, nombre, aujourd_hui):
+    if periode == 'mois':
+        rang = aujourd_hui.year * 12 + aujourd_hui.month - 1
+        return [f'{r // 12}-{r % 12 + 1:02d}' for r in range(rang - nombre + 1, rang + 1)]
+    pas = 7 if periode == 'semaine' else 1
+    return [cles_periodes(aujourd_hui - timedelta(days=pas * i))[periode]
+            for i in range(nombre - 1, -1, -1)]
+
+
+class FeuillesHeures:
+    """Heures des techniciens au total et par période, tenues à jour d'après les interventions.
+
+    `charger` retourne la collection partagée d'un fichier (load_data en
+    lecture seule).
+    """
+
+    def __init__(self, charger, chemin_interventions):
+        self._charger = charger
+        self.chemin_interventions = chemin_interventions
+        self._verrou = threading.Lock()
+        self._interventions = None
+        # clé de l'intervention -> (technicien, date, heures)
+        self._contributions = {}
+        # technicien -> {'heures', 'nombre', 'jour': {clé: [heures, nombre]}, 'semaine': ..., 'mois': ...}
+        self._totaux = {}
+
+    @staticmethod
+    def _contribution(intervention):
+        technicien = intervention.get('technicien')
+        if not technicien:
+            return None
+        return (technicien, _jour(intervention.get('date')), heures_intervention(intervention))
+
+    def _ajouter(self, contribution, signe):
+        technicien, jour, heures = contribution
+        totaux = self._totaux.get(technicien)
+        if totaux is None:
+            totaux = self._totaux[technicien] = {'heures': 0.0, 'nombre': 0,
+                                                 **{periode: {} for periode in PERIODES}}
+        totaux['heures'] += signe * heures
+        totaux['nombre'] += signe
+        if jour is not None:
+            for periode, cle in cles_periodes(jour).items():
+                case = totaux[periode].setdefault(cle, [0.0, 0])
+                case[0] += signe * heures
+                case[1] += signe
+                if not case[1]:
+                    del totaux[periode][cle]
+        if not totaux['nombre']:
+            # Repartir de zéro évite de garder les écarts d'arrondi des soustractions
+            del self._totaux[technicien]
+
+    # Met les totaux à jour d'après la collection actuelle
+    def rafraichir(self):
+        interventions = self._charger(self.chemin_interventions)
+        with self._verrou:
+            if interventions is self._interventions:
+                return
+            presentes = {}
+            for rang, intervention in enumerate(interventions):
+                cle = intervention.get('id')
+                if cle is None or cle in presentes:
+                    cle = ('rang', rang)
+                contribution = self._contribution(intervention)
+                if contribution is not None:
+                    presentes[cle] = contribution
+                ancienne = self._contributions.get(cle)
+                if contribution != ancienne:
+                    if ancienne is not None:
+                        self._ajouter(ancienne, -1)
+                    if contribution is not None:
+                        self._ajouter(contribution, 1)
+            for cle in self._contributions.keys() - presentes.keys():
+                self._ajouter(self._contributions[cle], -1)
+            self._contributions = presentes
+            self._interventions = interventions
+
+    # Totaux d'un technicien : {'total_heures', 'nombre_interventions', 'moyenne_heures'}
+    def technicien(self, nom):
+        self.rafraichir()
+        with self._verrou:
+            totaux = self._totaux.get(nom)
+            heures, nombre = (totaux['heures'], totaux['nombre']) if totaux else (0.0, 0)
+        return {
+            'total_heures': round(heures, 6),
+            'nombre_interventions': nombre,
+            'moyenne_heures': round(heures / nombre, 6) if nombre else 0
+        }
+
+    # Heures des `nombre` dernières périodes (jour, semaine ou mois) jusqu'à `aujourd_hui` :
+    #     {'periode': 'mois', 'periodes': ['2024-01', ...],
+    #      'techniciens': {nom: {'heures': [...], 'interventions': [...], 'total': h}}}
+    # `techniciens` : noms à inclure (tous ceux qui ont des heures par défaut).
+    def repartition(self, periode='mois', nombre=None, techniciens=None, aujourd_hui=None):
+        if periode not in PERIODES:
+            raise ValueError(f"Période inconnue : {periode}")
+        nombre = nombre or NOMBRE_PERIODES[periode]
+        cles = dernieres_periodes(periode, nombre, aujourd_hui or date.today())
+        self.rafraichir()
+        resultat = {}
+        with self._verrou:
+            for nom in (self._totaux if techniciens is None else techniciens):
+                cases = self._totaux.get(nom, {}).get(periode, {})
+                valeurs = [cases.get(cle, (0.0, 0)) for cle in cles]
+                resultat[nom] = {
+                    'heures': [round(heures, 6) for heures, _ in valeurs],
+                    'interventions': [nombre_cle for _, nombre_cle in valeurs],
+                    'total': round(sum(heures for heures, _ in valeurs), 6)
+                }
+        return {'periode': periode, 'periodes': cles, 'techniciens': resultat}
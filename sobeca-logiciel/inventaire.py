@@ -0,0 +1,87 @@
+# Inventaires physiques du stock par session de comptage
+#
+# Un inventaire est ouvert, reçoit les quantités comptées au fil de l'eau
+# (lecteur de codes-barres, saisie, feuille de comptage CSV), montre les
+# écarts avec le stock, puis est validé : tous les ajustements et toutes les
+# lignes d'historique sont écrits ensemble, en une seule transaction.
+#
+# Les comptages sont des lignes ajoutées à une collection qui ne fait que
+# grandir (data/comptages_inventaire.json) : enregistrer un comptage ne
+# réécrit ni le stock ni l'historique. Un comptage "ajouter" s'ajoute à la
+# quantité déjà comptée pour la pièce (un passage de lecteur = une pièce) ;
+# un comptage "remplacer" la fixe. Ils s'appliquent dans l'ordre d'arrivée.
+import csv
+import io
+
+MODES_COMPTAGE = ('remplacer', 'ajouter')
+
+# En-têtes reconnus dans une feuille de comptage (sans tenir compte de la casse ni des accents)
+COLONNES_PIECE = ('piece_id', 'pieceid', 'id', 'reference', 'ref')
+COLONNES_QUANTITE = ('quantite', 'qte', 'quantite_comptee', 'quantite_physique')
+
+
+def _colonne(nom):
+    nom = (nom or '').strip().casefold()
+    for accent, lettre in (('é', 'e'), ('è', 'e'), ('ê', 'e'), ('à', 'a')):
+        nom = nom.replace(accent, lettre)
+    return nom.replace(' ', '_').replace('.', '')
+
+
+# Lignes d'une feuille de comptage CSV (séparateur ";" ou ",", première ligne d'en-têtes) :
+#     ([{'piece': référence ou id, 'quantite': n, 'ligne': numéro}, ...], [erreurs])
+def lire_feuille(texte):
+    texte = texte.lstrip('\ufeff')
+    premiere = texte.split('\n', 1)[0]
+    separateur = ';' if premiere.count(';') >= premiere.count(',') else ','
+    lecteur = csv.reader(io.StringIO(texte), delimiter=separateur)
+    entetes = [_colonne(nom) for nom in next(lecteur, [])]
+    try:
+        rang_piece = next(entetes.index(nom) for nom in COLONNES_PIECE if nom in entetes)
+        rang_quantite = next(entetes.index(nom) for nom in COLONNES_QUANTITE if nom in entetes)
+    except StopIteration:
+        return [], ["En-têtes attendus : une colonne 'reference' (ou 'piece_id') et une colonne 'quantite'"]
+
+    lignes, erreurs = [], []
+    for numero, valeurs in enumerate(lecteur, start=2):
+        if not any(valeur.strip() for valeur in valeurs):
+            continue
+        piece = valeurs[rang_piece].strip() if rang_piece < len(valeurs) else ''
+        quantite = valeurs[rang_quantite].strip() if rang_quantite < len(valeurs) else ''
+        try:
+            quantite = int(quantite)
+        except ValueError:
+            erreurs.append(f"Ligne {numero} : quantité invalide ({quantite or 'vide'})")
+            continue
+        if not piece or quantite < 0:
+            erreurs.append(f"Ligne {numero} : pièce manquante ou quantité négative")
+            continue
+        lignes.append({'piece': piece, 'quantite': quantite, 'ligne': numero})
+    return lignes, erreurs
+
+
+# Quantités comptées par pièce, d'après les comptages d'un inventaire dans l'ordre d'arrivée
+def quantites_comptees(comptages):
+    quantites = {}
+    for comptage in comptages:
+        if comptage.get('mode') == 'ajouter':
+            quantites[comptage['piece_id']] = quantites.get(comptage['piece_id'], 0) + comptage['quantite']
+        else:
+            quantites[comptage['piece_id']] = comptage['quantite']
+    return quantites
+
+
+# Écarts entre le stock et les quantités comptées, dans l'ordre du stock :
+#     [{'piece', 'quantite_systeme', 'quantite_comptee', 'ecart'}, ...]
+# Avec `non_comptees_a_zero`, les pièces qui n'ont pas été comptées sont mises à zéro.
+def ecarts(pieces, quantites, non_comptees_a_zero=False):
+    resultat = []
+    for piece in pieces:
+        comptee = quantites.get(piece.get('id'))
+        if comptee is None:
+            if not non_comptees_a_zero:
+                continue
+            comptee = 0
+        systeme = int(piece.get('quantite') or 0)
+        resultat.append({'piece': piece, 'quantite_systeme': systeme, 'quantite_comptee': comptee,
+                         'ecart': comptee - systeme})
+    return resultat
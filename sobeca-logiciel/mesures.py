@@ -0,0 +1,253 @@
+# Mesures des requêtes de l'application Garage Sobeca
+#
+# Pour chaque route : durée de la requête, temps passé dans load_data et
+# save_data, octets lus et écrits par le stockage, temps de rendu des
+# templates et nombre de parcours complets de collections. Les durées sont
+# gardées en histogramme (format Prometheus) et en échantillon des dernières
+# requêtes, d'où sont tirés les percentiles p50/p95/p99.
+#
+# Chaque processus tient ses mesures en mémoire et les recopie régulièrement
+# dans une base SQLite partagée : /metrics et la page d'administration
+# additionnent les mesures de tous les workers. Les requêtes plus lentes que
+# le seuil configuré sont ajoutées à un journal (une ligne JSON par requête).
+import collections
+import json
+import os
+import sqlite3
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Bornes des classes de l'histogramme des durées (secondes)
+BORNES = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Nombre de durées gardées par route pour le calcul des percentiles
+TAILLE_ECHANTILLON = 500
+
+# Mesures additionnées par route, en plus de la durée : (nom, description)
+CUMULS = (
+    ('load_data', "Temps passé dans load_data (secondes)"),
+    ('save_data', "Temps passé dans save_data (secondes)"),
+    ('octets_lus', "Octets lus par le stockage"),
+    ('octets_ecrits', "Octets écrits par le stockage"),
+    ('rendu', "Temps de rendu des templates (secondes)"),
+    ('parcours', "Parcours complets de collections"),
+    ('lentes', "Requêtes plus lentes que le seuil")
+)
+
+
+# Valeur du percentile `p` (0-100) d'une liste triée (rang le plus proche)
+def percentile(valeurs, p):
+    if not valeurs:
+        return None
+    rang = max(int(round(p / 100 * len(valeurs) + 0.5)) - 1, 0)
+    return valeurs[min(rang, len(valeurs) - 1)]
+
+
+class MesureRequete:
+    """Mesures d'une requête en cours, complétées par les fonctions instrumentées."""
+
+    def __init__(self):
+        self.debut = time.perf_counter()
+        self.cumuls = {nom: 0 for nom, _ in CUMULS if nom != 'lentes'}
+
+
+class MesuresRequetes:
+    """Mesures par route des requêtes de ce processus, partagées par `chemin_base`.
+
+    `seuil_lent` (secondes) : les requêtes plus longues sont écrites dans
+    `chemin_journal`.
+    """
+
+    def __init__(self, chemin_base, chemin_journal, seuil_lent=1.0, taille_journal=5 * 1024 * 1024):
+        self.chemin_base = chemin_base
+        self.chemin_journal = chemin_journal
+        self.seuil_lent = seuil_lent
+        self.taille_journal = taille_journal
+        self._courante = threading.local()
+        self._local = threading.local()
+        self._verrou = threading.Lock()
+        # route -> {'nombre', 'duree', 'classes': [...], cumuls..., 'echantillon': deque}
+        self._routes = {}
+
+    def _connexion(self):
+        connexion = getattr(self._local, 'connexion', None)
+        if connexion is None:
+            os.makedirs(os.path.dirname(self.chemin_base) or '.', exist_ok=True)
+            connexion = sqlite3.connect(self.chemin_base, timeout=30, isolation_level=None)
+            connexion.execute('PRAGMA journal_mode=WAL')
+            connexion.execute(
+                'CREATE TABLE IF NOT EXISTS mesures ('
+                'processus INTEGER PRIMARY KEY, maj REAL NOT NULL, routes TEXT NOT NULL)'
+            )
+            self._local.connexion = connexion
+        return connexion
+
+    # Début de la mesure d'une requête dans le thread courant
+    def debut(self):
+        self._courante.mesure = MesureRequete()
+
+    # Ajoute `valeur` à une mesure de la requête en cours (sans effet hors requête)
+    def ajouter(self, nom, valeur):
+        mesure = getattr(self._courante, 'mesure', None)
+        if mesure is not None:
+            mesure.cumuls[nom] += valeur
+
+    # Termine la mesure de la requête en cours ; retourne sa durée (ou None)
+    def fin(self, route, methode='', chemin='', statut=None):
+        mesure = getattr(self._courante, 'mesure', None)
+        if mesure is None:
+            return None
+        self._courante.mesure = None
+        duree = time.perf_counter() - mesure.debut
+        lente = self.seuil_lent is not None and duree >= self.seuil_lent
+        with self._verrou:
+            donnees = self._routes.get(route)
+            if donnees is None:
+                donnees = self._routes[route] = {
+                    'nombre': 0, 'duree': 0.0, 'classes': [0] * (len(BORNES) + 1),
+                    **{nom: 0 for nom, _ in CUMULS},
+                    'echantillon': collections.deque(maxlen=TAILLE_ECHANTILLON)
+                }
+            donnees['nombre'] += 1
+            donnees['duree'] += duree
+            classe = 0
+            while classe < len(BORNES) and duree > BORNES[classe]:
+                classe += 1
+            donnees['classes'][classe] += 1
+            for nom, valeur in mesure.cumuls.items():
+                donnees[nom] += valeur
+            donnees['lentes'] += lente
+            donnees['echantillon'].append(duree)
+        if lente:
+            self._journaliser({
+                'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+                'route': route, 'methode': methode, 'chemin': chemin, 'statut': statut,
+                'duree': round(duree, 4), 'processus': os.getpid(),
+                **{nom: round(valeur, 4) if isinstance(valeur, float) else valeur
+                   for nom, valeur in mesure.cumuls.items()}
+            })
+        return duree
+
+    def _journaliser(self, entree):
+        logger.warning("Requête lente : %s %s (%.0f ms)", entree['methode'], entree['chemin'],
+                       entree['duree'] * 1000)
+        try:
+            os.makedirs(os.path.dirname(self.chemin_journal) or '.', exist_ok=True)
+            if os.path.exists(self.chemin_journal) and os.path.getsize(self.chemin_journal) > self.taille_journal:
+                os.replace(self.chemin_journal, self.chemin_journal + '.1')
+            with open(self.chemin_journal, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entree, ensure_ascii=False) + '\n')
+        except OSError as e:
+            logger.warning("Journal des requêtes lentes non écrit : %s", e)
+
+    # Dernières requêtes lentes (tous processus), les plus récentes d'abord
+    def requetes_lentes(self, limite=50):
+        try:
+            with open(self.chemin_journal, 'rb') as f:
+                f.seek(0, os.SEEK_END)
+                f.seek(max(f.tell() - 256 * 1024, 0))
+                lignes = f.read().decode('utf-8', errors='replace').splitlines()
+        except FileNotFoundError:
+            return []
+        entrees = []
+        for ligne in reversed(lignes):
+            try:
+                entrees.append(json.loads(ligne))
+            except ValueError:
+                # Première ligne coupée par la lecture de la fin du fichier
+                continue
+            if len(entrees) >= limite:
+                break
+        return entrees
+
+    # Recopie les mesures de ce processus dans la base partagée
+    def publier(self):
+        with self._verrou:
+            routes = {route: {**donnees, 'classes': list(donnees['classes']),
+                              'echantillon': list(donnees['echantillon'])}
+                      for route, donnees in self._routes.items()}
+        try:
+            connexion = self._connexion()
+            with connexion:
+                connexion.execute('BEGIN IMMEDIATE')
+                connexion.execute('INSERT OR REPLACE INTO mesures VALUES (?, ?, ?)',
+                                  (os.getpid(), time.time(), json.dumps(routes)))
+                # Processus arrêtés depuis plus d'une heure
+                connexion.execute('DELETE FROM mesures WHERE maj < ?', (time.time() - 3600,))
+        except sqlite3.Error as e:
+            logger.warning("Mesures des requêtes non publiées : %s", e)
+
+    # Mesures de tous les processus, additionnées par route
+    def routes(self):
+        self.publier()
+        try:
+            lignes = self._connexion().execute('SELECT routes FROM mesures').fetchall()
+        except sqlite3.Error as e:
+            logger.warning("Mesures des requêtes illisibles : %s", e)
+            return {}
+        resultat = {}
+        for (texte,) in lignes:
+            for route, donnees in json.loads(texte).items():
+                total = resultat.get(route)
+                if total is None:
+                    resultat[route] = {**donnees, 'echantillon': list(donnees['echantillon'])}
+                    continue
+                for nom, valeur in donnees.items():
+                    if nom == 'classes':
+                        total[nom] = [a + b for a, b in zip(total[nom], valeur)]
+                    elif nom == 'echantillon':
+                        total[nom].extend(valeur)
+                    else:
+                        total[nom] += valeur
+        return resultat
+
+    # Résumé par route, les plus lentes (p95) d'abord :
+    #     [{'route', 'nombre', 'moyenne', 'p50', 'p95', 'p99', 'lentes', et la moyenne
+    #       par requête de load_data, save_data, octets_lus, octets_ecrits, rendu, parcours}, ...]
+    def resume(self):
+        resultat = []
+        for route, donnees in self.routes().items():
+            nombre = donnees['nombre']
+            echantillon = sorted(donnees['echantillon'])
+            resultat.append({
+                'route': route,
+                'nombre': nombre,
+                'moyenne': donnees['duree'] / nombre,
+                'p50': percentile(echantillon, 50),
+                'p95': percentile(echantillon, 95),
+                'p99': percentile(echantillon, 99),
+                'lentes': donnees['lentes'],
+                **{nom: donnees[nom] / nombre for nom, _ in CUMULS if nom != 'lentes'}
+            })
+        resultat.sort(key=lambda ligne: ligne['p95'] or 0, reverse=True)
+        return resultat
+
+    # Mesures au format texte de Prometheus
+    def prometheus(self, prefixe='sobeca'):
+        routes = self.routes()
+        lignes = [
+            f'# HELP {prefixe}_requete_duree_secondes Durée des requêtes par route',
+            f'# TYPE {prefixe}_requete_duree_secondes histogram'
+        ]
+        for route, donnees in sorted(routes.items()):
+            etiquette = _etiquette(route)
+            cumul = 0
+            for borne, nombre in zip(BORNES + ('+Inf',), donnees['classes']):
+                cumul += nombre
+                lignes.append(f'{prefixe}_requete_duree_secondes_bucket{{route="{etiquette}",le="{borne}"}} {cumul}')
+            lignes.append(f'{prefixe}_requete_duree_secondes_sum{{route="{etiquette}"}} {donnees["duree"]}')
+            lignes.append(f'{prefixe}_requete_duree_secondes_count{{route="{etiquette}"}} {donnees["nombre"]}')
+        for nom, description in CUMULS:
+            metrique = f'{prefixe}_{nom}_total'
+            lignes.append(f'# HELP {metrique} {description}')
+            lignes.append(f'# TYPE {metrique} counter')
+            for route, donnees in sorted(routes.items()):
+                lignes.append(f'{metrique}{{route="{_etiquette(route)}"}} {donnees[nom]}')
+        return '\n'.join(lignes) + '\n'
+
+
+def _etiquette(valeur):
+    return str(valeur).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
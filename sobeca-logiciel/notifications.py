@@ -0,0 +1,172 @@
+# Notifications en temps réel de l'application Garage Sobeca
+#
+# Les notifications (nouveau message, message lu, compteur de non lus) sont
+# écrites dans une table SQLite partagée par tous les processus (workers
+# gunicorn). Dans chaque processus, un fil d'écoute lit les lignes ajoutées
+# depuis sa dernière lecture et les distribue aux abonnés de ce processus
+# (un flux Server-Sent Events par onglet ouvert). PRAGMA data_version permet
+# de savoir sans lire la table si un autre processus y a écrit.
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Abonnement:
+    """Notifications destinées à un utilisateur, reçues par un flux."""
+
+    def __init__(self, canal, utilisateur):
+        self.canal = canal
+        self.utilisateur = utilisateur
+        self.file = queue.Queue(maxsize=1000)
+
+    # Prochaine notification {'n', 'type', 'donnees'}, ou None après `delai` secondes
+    def attendre(self, delai):
+        try:
+            return self.file.get(timeout=delai)
+        except queue.Empty:
+            return None
+
+    def fermer(self):
+        self.canal.desabonner(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.fermer()
+        return False
+
+
+class CanalNotifications:
+    """Publication et distribution des notifications par utilisateur.
+
+    `intervalle` est le délai maximal (en secondes) avant qu'une notification
+    publiée par un autre processus soit distribuée ; celles publiées par ce
+    processus le sont immédiatement. Les notifications de plus de
+    `conservation` secondes sont supprimées.
+    """
+
+    def __init__(self, chemin_base, intervalle=0.5, conservation=600):
+        self.chemin_base = chemin_base
+        self.intervalle = intervalle
+        self.conservation = conservation
+        self._local = threading.local()
+        self._verrou = threading.Lock()
+        self._abonnes = {}
+        self._reveil = threading.Event()
+        self._ecoute = None
+        self._dernier = None
+        self._purge = 0
+
+    def _connexion(self):
+        connexion = getattr(self._local, 'connexion', None)
+        if connexion is None:
+            os.makedirs(os.path.dirname(self.chemin_base) or '.', exist_ok=True)
+            connexion = sqlite3.connect(self.chemin_base, timeout=30, isolation_level=None)
+            connexion.execute('PRAGMA journal_mode=WAL')
+            connexion.execute('PRAGMA synchronous=NORMAL')
+            connexion.execute(
+                'CREATE TABLE IF NOT EXISTS notifications ('
+                'n INTEGER PRIMARY KEY AUTOINCREMENT, utilisateur TEXT NOT NULL, '
+                'type TEXT NOT NULL, donnees TEXT NOT NULL, cree REAL NOT NULL)'
+            )
+            self._local.connexion = connexion
+        return connexion
+
+    # Numéro de la dernière notification publiée (0 si aucune)
+    def dernier(self):
+        ligne = self._connexion().execute('SELECT MAX(n) FROM notifications').fetchone()
+        return ligne[0] or 0
+
+    # Publie une notification pour chacun des `utilisateurs`
+    def publier(self, utilisateurs, type_notification, donnees):
+        utilisateurs = list(dict.fromkeys(utilisateurs))
+        if not utilisateurs:
+            return
+        maintenant = time.time()
+        texte = json.dumps(donnees, ensure_ascii=False)
+        try:
+            connexion = self._connexion()
+            with connexion:
+                connexion.execute('BEGIN IMMEDIATE')
+                connexion.executemany(
+                    'INSERT INTO notifications (utilisateur, type, donnees, cree) VALUES (?, ?, ?, ?)',
+                    [(utilisateur, type_notification, texte, maintenant) for utilisateur in utilisateurs]
+                )
+                if maintenant - self._purge > 60:
+                    connexion.execute('DELETE FROM notifications WHERE cree < ?',
+                                      (maintenant - self.conservation,))
+                    self._purge = maintenant
+        except sqlite3.Error as e:
+            # Les clients recevront l'information au prochain rafraîchissement
+            logger.warning("Notification %s non publiée : %s", type_notification, e)
+            return
+        self._reveil.set()
+
+    # Notifications de l'utilisateur publiées après la notification `curseur`
+    def depuis(self, utilisateur, curseur):
+        lignes = self._connexion().execute(
+            'SELECT n, type, donnees FROM notifications WHERE utilisateur = ? AND n > ? ORDER BY n',
+            (utilisateur, curseur)
+        ).fetchall()
+        return [{'n': n, 'type': type_notification, 'donnees': json.loads(donnees)}
+                for n, type_notification, donnees in lignes]
+
+    def abonner(self, utilisateur):
+        abonnement = Abonnement(self, utilisateur)
+        with self._verrou:
+            if self._dernier is None:
+                self._dernier = self.dernier()
+            self._abonnes.setdefault(utilisateur, set()).add(abonnement)
+            if self._ecoute is None or not self._ecoute.is_alive():
+                self._ecoute = threading.Thread(target=self._ecouter, name='notifications', daemon=True)
+                self._ecoute.start()
+        return abonnement
+
+    def desabonner(self, abonnement):
+        with self._verrou:
+            abonnements = self._abonnes.get(abonnement.utilisateur)
+            if abonnements is not None:
+                abonnements.discard(abonnement)
+                if not abonnements:
+                    del self._abonnes[abonnement.utilisateur]
+
+    # Fil d'écoute : distribue les nouvelles lignes aux abonnés de ce processus
+    def _ecouter(self):
+        version = None
+        while True:
+            reveille = self._reveil.wait(self.intervalle)
+            self._reveil.clear()
+            try:
+                connexion = self._connexion()
+                # data_version change lorsqu'une autre connexion a écrit dans la base
+                actuelle = connexion.execute('PRAGMA data_version').fetchone()[0]
+                if not reveille and actuelle == version:
+                    continue
+                version = actuelle
+                lignes = connexion.execute(
+                    'SELECT n, utilisateur, type, donnees FROM notifications WHERE n > ? ORDER BY n',
+                    (self._dernier,)
+                ).fetchall()
+            except sqlite3.Error as e:
+                logger.warning("Lecture des notifications impossible : %s", e)
+                continue
+            for n, utilisateur, type_notification, donnees in lignes:
+                self._dernier = n
+                with self._verrou:
+                    abonnements = list(self._abonnes.get(utilisateur, ()))
+                if not abonnements:
+                    continue
+                notification = {'n': n, 'type': type_notification, 'donnees': json.loads(donnees)}
+                for abonnement in abonnements:
+                    try:
+                        abonnement.file.put_nowait(notification)
+                    except queue.Full:
+                        # Client qui ne lit plus : il se resynchronisera à la reconnexion
+                        pass
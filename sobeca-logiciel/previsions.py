@@ -0,0 +1,190 @@
+# Prévisions de consommation des pièces et dates de rupture de stock
+#
+# La consommation de chaque pièce est tirée des sorties des `fenetre` derniers
+# jours, rangées en une matrice pièces × jours (NumPy) remplie en une passe.
+# Deux taux journaliers sont calculés pour toutes les pièces à la fois :
+#   - "moyenne" : consommation moyenne des `jours_moyenne` derniers jours ;
+#   - "exponentielle" : moyenne de la fenêtre pondérée par (1 - alpha)^âge du
+#     jour, qui suit plus vite un changement de rythme.
+# La rupture est prévue dans quantité / taux jours. Une pièce est à commander
+# lorsque sa rupture tombe avant la fin du délai de réapprovisionnement, ou
+# lorsqu'elle est sous sa quantité minimale ; la quantité suggérée couvre le
+# délai et `couverture` jours de consommation, plus la quantité minimale.
+#
+# Les taux sont recalculés hors des requêtes par une tâche planifiée ; les
+# dates de rupture sont tirées des taux et des quantités actuelles à chaque
+# lecture. NumPy est nécessaire (requirements.txt) : sans lui, les prévisions
+# sont désactivées et le reste de l'application fonctionne normalement.
+import threading
+import time
+import logging
+from datetime import date, timedelta
+
+from registre import quantite_piece
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+logger = logging.getLogger(__name__)
+
+METHODES = ('moyenne', 'exponentielle')
+
+# Au-delà de cet horizon (ou sous ce taux journalier), aucune rupture n'est prévue : une seule
+# sortie ancienne donne un taux exponentiel infime et une rupture dans des millions de jours
+HORIZON_JOURS = 3 * 365
+TAUX_MINIMUM = 1e-6
+
+
+def _jours(dates):
+    """Dates 'AAAA-MM-JJ' en tableau de jours (NaT pour les dates invalides)."""
+    try:
+        return np.array(dates, dtype='datetime64[D]')
+    except ValueError:
+        jours = []
+        for valeur in dates:
+            try:
+                jours.append(np.datetime64(valeur, 'D'))
+            except ValueError:
+                jours.append(np.datetime64('NaT'))
+        return np.array(jours, dtype='datetime64[D]')
+
+
+class PrevisionsStock:
+    """Taux de consommation et dates de rupture prévues de toutes les pièces.
+
+    `charger` retourne la collection partagée d'un fichier (load_data en
+    lecture seule) ; `delai` est le délai de réapprovisionnement (jours).
+    """
+
+    def __init__(self, charger, chemin_stock, chemin_sorties, methode='exponentielle', fenetre=90,
+                 jours_moyenne=30, alpha=0.1, delai=14, couverture=30):
+        if methode not in METHODES:
+            raise ValueError(f"Méthode de prévision inconnue : {methode}")
+        self._charger = charger
+        self.chemin_stock = chemin_stock
+        self.chemin_sorties = chemin_sorties
+        self.methode = methode
+        self.fenetre = fenetre
+        self.jours_moyenne = min(jours_moyenne, fenetre)
+        self.alpha = alpha
+        self.delai = delai
+        self.couverture = couverture
+        self._verrou = threading.Lock()
+        # (collection du stock, collection des sorties, jour) du dernier calcul
+        self._source = None
+        self.calcul = None
+        # id de la pièce -> rang dans les tableaux ci-dessous
+        self._rangs = {}
+        self._moyenne = None
+        self._exponentielle = None
+
+    @property
+    def disponible(self):
+        return np is not None
+
+    # Recalcule les taux si le stock, les sorties ou le jour ont changé ; retourne le nombre de pièces
+    def rafraichir(self, aujourd_hui=None):
+        if np is None:
+            return 0
+        aujourd_hui = aujourd_hui or date.today()
+        stock = self._charger(self.chemin_stock)
+        sorties = self._charger(self.chemin_sorties)
+        with self._verrou:
+            if self._source is not None and stock is self._source[0] and sorties is self._source[1] \
+                    and aujourd_hui == self._source[2]:
+                return len(self._rangs)
+            debut = time.perf_counter()
+            rangs = {}
+            for piece in stock:
+                if piece.get('id') is not None:
+                    rangs.setdefault(piece['id'], len(rangs))
+            consommation = self._consommation(rangs, sorties, aujourd_hui)
+            self._moyenne = consommation[:, -self.jours_moyenne:].sum(axis=1) / self.jours_moyenne
+            # Poids (1 - alpha)^âge : le jour le plus récent (âge 0) pèse le plus
+            poids = (1 - self.alpha) ** np.arange(self.fenetre - 1, -1, -1)
+            self._exponentielle = consommation @ poids / poids.sum()
+            self._rangs = rangs
+            self._source = (stock, sorties, aujourd_hui)
+            self.calcul = time.time()
+            logger.debug("Prévisions de %d pièces calculées en %.0f ms", len(rangs),
+                         (time.perf_counter() - debut) * 1000)
+            return len(rangs)
+
+    # Matrice pièces × jours des quantités sorties sur la fenêtre (dernier jour : aujourd'hui)
+    def _consommation(self, rangs, sorties, aujourd_hui):
+        lignes, dates, quantites = [], [], []
+        for sortie in sorties:
+            rang = rangs.get(sortie.get('piece_id'))
+            if rang is None:
+                continue
+            lignes.append(rang)
+            dates.append(str(sortie.get('date_sortie') or '')[:10] or 'NaT')
+            quantites.append(quantite_piece(sortie.get('quantite')))
+        lignes = np.array(lignes, dtype=np.int64)
+        quantites = np.array(quantites, dtype=np.float64)
+        age = (np.datetime64(aujourd_hui, 'D') - _jours(dates)).astype('timedelta64[D]')
+        valides = ~np.isnat(age)
+        age = age.astype(np.int64)
+        valides &= (age >= 0) & (age < self.fenetre)
+        colonnes = self.fenetre - 1 - age[valides]
+        cases = lignes[valides] * self.fenetre + colonnes
+        return np.bincount(cases, weights=quantites[valides],
+                           minlength=len(rangs) * self.fenetre).reshape(len(rangs), self.fenetre)
+
+    # Prévisions des pièces données (toutes celles du stock par défaut), d'après leurs quantités actuelles :
+    #     [{'piece', 'conso_moyenne', 'conso_exponentielle', 'taux', 'jours_restants' (None si aucune
+    #       rupture n'est prévue d'ici HORIZON_JOURS), 'date_rupture', 'a_commander', 'quantite_suggeree'}, ...]
+    def previsions(self, pieces=None, aujourd_hui=None):
+        if np is None:
+            return []
+        aujourd_hui = aujourd_hui or date.today()
+        if self._source is None:
+            # Premier accès avant la tâche planifiée
+            self.rafraichir(aujourd_hui)
+        if pieces is None:
+            pieces = self._charger(self.chemin_stock)
+        pieces = list(pieces)
+        with self._verrou:
+            rangs = np.fromiter((self._rangs.get(piece.get('id'), -1) for piece in pieces),
+                                dtype=np.int64, count=len(pieces))
+            # Pièces créées depuis le dernier calcul : pas encore de consommation
+            connues = rangs >= 0
+            moyenne, exponentielle = np.zeros(len(pieces)), np.zeros(len(pieces))
+            moyenne[connues] = self._moyenne[rangs[connues]]
+            exponentielle[connues] = self._exponentielle[rangs[connues]]
+        taux = exponentielle if self.methode == 'exponentielle' else moyenne
+        quantites = np.fromiter((quantite_piece(piece.get('quantite')) for piece in pieces), dtype=np.float64,
+                                count=len(pieces))
+        minimums = np.fromiter((quantite_piece(piece.get('quantite_min')) for piece in pieces), dtype=np.float64,
+                               count=len(pieces))
+        jours = np.divide(np.maximum(quantites, 0), taux, out=np.full(len(pieces), np.inf),
+                          where=taux > TAUX_MINIMUM)
+        prevue = jours <= HORIZON_JOURS
+        a_commander = (jours <= self.delai) | (quantites < minimums)
+        suggestion = np.maximum(np.ceil(taux * (self.delai + self.couverture)) + minimums - quantites, 0)
+        suggestion = np.where(a_commander, suggestion, 0)
+
+        resultat = []
+        for i, piece in enumerate(pieces):
+            jours_restants = int(jours[i]) if prevue[i] else None
+            resultat.append({
+                'piece': piece,
+                'conso_moyenne': round(float(moyenne[i]), 3),
+                'conso_exponentielle': round(float(exponentielle[i]), 3),
+                'taux': round(float(taux[i]), 3),
+                'jours_restants': jours_restants,
+                'date_rupture': (aujourd_hui + timedelta(days=jours_restants)).isoformat()
+                                if jours_restants is not None else None,
+                'a_commander': bool(a_commander[i]),
+                'quantite_suggeree': int(suggestion[i])
+            })
+        return resultat
+
+    # Pièces à commander, les ruptures les plus proches d'abord
+    def a_commander(self, aujourd_hui=None):
+        lignes = [ligne for ligne in self.previsions(aujourd_hui=aujourd_hui) if ligne['a_commander']]
+        lignes.sort(key=lambda ligne: (ligne['jours_restants'] is None, ligne['jours_restants'] or 0,
+                                       str(ligne['piece'].get('nom', ''))))
+        return lignes
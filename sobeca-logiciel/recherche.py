@@ -0,0 +1,192 @@
+# Index de recherche plein texte de l'application Garage Sobeca
+#
+# Index inversé en mémoire : chaque mot (sans accents, en minuscules) renvoie
+# aux documents qui le contiennent. Les mots distincts sont gardés triés, ce
+# qui permet de retrouver par dichotomie tous ceux qui commencent par un
+# préfixe ("renau" trouve "Renault"). L'index suit les collections du cache :
+# lorsqu'une collection a été réécrite (par ce processus ou un autre), seuls
+# les documents dont les champs indexés ont changé sont réindexés.
+import bisect
+import heapq
+import re
+import threading
+import unicodedata
+
+_MOTS = re.compile(r'[a-z0-9]+')
+_ACCENTS = re.compile('[\u0300-\u036f]')
+_LIGATURES = str.maketrans({'œ': 'oe', 'æ': 'ae'})
+
+# Longueur minimale d'un terme pour chercher les mots qui commencent par lui
+LONGUEUR_PREFIXE = 2
+
+
+# Texte sans accents et en minuscules ("Électricité" -> "electricite")
+def normaliser(texte):
+    texte = str(texte)
+    if texte.isascii():
+        return texte.lower()
+    # Décomposition (é -> e + accent) puis suppression des accents
+    texte = _ACCENTS.sub('', unicodedata.normalize('NFKD', texte))
+    return texte.casefold().translate(_LIGATURES)
+
+
+def mots(texte):
+    return _MOTS.findall(normaliser(texte))
+
+
+class _IndexType:
+    """Index inversé des documents d'un même type."""
+
+    def __init__(self, chemin, champs, identifiants):
+        self.chemin = chemin
+        self.champs = champs
+        self.identifiants = identifiants
+        # Collection indexée et valeurs de ses champs indexés, par id
+        self.collection = None
+        self.valeurs = {}
+        # id -> mots du document ; mot -> ids ; mots distincts triés
+        self.documents = {}
+        self.postings = {}
+        self.mots = []
+
+    def mots_document(self, valeurs):
+        resultat = set()
+        for champ, valeur in zip(self.champs, valeurs):
+            if valeur is None or valeur == '':
+                continue
+            trouves = mots(valeur)
+            resultat.update(trouves)
+            if champ in self.identifiants and len(trouves) > 1:
+                resultat.add(''.join(trouves))
+        return frozenset(resultat)
+
+    def indexer(self, identifiant, nouveaux):
+        anciens = self.documents.get(identifiant, frozenset())
+        for mot in anciens - nouveaux:
+            documents = self.postings[mot]
+            documents.discard(identifiant)
+            if not documents:
+                del self.postings[mot]
+                del self.mots[bisect.bisect_left(self.mots, mot)]
+        for mot in nouveaux - anciens:
+            documents = self.postings.get(mot)
+            if documents is None:
+                documents = self.postings[mot] = set()
+                bisect.insort(self.mots, mot)
+            documents.add(identifiant)
+        if nouveaux:
+            self.documents[identifiant] = nouveaux
+        else:
+            self.documents.pop(identifiant, None)
+
+    # Réindexe les documents dont les champs indexés ont changé
+    def rafraichir(self, collection):
+        if collection is self.collection:
+            return
+        if not self.documents:
+            self._construire(collection)
+            return
+        anciennes = self.valeurs
+        valeurs = {}
+        for element in collection:
+            identifiant = element.get('id') if isinstance(element, dict) else None
+            if identifiant is None:
+                continue
+            valeurs_element = tuple(element.get(champ) for champ in self.champs)
+            valeurs[identifiant] = valeurs_element
+            if anciennes.get(identifiant) != valeurs_element:
+                self.indexer(identifiant, self.mots_document(valeurs_element))
+        for identifiant in anciennes.keys() - valeurs.keys():
+            self.indexer(identifiant, frozenset())
+        self.valeurs = valeurs
+        self.collection = collection
+
+    # Première construction : les mots distincts sont triés une seule fois
+    def _construire(self, collection):
+        self.valeurs = {}
+        for element in collection:
+            identifiant = element.get('id') if isinstance(element, dict) else None
+            if identifiant is None:
+                continue
+            valeurs_element = tuple(element.get(champ) for champ in self.champs)
+            self.valeurs[identifiant] = valeurs_element
+            mots_element = self.mots_document(valeurs_element)
+            if not mots_element:
+                continue
+            self.documents[identifiant] = mots_element
+            for mot in mots_element:
+                documents = self.postings.get(mot)
+                if documents is None:
+                    documents = self.postings[mot] = set()
+                documents.add(identifiant)
+        self.mots = sorted(self.postings)
+        self.collection = collection
+
+    # Documents contenant un mot qui commence par `terme`
+    def prefixe(self, terme):
+        if len(terme) < LONGUEUR_PREFIXE:
+            return self.postings.get(terme, set())
+        resultat = set()
+        position = bisect.bisect_left(self.mots, terme)
+        while position < len(self.mots) and self.mots[position].startswith(terme):
+            resultat |= self.postings[self.mots[position]]
+            position += 1
+        return resultat
+
+    # Au plus `limite` ids contenant tous les termes, ceux où ils sont des mots entiers d'abord
+    def rechercher(self, termes, limite):
+        candidats = None
+        for terme in termes:
+            trouves = self.prefixe(terme)
+            candidats = set(trouves) if candidats is None else candidats & trouves
+            if not candidats:
+                return []
+        exacts = candidats
+        for terme in termes:
+            exacts = exacts & self.postings.get(terme, set())
+        resultat = heapq.nsmallest(limite, exacts, key=str)
+        if len(resultat) < limite:
+            resultat += heapq.nsmallest(limite - len(resultat), candidats - exacts, key=str)
+        return resultat
+
+
+class IndexRecherche:
+    """Recherche par mots et préfixes dans plusieurs collections.
+
+    `charger` retourne la collection partagée d'un fichier (load_data en
+    lecture seule) : tant qu'elle n'a pas changé, le cache rend le même objet
+    et l'index n'a rien à vérifier.
+    """
+
+    def __init__(self, charger):
+        self._charger = charger
+        self._types = {}
+        self._verrou = threading.Lock()
+
+    # Déclare une collection à indexer ; les mots des champs `identifiants`
+    # sont aussi indexés accolés ("AB-123-CD" est trouvé par "ab123")
+    def ajouter_source(self, type_document, chemin, champs, identifiants=()):
+        self._types[type_document] = _IndexType(chemin, tuple(champs), frozenset(identifiants))
+
+    # Met l'index de chaque collection à jour (sans attendre la prochaine recherche)
+    def rafraichir(self):
+        with self._verrou:
+            for index in self._types.values():
+                index.rafraichir(self._charger(index.chemin))
+
+    # Recherche tous les termes de `texte` (chacun comme début d'un mot)
+    #
+    # Retourne au plus `limite` résultats par type : [{'type', 'id', 'element'}, ...]
+    def rechercher(self, texte, limite=10):
+        termes = sorted(set(mots(texte)), key=len, reverse=True)
+        if not termes:
+            return []
+        resultats = []
+        with self._verrou:
+            for type_document, index in self._types.items():
+                index.rafraichir(self._charger(index.chemin))
+                for identifiant in index.rechercher(termes, limite):
+                    element = index.collection.obtenir(identifiant)
+                    if element is not None:
+                        resultats.append({'type': type_document, 'id': identifiant, 'element': element})
+        return resultats
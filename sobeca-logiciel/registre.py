@@ -0,0 +1,153 @@
+# Registre de valorisation du stock (coût moyen pondéré)
+#
+# Chaque pièce porte son coût moyen pondéré ("cout_moyen") à côté de son prix
+# d'achat. Les mouvements passent par entree(), sortie() et ajuster() :
+#   - une entrée au prix p fait passer le coût moyen de c à
+#     (quantité × c + entrée × p) / (quantité + entrée) ;
+#   - une sortie retire des pièces au coût moyen, qui ne change pas.
+# La valeur d'une pièce est donc quantité × coût moyen ; une pièce sans coût
+# moyen (créée avant le registre) est valorisée à son prix d'achat.
+#
+# RegistreStock tient à jour, d'après la collection du stock, la valeur et
+# le nombre de pièces (en stock faible, en rupture) au total et par
+# fournisseur : seules les pièces modifiées depuis la dernière lecture sont
+# recomptées. Les mouvements récents d'une pièce sont lus dans les index par
+# pièce des sorties et de l'historique du stock.
+import heapq
+import itertools
+import threading
+
+
+# Quantité enregistrée comme nombre ou comme texte ("5") ; 0 si elle est absente ou invalide
+def quantite_piece(valeur):
+    try:
+        return int(valeur or 0)
+    except (ValueError, TypeError):
+        return 0
+
+
+# Coût unitaire d'une pièce dans le registre
+def cout_unitaire(piece):
+    cout = piece.get('cout_moyen')
+    if cout is None:
+        cout = piece.get('prix_achat') or 0
+    return float(cout)
+
+
+# Entrée de `quantite` pièces au prix unitaire `prix` (coût moyen actuel par défaut)
+def entree(piece, quantite, prix=None):
+    stock = quantite_piece(piece.get('quantite'))
+    cout = cout_unitaire(piece)
+    prix = cout if prix is None else float(prix)
+    total = stock + quantite
+    if total > 0 and stock > 0:
+        piece['cout_moyen'] = round((stock * cout + quantite * prix) / total, 4)
+    else:
+        # Stock vide (ou négatif) : les pièces restantes sont celles de l'entrée
+        piece['cout_moyen'] = round(prix, 4)
+    piece['quantite'] = total
+
+
+# Sortie de `quantite` pièces ; retourne le coût unitaire de la sortie
+def sortie(piece, quantite):
+    cout = cout_unitaire(piece)
+    piece.setdefault('cout_moyen', round(cout, 4))
+    piece['quantite'] = quantite_piece(piece.get('quantite')) - quantite
+    return cout
+
+
+# Porte la quantité à `nouvelle_quantite` (inventaire, correction) ; un surplus entre au prix `prix`
+def ajuster(piece, nouvelle_quantite, prix=None):
+    ecart = nouvelle_quantite - quantite_piece(piece.get('quantite'))
+    if ecart > 0:
+        entree(piece, ecart, prix)
+    else:
+        sortie(piece, -ecart)
+    return ecart
+
+
+# Stock faible : quantité sous la quantité minimale de la pièce
+def en_stock_faible(piece):
+    return quantite_piece(piece.get('quantite')) < quantite_piece(piece.get('quantite_min'))
+
+
+class RegistreStock:
+    """Valeur et état du stock au total et par fournisseur, tenus à jour d'après le stock.
+
+    `charger` retourne la collection partagée d'un fichier (load_data en
+    lecture seule).
+    """
+
+    def __init__(self, charger, chemin_stock, chemin_sorties, chemin_historique):
+        self._charger = charger
+        self.chemin_stock = chemin_stock
+        self.chemin_sorties = chemin_sorties
+        self.chemin_historique = chemin_historique
+        self._verrou = threading.Lock()
+        self._stock = None
+        # id de la pièce -> (fournisseur_id, valeur, stock faible, rupture)
+        self._contributions = {}
+        # fournisseur_id (None pour le total) -> [valeur, pièces, en stock faible, en rupture]
+        self._totaux = {}
+
+    @staticmethod
+    def _contribution(piece):
+        quantite = quantite_piece(piece.get('quantite'))
+        return (piece.get('fournisseur_id') or None, quantite * cout_unitaire(piece),
+                en_stock_faible(piece), quantite == 0)
+
+    def _compter(self, contribution, signe):
+        fournisseur_id, valeur, faible, rupture = contribution
+        for cle in {None, fournisseur_id}:
+            totaux = self._totaux.setdefault(cle, [0.0, 0, 0, 0])
+            totaux[0] += signe * valeur
+            totaux[1] += signe
+            totaux[2] += signe * faible
+            totaux[3] += signe * rupture
+            if not totaux[1]:
+                # Repartir de zéro évite de garder les écarts d'arrondi des soustractions
+                del self._totaux[cle]
+
+    # Met les totaux à jour d'après la collection actuelle
+    def rafraichir(self):
+        stock = self._charger(self.chemin_stock)
+        with self._verrou:
+            if stock is self._stock:
+                return
+            presentes = {}
+            for rang, piece in enumerate(stock):
+                cle = piece.get('id')
+                if cle is None or cle in presentes:
+                    cle = ('rang', rang)
+                contribution = presentes[cle] = self._contribution(piece)
+                ancienne = self._contributions.get(cle)
+                if contribution != ancienne:
+                    if ancienne is not None:
+                        self._compter(ancienne, -1)
+                    self._compter(contribution, 1)
+            for cle in self._contributions.keys() - presentes.keys():
+                self._compter(self._contributions[cle], -1)
+            self._contributions = presentes
+            self._stock = stock
+
+    # Valeur et état du stock (d'un fournisseur, ou de tout le stock) :
+    #     {'valeur_stock', 'nombre_pieces', 'stock_faible', 'ruptures'}
+    def totaux(self, fournisseur_id=None):
+        self.rafraichir()
+        with self._verrou:
+            valeur, nombre, faible, rupture = self._totaux.get(fournisseur_id, (0.0, 0, 0, 0))
+        return {'valeur_stock': round(valeur, 2), 'nombre_pieces': nombre,
+                'stock_faible': faible, 'ruptures': rupture}
+
+    # Derniers mouvements d'une pièce (sorties et historique du stock), les plus récents d'abord :
+    #     [{'type': 'sortie' ou le type de l'entrée d'historique, 'date', ...l'enregistrement}, ...]
+    def mouvements(self, piece_id, limite=5):
+        sorties = self._charger(self.chemin_sorties).filtrer('piece_id', piece_id)
+        historique = self._charger(self.chemin_historique).filtrer('piece_id', piece_id)
+        # Les deux collections sont dans l'ordre d'enregistrement : les plus récents sont à la fin
+        recents = heapq.merge(
+            ({**s, 'type': 'sortie', 'date': s.get('date_sortie', '')} for s in reversed(sorties)),
+            ({**h, 'type': h.get('type', 'mouvement'), 'date': h.get('date', '')} for h in reversed(historique)),
+            key=lambda mouvement: mouvement['date'], reverse=True
+        )
+        return list(itertools.islice(recents, limite))
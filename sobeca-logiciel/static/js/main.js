@@ -137,18 +137,20 @@ function markMessageAsRead(messageId) {
 function loadConversationMessages(conversationId) {
     fetch(`/api/messages/${conversationId}`)
         .then(response => response.json())
-        .then(messages => {
+        .then(page => {
+            const messages = page.messages;
             const messageContainer = document.getElementById('messages-container');
             if (messageContainer) {
                 messageContainer.innerHTML = '';
                 messages.forEach(message => {
                     const messageElement = createMessageElement(message);
                     messageContainer.appendChild(messageElement);
-                    if (!message.lu || !message.lu[currentUserId]) {
-                        markMessageAsRead(message.id);
-                    }
                 });
                 messageContainer.scrollTop = messageContainer.scrollHeight;
+                // Marquer le dernier message comme lu marque aussi ceux qui le précèdent
+                if (messages.some(message => !message.lu || !message.lu[currentUserId])) {
+                    markMessageAsRead(messages[messages.length - 1].id);
+                }
             }
         })
         .catch(error => console.error('Erreur:', error));
@@ -211,7 +213,8 @@ document.addEventListener('DOMContentLoaded', function() {
     });
     
     // Ajouter des écouteurs d'événements pour les champs de recherche
-    const searchInputs = document.querySelectorAll('.search-input');
+    // (les listes paginées côté serveur n'ont pas d'attribut data-table)
+    const searchInputs = document.querySelectorAll('.search-input[data-table]');
     searchInputs.forEach(input => {
         input.addEventListener('keyup', function() {
             filterTable(this.id, this.getAttribute('data-table'));
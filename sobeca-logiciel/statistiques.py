@@ -0,0 +1,41 @@
+# Agrégats matérialisés de l'application Garage Sobeca (tableau de bord)
+#
+# Chaque agrégat (nombre d'enregistrements, signalements en attente, pièces en
+# stock faible...) est calculé à partir d'une collection du cache et gardé
+# avec la collection qui a servi au calcul. Tant que la collection n'a pas
+# changé, le cache rend le même objet et la valeur gardée est rendue telle
+# quelle ; après une écriture (par ce processus ou un autre), l'agrégat est
+# recalculé une seule fois, à la lecture suivante.
+
+
+class Agregats:
+    """Valeurs calculées à partir des collections, recalculées lorsqu'elles changent.
+
+    `charger` retourne la collection partagée d'un fichier (load_data en
+    lecture seule).
+    """
+
+    def __init__(self, charger):
+        self._charger = charger
+        self._definitions = {}
+        # nom -> (collection utilisée pour le calcul, valeur)
+        self._valeurs = {}
+
+    # Déclare un agrégat : `calcul(collection)` retourne sa valeur
+    def definir(self, nom, chemin, calcul):
+        self._definitions[nom] = (chemin, calcul)
+        self._valeurs.pop(nom, None)
+
+    def valeur(self, nom):
+        chemin, calcul = self._definitions[nom]
+        collection = self._charger(chemin)
+        memorise = self._valeurs.get(nom)
+        if memorise is not None and memorise[0] is collection:
+            return memorise[1]
+        valeur = calcul(collection)
+        self._valeurs[nom] = (collection, valeur)
+        return valeur
+
+    # Toutes les valeurs (ou celles des noms donnés) : {nom: valeur}
+    def valeurs(self, *noms):
+        return {nom: self.valeur(nom) for nom in (noms or self._definitions)}
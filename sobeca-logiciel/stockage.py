@@ -0,0 +1,1021 @@
+# Couche d'accès aux données de l'application Garage Sobeca
+#
+# Les collections sont stockées soit dans des fichiers JSON (dossier data/),
+# soit dans une base SQLite. Ce module garde chaque collection déjà analysée
+# en mémoire et ne la relit que lorsqu'elle a réellement changé (taille, date
+# de modification ou inode du fichier, numéro de version dans la base), ce qui
+# reste valable lorsque plusieurs processus (workers gunicorn) écrivent dans
+# les mêmes données. Les collections qui ne font que grandir (mouvements de
+# stock) peuvent être tenues en journal d'événements (voir evenements.py).
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+import logging
+
+from evenements import JournalEvenements, ecrire_a_position, remplacer as _remplacer
+
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+_CONTENEURS = (dict, list)
+
+# Compteurs du thread courant, relevés par l'application pour mesurer chaque requête :
+# octets lus et écrits par le stockage, parcours complets de collections
+_compteurs = threading.local()
+
+
+def compteurs_thread():
+    return (getattr(_compteurs, 'octets_lus', 0), getattr(_compteurs, 'octets_ecrits', 0),
+            getattr(_compteurs, 'parcours', 0))
+
+
+def _compter(nom, valeur=1):
+    setattr(_compteurs, nom, getattr(_compteurs, nom, 0) + valeur)
+
+
+# Fonction pour copier une structure JSON (dictionnaires et listes imbriqués)
+# Les valeurs simples (str, int, float, bool, None) sont immuables et partagées.
+def copier(donnees):
+    if isinstance(donnees, list):
+        return [copier_element(element) for element in donnees]
+    return copier_element(donnees)
+
+
+def copier_element(element):
+    if type(element) is dict:
+        copie = element.copy()
+        for cle, valeur in element.items():
+            if type(valeur) in _CONTENEURS:
+                copie[cle] = copier(valeur) if type(valeur) is list else copier_element(valeur)
+        return copie
+    if type(element) is list:
+        return copier(element)
+    return element
+
+
+class Collection(list):
+    """Liste d'enregistrements avec index par champ construits à la demande.
+
+    obtenir(id), filtrer(champ, valeur) et position(champ, valeur, id)
+    répondent en O(1) une fois l'index du champ construit ; trier(champ)
+    garde l'ordre trié par champ.
+
+    Les index sont abandonnés dès que la liste change (ajout, suppression,
+    tri) ; ils ne suivent pas les modifications faites directement dans un
+    enregistrement, à l'exception du champ 'id' qui ne change jamais.
+    """
+
+    def __init__(self, elements=()):
+        super().__init__(elements)
+        self._index = {}
+
+    def copie(self):
+        return Collection(copier(self))
+
+    # Chaque parcours complet est compté (mesures des requêtes)
+    def __iter__(self):
+        _compter('parcours')
+        return list.__iter__(self)
+
+    # Enregistrement dont l'identifiant vaut `identifiant`, ou `defaut`
+    def obtenir(self, identifiant, defaut=None):
+        index = self._index.get('id')
+        if index is None:
+            index = {}
+            for element in self:
+                if 'id' in element:
+                    index.setdefault(element['id'], element)
+            self._index['id'] = index
+        return index.get(identifiant, defaut)
+
+    # Enregistrements dont le champ `champ` vaut `valeur` (dans l'ordre de la liste)
+    def filtrer(self, champ, valeur):
+        cle = ('champ', champ)
+        index = self._index.get(cle)
+        if index is None:
+            index = {}
+            for element in self:
+                try:
+                    index.setdefault(element.get(champ), []).append(element)
+                except TypeError:
+                    # Valeur non hachable (liste, dictionnaire) : non indexée
+                    continue
+            self._index[cle] = index
+        return index.get(valeur, [])
+
+    # Rang de l'enregistrement `identifiant` dans filtrer(champ, valeur), ou None
+    def position(self, champ, valeur, identifiant):
+        cle = ('position', champ, valeur)
+        positions = self._index.get(cle)
+        if positions is None:
+            positions = {element.get('id'): rang for rang, element in enumerate(self.filtrer(champ, valeur))}
+            self._index[cle] = positions
+        return positions.get(identifiant)
+
+    # Enregistrements triés par `champ` (tri stable : l'ordre de la liste départage les égalités)
+    def trier(self, champ, inverse=False):
+        cle = ('tri', champ, inverse)
+        ordre = self._index.get(cle)
+        if ordre is None:
+            ordre = sorted(self, key=lambda element: cle_tri(element.get(champ)), reverse=inverse)
+            self._index[cle] = ordre
+        return ordre
+
+    def _invalider(self):
+        self._index.clear()
+
+    def append(self, element):
+        self._invalider()
+        super().append(element)
+
+    def extend(self, elements):
+        self._invalider()
+        super().extend(elements)
+
+    def insert(self, position, element):
+        self._invalider()
+        super().insert(position, element)
+
+    def remove(self, element):
+        self._invalider()
+        super().remove(element)
+
+    def pop(self, *args):
+        self._invalider()
+        return super().pop(*args)
+
+    def clear(self):
+        self._invalider()
+        super().clear()
+
+    def sort(self, *args, **kwargs):
+        self._invalider()
+        super().sort(*args, **kwargs)
+
+    def reverse(self):
+        self._invalider()
+        super().reverse()
+
+    def __setitem__(self, position, valeur):
+        self._invalider()
+        super().__setitem__(position, valeur)
+
+    def __delitem__(self, position):
+        self._invalider()
+        super().__delitem__(position)
+
+    def __iadd__(self, elements):
+        self._invalider()
+        return super().__iadd__(elements)
+
+
+# Clé de tri tolérante aux valeurs manquantes ou de types différents :
+# valeurs absentes, puis nombres, puis textes (sans tenir compte de la casse)
+def cle_tri(valeur):
+    if valeur is None or valeur == '':
+        return (0, 0)
+    if isinstance(valeur, (int, float)) and not isinstance(valeur, bool):
+        return (1, valeur)
+    return (2, str(valeur).casefold())
+
+
+# Transforme le contenu d'un fichier en Collection lorsqu'il s'agit d'une liste
+def en_collection(donnees):
+    if type(donnees) is list:
+        return Collection(donnees)
+    return donnees
+
+
+# Signature d'un fichier : change dès que son contenu est réécrit
+def signature_fichier(stat):
+    return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+
+class VerrouFichier:
+    """Verrou exclusif entre processus et entre threads, posé sur `<chemin>.lock`."""
+
+    def __init__(self, chemin):
+        self.chemin = chemin
+        self.chemin_verrou = chemin + '.lock'
+        self._fichier = None
+
+    # Avec attendre=False, retourne False sans attendre si le verrou est déjà pris
+    def acquerir(self, attendre=True):
+        os.makedirs(os.path.dirname(self.chemin_verrou) or '.', exist_ok=True)
+        fichier = open(self.chemin_verrou, 'a+b')
+        try:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(fichier.fileno(), fcntl.LOCK_EX if attendre else fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    fichier.close()
+                    return False
+            else:
+                # Windows : msvcrt.locking n'attend que quelques secondes, on réessaie
+                while True:
+                    try:
+                        fichier.seek(0)
+                        msvcrt.locking(fichier.fileno(), msvcrt.LK_NBLCK, 1)
+                        break
+                    except OSError:
+                        if not attendre:
+                            fichier.close()
+                            return False
+                        time.sleep(0.01)
+        except BaseException:
+            fichier.close()
+            raise
+        self._fichier = fichier
+        return True
+
+    def liberer(self):
+        fichier, self._fichier = self._fichier, None
+        if fichier is None:
+            return
+        try:
+            if fcntl is not None:
+                fcntl.flock(fichier.fileno(), fcntl.LOCK_UN)
+            else:
+                fichier.seek(0)
+                msvcrt.locking(fichier.fileno(), msvcrt.LK_UNLCK, 1)
+        finally:
+            fichier.close()
+
+
+# Force l'écriture sur disque d'un fichier déjà fermé ou d'un répertoire (POSIX)
+def _synchroniser_repertoire(repertoire):
+    if os.name != 'posix':
+        return
+    descripteur = os.open(repertoire or '.', os.O_RDONLY)
+    try:
+        os.fsync(descripteur)
+    finally:
+        os.close(descripteur)
+
+
+# Écrit un contenu JSON dans un fichier temporaire voisin, synchronisé sur disque
+def _ecrire_temporaire(chemin, donnees, indent=4):
+    temporaire = f'{chemin}.tmp-{uuid.uuid4().hex}'
+    with open(temporaire, 'w', encoding='utf-8') as f:
+        json.dump(donnees, f, ensure_ascii=False, indent=indent)
+        _compter('octets_ecrits', f.tell())
+        f.flush()
+        os.fsync(f.fileno())
+    return temporaire
+
+
+class StockageJSON:
+    """Une collection par fichier JSON, réécrit en entier à chaque sauvegarde.
+
+    Chaque écriture passe par un fichier temporaire renommé ensuite sur le
+    fichier final (os.replace est atomique), sous le verrou du fichier.
+    Lorsqu'une transaction modifie plusieurs fichiers, la liste des
+    renommages est d'abord enregistrée dans un journal : si le processus
+    s'arrête en cours de route, les renommages restants sont rejoués par la
+    prochaine transaction sur ces fichiers (ou par recuperer() au démarrage).
+
+    Les collections listées dans `journaux` (mouvements de stock) peuvent être
+    tenues dans un journal d'événements à côté du fichier (data/sorties.json
+    -> data/sorties/), où chaque mouvement ajoute une ligne au lieu de
+    réécrire le fichier. Une collection qui a encore son fichier JSON reste un
+    fichier tant qu'elle n'a pas été importée par importer_journaux() ; une
+    collection qui n'a pas encore de fichier démarre directement en journal.
+    """
+
+    nom = 'json'
+
+    def __init__(self, repertoire_journal=None, journaux=()):
+        self.repertoire_journal = repertoire_journal
+        self.journaux = {
+            chemin: JournalEvenements(os.path.splitext(chemin)[0]) for chemin in journaux
+        }
+        # Fichiers déjà verrouillés par le thread courant (verrous réentrants)
+        self._local = threading.local()
+
+    # Journal d'événements de la collection, ou None si elle est tenue dans un fichier JSON
+    def _journal(self, chemin):
+        journal = self.journaux.get(chemin)
+        if journal is None or journal.existe() or not os.path.exists(chemin):
+            return journal
+        return None
+
+    # Version actuelle de la collection (FileNotFoundError si elle n'existe pas)
+    def signature(self, chemin):
+        journal = self._journal(chemin)
+        if journal is not None:
+            return journal.signature()
+        return signature_fichier(os.stat(chemin))
+
+    # Retourne (signature, données, métadonnées) ; crée une liste vide si besoin
+    def lire(self, chemin):
+        journal = self._journal(chemin)
+        if journal is not None:
+            if not journal.existe():
+                self._importer(chemin)
+            # Signature lue avant les données : au pire, des données plus
+            # récentes que la signature, relues au prochain accès
+            signature = journal.signature()
+            return signature, journal.elements(), None
+
+        if not os.path.exists(chemin):
+            os.makedirs(os.path.dirname(chemin) or '.', exist_ok=True)
+            try:
+                with open(chemin, 'x', encoding='utf-8') as f:
+                    json.dump([], f)
+            except FileExistsError:
+                pass
+
+        with open(chemin, 'r', encoding='utf-8') as f:
+            # La signature est relue sur le descripteur ouvert pour
+            # correspondre exactement au contenu analysé
+            stat = os.fstat(f.fileno())
+            signature = signature_fichier(stat)
+            donnees = json.load(f)
+        _compter('octets_lus', stat.st_size)
+        return signature, donnees, None
+
+    # Crée le journal d'une collection à partir de son ancien fichier JSON, s'il existe ;
+    # retourne le nombre d'enregistrements importés (None si le journal existait déjà)
+    def _importer(self, chemin):
+        journal = self.journaux[chemin]
+        jeton = self.debut_transaction([chemin])
+        try:
+            if journal.existe():
+                return None
+            donnees = []
+            if os.path.exists(chemin):
+                with open(chemin, 'r', encoding='utf-8') as f:
+                    donnees = json.load(f)
+            journal.ajouter([('ajout', element) for element in donnees])
+            if os.path.exists(chemin):
+                _remplacer(chemin, chemin + '.importe')
+                logger.info("%s importé dans le journal %s (%d enregistrements)",
+                            chemin, journal.repertoire, len(donnees))
+            return len(donnees)
+        finally:
+            self.fin_transaction(jeton, True)
+
+    # Importe les fichiers JSON des collections tenues en journal (flask migrer-journaux) :
+    # l'ancien fichier est renommé en *.importe. Retourne {chemin: nombre d'enregistrements}
+    # pour les collections importées.
+    def importer_journaux(self):
+        resultat = {}
+        for chemin in self.journaux:
+            nombre = self._importer(chemin)
+            if nombre is not None:
+                resultat[chemin] = nombre
+        return resultat
+
+    # Écrit une seule collection ; `entree` est l'entrée du cache avant écriture
+    # Avec donnees=None, seuls les enregistrements `ajouts` sont ajoutés à la fin.
+    def ecrire(self, chemin, donnees, entree, ajouts=()):
+        jeton = self.debut_transaction([chemin])
+        try:
+            return self.valider(jeton, {chemin: (donnees, entree, ajouts)})[chemin]
+        finally:
+            self.fin_transaction(jeton, True)
+
+    def _repertoire_journal(self, chemins):
+        if self.repertoire_journal:
+            return self.repertoire_journal
+        return os.path.join(os.path.dirname(chemins[0]) or '.', 'journal')
+
+    # Verrouille les fichiers (toujours dans le même ordre, pour éviter les interblocages)
+    def debut_transaction(self, chemins):
+        chemins = sorted(set(chemins))
+        tenus = getattr(self._local, 'verrouilles', None)
+        if tenus is None:
+            tenus = self._local.verrouilles = set()
+        verrous = []
+        try:
+            for chemin in chemins:
+                if chemin in tenus:
+                    continue
+                verrou = VerrouFichier(chemin)
+                verrou.acquerir()
+                verrous.append(verrou)
+                tenus.add(chemin)
+            self._rejouer_journaux(self._repertoire_journal(chemins), chemins)
+        except BaseException:
+            self.fin_transaction((chemins, verrous), False)
+            raise
+        return chemins, verrous
+
+    # Écrit les collections modifiées : {chemin: (données, entrée du cache, ajouts)}
+    #
+    # Retourne {chemin: (signature, métadonnées, données)}, où données est le
+    # nouveau contenu (non partagé avec l'appelant) à garder en cache.
+    def valider(self, jeton, ecritures):
+        chemins, _ = jeton
+        temporaires = []
+        ajouts_journaux = []
+        contenus = {}
+        try:
+            for chemin, (donnees, _, ajouts) in ecritures.items():
+                journal = self._journal(chemin)
+                if journal is not None:
+                    if not journal.existe():
+                        self._importer(chemin)
+                    evenements = journal.differences(donnees) if donnees is not None else []
+                    evenements.extend(('ajout', element) for element in ajouts)
+                    segment, position, texte = journal.preparer(evenements)
+                    if texte:
+                        ajouts_journaux.append((chemin, segment, position, texte))
+                    continue
+                if donnees is None:
+                    # Ajout seul dans un fichier JSON : relire l'état actuel, sous le verrou
+                    donnees = self.lire(chemin)[1]
+                if ajouts:
+                    donnees = list(donnees) + list(ajouts)
+                contenus[chemin] = donnees
+                os.makedirs(os.path.dirname(chemin) or '.', exist_ok=True)
+                temporaires.append((_ecrire_temporaire(chemin, donnees), chemin))
+        except BaseException:
+            for temporaire, _ in temporaires:
+                _supprimer(temporaire)
+            raise
+
+        journal_transaction = None
+        if len(temporaires) + len(ajouts_journaux) > 1:
+            # Point de validation : une fois le journal écrit, la transaction sera menée à terme
+            repertoire = self._repertoire_journal(chemins)
+            os.makedirs(repertoire, exist_ok=True)
+            journal_transaction = os.path.join(repertoire, f'{uuid.uuid4().hex}.json')
+            temporaire_journal = _ecrire_temporaire(
+                journal_transaction,
+                {'renommages': temporaires, 'ajouts': ajouts_journaux},
+                indent=None
+            )
+            _remplacer(temporaire_journal, journal_transaction)
+            _synchroniser_repertoire(repertoire)
+
+        resultat = {}
+        for temporaire, chemin in temporaires:
+            _remplacer(temporaire, chemin)
+            resultat[chemin] = (signature_fichier(os.stat(chemin)), None, copier(contenus[chemin]))
+        for repertoire in {os.path.dirname(chemin) for _, chemin in temporaires}:
+            _synchroniser_repertoire(repertoire)
+        for _, segment, position, texte in ajouts_journaux:
+            ecrire_a_position(segment, position, texte)
+            _compter('octets_ecrits', len(texte))
+        if journal_transaction:
+            os.remove(journal_transaction)
+
+        for chemin in ecritures:
+            journal = self._journal(chemin)
+            if journal is None:
+                continue
+            if journal.a_compacter():
+                journal.compacter()
+            # Les enregistrements du journal sont relus du disque : rien à copier
+            resultat[chemin] = (journal.signature(), None, journal.elements())
+        return resultat
+
+    def fin_transaction(self, jeton, succes):
+        _, verrous = jeton
+        tenus = self._local.verrouilles
+        for verrou in reversed(verrous):
+            tenus.discard(verrou.chemin)
+            verrou.liberer()
+
+    # Réécrit le journal d'événements d'une collection en ne gardant que son état actuel
+    def compacter(self, chemin):
+        journal = self._journal(chemin)
+        if journal is None:
+            return
+        jeton = self.debut_transaction([chemin])
+        try:
+            journal.compacter()
+        finally:
+            self.fin_transaction(jeton, True)
+
+    # Termine les transactions interrompues qui concernent l'un des fichiers verrouillés
+    def _rejouer_journaux(self, repertoire, chemins):
+        try:
+            noms = os.listdir(repertoire)
+        except FileNotFoundError:
+            return
+        chemins = {os.path.abspath(chemin) for chemin in chemins}
+        for nom in noms:
+            if not nom.endswith('.json'):
+                continue
+            journal = os.path.join(repertoire, nom)
+            try:
+                with open(journal, 'r', encoding='utf-8') as f:
+                    contenu = json.load(f)
+            except FileNotFoundError:
+                continue
+            renommages = contenu['renommages']
+            ajouts = contenu.get('ajouts', [])
+            concernes = [chemin for _, chemin in renommages] + [ajout[0] for ajout in ajouts]
+            if not any(os.path.abspath(chemin) in chemins for chemin in concernes):
+                continue
+            for temporaire, chemin in renommages:
+                # Déjà renommé si le fichier temporaire n'existe plus
+                if os.path.exists(temporaire):
+                    _remplacer(temporaire, chemin)
+                    logger.warning("Transaction interrompue rejouée : %s", chemin)
+            for chemin, segment, position, texte in ajouts:
+                # Réécrire les mêmes lignes à la même position est sans effet
+                ecrire_a_position(segment, position, texte)
+                logger.warning("Transaction interrompue rejouée : %s", chemin)
+            _supprimer(journal)
+
+    # Au démarrage : rejoue les journaux en attente et supprime les fichiers temporaires orphelins
+    def recuperer(self, chemins):
+        for chemin in chemins:
+            repertoire = os.path.dirname(chemin) or '.'
+            prefixe = os.path.basename(chemin) + '.tmp-'
+            try:
+                if not any(nom.startswith(prefixe) for nom in os.listdir(repertoire)):
+                    continue
+            except FileNotFoundError:
+                continue
+            jeton = self.debut_transaction([chemin])
+            try:
+                # Sous le verrou, les fichiers temporaires restants n'appartiennent
+                # à aucune transaction en cours ni à aucun journal
+                for nom in os.listdir(repertoire):
+                    if nom.startswith(prefixe):
+                        _supprimer(os.path.join(repertoire, nom))
+            finally:
+                self.fin_transaction(jeton, False)
+
+
+def _supprimer(chemin):
+    try:
+        os.remove(chemin)
+    except FileNotFoundError:
+        pass
+
+
+# Clé d'un enregistrement dans la base SQLite : son identifiant s'il en a un
+def _cle_element(element, position, deja_vues):
+    identifiant = element.get('id') if isinstance(element, dict) else None
+    if isinstance(identifiant, (str, int)) and not isinstance(identifiant, bool):
+        cle = str(identifiant)
+        if cle not in deja_vues:
+            return cle
+    return f'#{position}'
+
+
+# Compare une liste à l'état enregistré et retourne les lignes à écrire
+#
+# `anciennes` associe chaque clé à (ordre, enregistrement). Les enregistrements
+# existants gardent leur ordre et ne sont réécrits que s'ils ont changé ; les
+# nouveaux sont placés après le plus grand ordre connu. Si la liste a été
+# réordonnée, toutes les lignes sont renumérotées.
+def _differences(anciennes, donnees):
+    ordre_max = max((ordre for ordre, _ in anciennes.values()), default=-1)
+    lignes = []
+    meta = []
+    vues = set()
+    dernier = -1
+    renumeroter = False
+
+    for position, element in enumerate(donnees):
+        cle = _cle_element(element, position, vues)
+        vues.add(cle)
+        ancien = anciennes.get(cle)
+        if ancien is None:
+            ordre_max += 1
+            ordre = ordre_max
+            lignes.append((cle, ordre, element))
+        elif ancien[0] > dernier:
+            ordre = ancien[0]
+            if ancien[1] != element:
+                lignes.append((cle, ordre, element))
+        else:
+            renumeroter = True
+            break
+        dernier = ordre
+        meta.append((cle, ordre))
+
+    if renumeroter:
+        vues = set()
+        lignes = []
+        for position, element in enumerate(donnees):
+            cle = _cle_element(element, position, vues)
+            vues.add(cle)
+            lignes.append((cle, position, element))
+        meta = [(cle, ordre) for cle, ordre, _ in lignes]
+
+    suppressions = [cle for cle in anciennes if cle not in vues]
+    return lignes, suppressions, meta
+
+
+class StockageSQLite:
+    """Toutes les collections dans une base SQLite (mode WAL), une table par collection.
+
+    Chaque enregistrement est une ligne (cle, ordre, doc) où doc est le JSON de
+    l'enregistrement. Une sauvegarde ne réécrit que les lignes ajoutées,
+    modifiées ou supprimées. La table `collections` porte un numéro de version
+    par collection, incrémenté à chaque écriture, qui sert de signature au cache.
+    """
+
+    nom = 'sqlite'
+
+    def __init__(self, chemin_base, index=None):
+        self.chemin_base = chemin_base
+        # Champs indexés par collection : {chemin: ('champ', ...)}
+        self.index = index or {}
+        self._local = threading.local()
+
+    def _connexion(self):
+        connexion = getattr(self._local, 'connexion', None)
+        if connexion is None:
+            os.makedirs(os.path.dirname(self.chemin_base) or '.', exist_ok=True)
+            # isolation_level=None : les transactions sont ouvertes explicitement
+            connexion = sqlite3.connect(self.chemin_base, timeout=30, isolation_level=None)
+            connexion.execute('PRAGMA journal_mode=WAL')
+            connexion.execute('PRAGMA synchronous=NORMAL')
+            connexion.execute(
+                'CREATE TABLE IF NOT EXISTS collections ('
+                'nom TEXT PRIMARY KEY, version INTEGER NOT NULL, forme TEXT NOT NULL)'
+            )
+            self._local.connexion = connexion
+        return connexion
+
+    @staticmethod
+    def table(chemin):
+        return os.path.splitext(os.path.basename(chemin))[0]
+
+    def _creer_table(self, connexion, chemin):
+        table = self.table(chemin)
+        connexion.execute(
+            f'CREATE TABLE IF NOT EXISTS "{table}" ('
+            'cle TEXT PRIMARY KEY, ordre INTEGER NOT NULL, doc TEXT NOT NULL)'
+        )
+        connexion.execute(f'CREATE INDEX IF NOT EXISTS "{table}_ordre" ON "{table}" (ordre)')
+        for champ in self.index.get(chemin, ()):
+            try:
+                connexion.execute(
+                    f'CREATE INDEX IF NOT EXISTS "{table}_{champ}" '
+                    f'ON "{table}" (json_extract(doc, \'$.{champ}\'))'
+                )
+            except sqlite3.OperationalError as e:
+                # SQLite compilé sans JSON1 : la collection reste utilisable sans index
+                logger.warning("Index %s.%s non créé : %s", table, champ, e)
+
+    def signature(self, chemin):
+        ligne = self._connexion().execute(
+            'SELECT version FROM collections WHERE nom = ?', (self.table(chemin),)
+        ).fetchone()
+        if ligne is None:
+            raise FileNotFoundError(chemin)
+        return ligne[0]
+
+    def _lire_lignes(self, connexion, chemin):
+        return connexion.execute(
+            f'SELECT cle, ordre, doc FROM "{self.table(chemin)}" ORDER BY ordre'
+        ).fetchall()
+
+    @staticmethod
+    def _decoder(forme, lignes):
+        if forme == 'objet':
+            return (json.loads(lignes[0][2]) if lignes else {}), None
+        # Un seul appel à json.loads pour toute la collection
+        donnees = json.loads('[' + ','.join(doc for _, _, doc in lignes) + ']')
+        return donnees, [(cle, ordre) for cle, ordre, _ in lignes]
+
+    # Ouvre une transaction SQLite, sauf si une transaction de l'application est en cours
+    def _debut(self, connexion, mode=''):
+        if getattr(self._local, 'transaction', False):
+            return False
+        connexion.execute(f'BEGIN {mode}')
+        return True
+
+    def lire(self, chemin):
+        connexion = self._connexion()
+        ouverte = self._debut(connexion)
+        try:
+            ligne = connexion.execute(
+                'SELECT version, forme FROM collections WHERE nom = ?', (self.table(chemin),)
+            ).fetchone()
+            lignes = self._lire_lignes(connexion, chemin) if ligne else []
+        finally:
+            if ouverte:
+                connexion.execute('COMMIT')
+
+        if ligne is None:
+            # Collection inexistante : créer une liste vide
+            signature, meta, _ = self.ecrire(chemin, [], None)
+            return signature, [], meta
+
+        _compter('octets_lus', sum(len(doc) for _, _, doc in lignes))
+        donnees, meta = self._decoder(ligne[1], lignes)
+        return ligne[0], donnees, meta
+
+    # Retourne (version, métadonnées, données à garder en cache ou None)
+    # Avec donnees=None, seuls les enregistrements `ajouts` sont insérés, sans relire la table.
+    def ecrire(self, chemin, donnees, entree, ajouts=()):
+        if donnees is None:
+            return self._ajouter(chemin, list(ajouts), entree)
+        if ajouts:
+            donnees = list(donnees) + list(ajouts)
+        connexion = self._connexion()
+        table = self.table(chemin)
+        forme = 'objet' if isinstance(donnees, dict) else 'liste'
+
+        ouverte = self._debut(connexion, 'IMMEDIATE')
+        try:
+            ligne = connexion.execute(
+                'SELECT version, forme FROM collections WHERE nom = ?', (table,)
+            ).fetchone()
+            if ligne is None:
+                self._creer_table(connexion, chemin)
+                connexion.execute(
+                    'INSERT INTO collections (nom, version, forme) VALUES (?, 0, ?)', (table, forme)
+                )
+                version = 0
+            else:
+                version = ligne[0]
+
+            if forme == 'objet' or (ligne is not None and ligne[1] == 'objet'):
+                # Document unique (ou changement de forme) : la table est réécrite
+                connexion.execute(f'DELETE FROM "{table}"')
+                if forme == 'objet':
+                    lignes, suppressions, meta = [('document', 0, donnees)], [], None
+                else:
+                    lignes, suppressions, meta = _differences({}, donnees)
+            else:
+                if ligne is None:
+                    anciennes = {}
+                elif entree is not None and entree[0] == version and entree[2] is not None:
+                    # Le cache est à jour : comparer avec lui sans relire la table
+                    anciennes = {cle: (ordre, element) for (cle, ordre), element in zip(entree[2], entree[1])}
+                else:
+                    # Écrite entre-temps par un autre processus : relire l'état actuel
+                    elements, meta = self._decoder(ligne[1], self._lire_lignes(connexion, chemin))
+                    anciennes = {cle: (ordre, element) for (cle, ordre), element in zip(meta, elements)}
+                lignes, suppressions, meta = _differences(anciennes, donnees)
+
+            if suppressions:
+                connexion.executemany(f'DELETE FROM "{table}" WHERE cle = ?', [(cle,) for cle in suppressions])
+            if lignes:
+                documents = [(cle, ordre, json.dumps(element, ensure_ascii=False)) for cle, ordre, element in lignes]
+                connexion.executemany(
+                    f'INSERT OR REPLACE INTO "{table}" (cle, ordre, doc) VALUES (?, ?, ?)', documents
+                )
+                _compter('octets_ecrits', sum(len(doc) for _, _, doc in documents))
+            version += 1
+            connexion.execute(
+                'UPDATE collections SET version = ?, forme = ? WHERE nom = ?', (version, forme, table)
+            )
+            if ouverte:
+                connexion.execute('COMMIT')
+        except BaseException:
+            if ouverte:
+                connexion.execute('ROLLBACK')
+            raise
+        return version, meta, copier(donnees)
+
+    def _ajouter(self, chemin, ajouts, entree):
+        connexion = self._connexion()
+        table = self.table(chemin)
+
+        ouverte = self._debut(connexion, 'IMMEDIATE')
+        try:
+            ligne = connexion.execute(
+                'SELECT version, forme FROM collections WHERE nom = ?', (table,)
+            ).fetchone()
+            if ligne is None:
+                self._creer_table(connexion, chemin)
+                connexion.execute(
+                    "INSERT INTO collections (nom, version, forme) VALUES (?, 0, 'liste')", (table,)
+                )
+                version = 0
+            elif ligne[1] == 'objet':
+                raise ValueError(f"{chemin} n'est pas une liste d'enregistrements")
+            else:
+                version = ligne[0]
+
+            ordre = connexion.execute(f'SELECT MAX(ordre) FROM "{table}"').fetchone()[0]
+            ordre = -1 if ordre is None else ordre
+            lignes = []
+            vues = set()
+            for element in ajouts:
+                ordre += 1
+                cle = _cle_element(element, ordre, vues)
+                existe = connexion.execute(f'SELECT 1 FROM "{table}" WHERE cle = ?', (cle,)).fetchone()
+                if existe:
+                    cle = f'#{ordre}-{uuid.uuid4().hex}'
+                vues.add(cle)
+                lignes.append((cle, ordre, json.dumps(element, ensure_ascii=False)))
+            connexion.executemany(f'INSERT INTO "{table}" (cle, ordre, doc) VALUES (?, ?, ?)', lignes)
+            _compter('octets_ecrits', sum(len(doc) for _, _, doc in lignes))
+            connexion.execute('UPDATE collections SET version = ? WHERE nom = ?', (version + 1, table))
+            if ouverte:
+                connexion.execute('COMMIT')
+        except BaseException:
+            if ouverte:
+                connexion.execute('ROLLBACK')
+            raise
+
+        if entree is not None and entree[0] == version and entree[2] is not None:
+            # Le cache était à jour : le compléter plutôt que relire la table
+            meta = list(entree[2]) + [(cle, ordre) for cle, ordre, _ in lignes]
+            return version + 1, meta, list(entree[1]) + copier(ajouts)
+        return version + 1, None, None
+
+    # Les transactions de l'application sont des transactions SQLite (BEGIN IMMEDIATE) :
+    # les lectures continuent pendant l'écriture grâce au mode WAL
+    def debut_transaction(self, chemins):
+        connexion = self._connexion()
+        connexion.execute('BEGIN IMMEDIATE')
+        self._local.transaction = True
+        return connexion
+
+    def valider(self, jeton, ecritures):
+        return {
+            chemin: self.ecrire(chemin, donnees, entree, ajouts)
+            for chemin, (donnees, entree, ajouts) in ecritures.items()
+        }
+
+    def fin_transaction(self, jeton, succes):
+        try:
+            jeton.execute('COMMIT' if succes else 'ROLLBACK')
+        finally:
+            self._local.transaction = False
+
+    # SQLite termine ou annule lui-même les transactions interrompues
+    def recuperer(self, chemins):
+        pass
+
+
+# Importe des collections JSON dans une base SQLite ; retourne {chemin: nombre d'enregistrements}
+def migrer_vers_sqlite(chemins, cible, source=None):
+    source = source or StockageJSON()
+    resultat = {}
+    for chemin in chemins:
+        journal = getattr(source, 'journaux', {}).get(chemin)
+        if not os.path.exists(chemin) and not (journal is not None and journal.existe()):
+            continue
+        _, donnees, _ = source.lire(chemin)
+        cible.ecrire(chemin, donnees, None)
+        resultat[chemin] = len(donnees)
+    return resultat
+
+
+class CacheCollections:
+    """Cache des collections analysées, revalidé par la signature du stockage à chaque accès."""
+
+    def __init__(self, stockage=None):
+        self.stockage = stockage or StockageJSON()
+        self._entrees = {}
+        self._verrou = threading.Lock()
+
+    # Retourne la collection analysée, partagée entre les requêtes : ne pas la modifier
+    def charger(self, chemin):
+        try:
+            signature = self.stockage.signature(chemin)
+        except FileNotFoundError:
+            signature = None
+
+        entree = self._entrees.get(chemin)
+        if entree is not None and entree[0] == signature:
+            return entree[1]
+
+        with self._verrou:
+            # Un autre thread a peut-être déjà rechargé la collection
+            entree = self._entrees.get(chemin)
+            if entree is not None and entree[0] == signature:
+                return entree[1]
+
+            signature, donnees, meta = self.stockage.lire(chemin)
+            donnees = en_collection(donnees)
+            self._entrees[chemin] = (signature, donnees, meta)
+            logger.debug("Collection %s rechargée depuis le stockage", chemin)
+            return donnees
+
+    # Version de la collection dans le stockage, sans la lire (None si elle n'existe pas) :
+    # change à chaque écriture, quel que soit le processus qui écrit
+    def version(self, chemin):
+        try:
+            return self.stockage.signature(chemin)
+        except FileNotFoundError:
+            return None
+
+    # Écrit la collection puis garde en cache ce qui vient d'être écrit, pour éviter de le relire
+    def enregistrer(self, chemin, donnees):
+        self._ecrire(chemin, donnees, ())
+
+    # Ajoute des enregistrements à la fin d'une liste sans la relire ni la réécrire
+    # (une ligne par enregistrement dans un journal d'événements ou en SQLite)
+    def ajouter(self, chemin, *elements):
+        self._ecrire(chemin, None, elements)
+
+    def _ecrire(self, chemin, donnees, ajouts):
+        try:
+            resultat = self.stockage.ecrire(chemin, donnees, self._entrees.get(chemin), ajouts)
+        except BaseException:
+            self.oublier(chemin)
+            raise
+        self._mettre_a_jour({chemin: resultat})
+
+    def _mettre_a_jour(self, resultat):
+        with self._verrou:
+            for chemin, (signature, meta, donnees) in resultat.items():
+                if donnees is None:
+                    # Contenu inconnu (ajout après une écriture d'un autre processus) : relu au prochain accès
+                    self._entrees.pop(chemin, None)
+                else:
+                    self._entrees[chemin] = (signature, en_collection(donnees), meta)
+
+    def transaction(self, chemins):
+        return Transaction(self, chemins)
+
+    # Écrit les collections d'une transaction et met le cache à jour avant la levée des verrous
+    # `ecritures` : {chemin: (données complètes ou None, enregistrements ajoutés)}
+    def valider(self, jeton, ecritures):
+        entrees = {
+            chemin: (donnees, self._entrees.get(chemin), ajouts)
+            for chemin, (donnees, ajouts) in ecritures.items()
+        }
+        self._mettre_a_jour(self.stockage.valider(jeton, entrees))
+
+    def oublier(self, chemin=None):
+        with self._verrou:
+            if chemin is None:
+                self._entrees.clear()
+            else:
+                self._entrees.pop(chemin, None)
+
+
+class Transaction:
+    """Unité de travail sur plusieurs collections.
+
+    Les collections concernées sont verrouillées pendant toute la durée du
+    bloc `with` : les données lues par charger() ne peuvent pas être modifiées
+    par une autre requête avant la fin du bloc. Les collections passées à
+    enregistrer() et les enregistrements passés à ajouter() sont écrits
+    ensemble à la sortie du bloc, ou pas du tout si une exception est levée.
+    """
+
+    def __init__(self, cache, chemins):
+        self.cache = cache
+        self.chemins = list(chemins)
+        self._ecritures = {}
+        self._ajouts = {}
+        self._jeton = None
+
+    def __enter__(self):
+        self._jeton = self.cache.stockage.debut_transaction(self.chemins)
+        return self
+
+    # Copie modifiable de la collection, lue sous le verrou
+    def charger(self, chemin):
+        if chemin not in self.chemins:
+            raise ValueError(f"{chemin} ne fait pas partie de la transaction")
+        if chemin in self._ecritures:
+            return self._ecritures[chemin]
+        donnees = self.cache.charger(chemin)
+        return donnees.copie() if isinstance(donnees, Collection) else copier(donnees)
+
+    def enregistrer(self, chemin, donnees):
+        if chemin not in self.chemins:
+            raise ValueError(f"{chemin} ne fait pas partie de la transaction")
+        self._ecritures[chemin] = donnees
+
+    # Ajoute des enregistrements à la fin d'une liste, sans la charger
+    def ajouter(self, chemin, *elements):
+        if chemin not in self.chemins:
+            raise ValueError(f"{chemin} ne fait pas partie de la transaction")
+        if chemin in self._ecritures:
+            self._ecritures[chemin].extend(elements)
+        else:
+            self._ajouts.setdefault(chemin, []).extend(elements)
+
+    def __exit__(self, type_exception, exception, trace):
+        stockage = self.cache.stockage
+        succes = type_exception is None
+        ecritures = {chemin: (None, ajouts) for chemin, ajouts in self._ajouts.items()}
+        for chemin, donnees in self._ecritures.items():
+            ecritures[chemin] = (donnees, self._ajouts.get(chemin, ()))
+        try:
+            if succes and ecritures:
+                self.cache.valider(self._jeton, ecritures)
+        except BaseException:
+            succes = False
+            raise
+        finally:
+            try:
+                stockage.fin_transaction(self._jeton, succes)
+            except BaseException:
+                succes = False
+                raise
+            finally:
+                if not succes:
+                    # Le cache ne doit pas garder de données non validées
+                    for chemin in ecritures:
+                        self.cache.oublier(chemin)
+        return False
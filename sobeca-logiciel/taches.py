@@ -0,0 +1,238 @@
+# Tâches périodiques de l'application Garage Sobeca
+#
+# Un fil par processus exécute les tâches inscrites lorsqu'elles sont dues.
+# Avec plusieurs processus (workers gunicorn), les tâches communes
+# (compaction, alertes) ne sont exécutées que par le processus meneur : celui
+# qui tient le verrou de fichier du planificateur. Si ce processus s'arrête,
+# le système libère le verrou et un autre processus le reprend au tour
+# suivant. Les tâches locales (préchauffage des caches en mémoire) sont
+# exécutées dans chaque processus.
+#
+# Les durées et résultats des exécutions sont enregistrés dans une base
+# SQLite partagée par les processus, lue par la page d'administration.
+import os
+import sqlite3
+import threading
+import time
+import logging
+
+from stockage import VerrouFichier
+
+logger = logging.getLogger(__name__)
+
+
+class Tache:
+    """Fonction exécutée toutes les `intervalle` secondes.
+
+    La fonction ne prend pas d'argument ; ce qu'elle retourne (texte court)
+    est affiché comme résultat de la dernière exécution.
+    """
+
+    def __init__(self, nom, fonction, intervalle, delai=0, locale=False, description=''):
+        self.nom = nom
+        self.fonction = fonction
+        self.intervalle = intervalle
+        self.locale = locale
+        self.description = description
+        self.prochaine = time.monotonic() + delai
+        self.verrou = threading.Lock()
+        # Mesures de ce processus
+        self.executions = 0
+        self.echecs = 0
+        self.debut = None
+        self.duree = None
+        self.duree_totale = 0.0
+        self.duree_max = 0.0
+        self.resultat = None
+        self.erreur = None
+
+
+class Planificateur:
+    """Exécution des tâches périodiques dans un fil d'arrière-plan.
+
+    `chemin_base` est la base SQLite des mesures ; le verrou du meneur est
+    posé sur `<chemin_base>.lock`. Le fil se réveille toutes les `pas`
+    secondes pour lancer les tâches dues.
+    """
+
+    def __init__(self, chemin_base, pas=5):
+        self.chemin_base = chemin_base
+        self.pas = pas
+        self._taches = {}
+        self._local = threading.local()
+        self._verrou = threading.Lock()
+        self._verrou_meneur = VerrouFichier(chemin_base)
+        self._meneur = False
+        self._fil = None
+        self._processus = None
+        self._arret = threading.Event()
+
+    def _connexion(self):
+        connexion = getattr(self._local, 'connexion', None)
+        if connexion is None:
+            os.makedirs(os.path.dirname(self.chemin_base) or '.', exist_ok=True)
+            connexion = sqlite3.connect(self.chemin_base, timeout=30, isolation_level=None)
+            connexion.execute('PRAGMA journal_mode=WAL')
+            connexion.execute(
+                'CREATE TABLE IF NOT EXISTS executions ('
+                'tache TEXT NOT NULL, processus INTEGER NOT NULL, meneur INTEGER NOT NULL, '
+                'executions INTEGER NOT NULL, echecs INTEGER NOT NULL, debut REAL, duree REAL, '
+                'duree_totale REAL NOT NULL, duree_max REAL NOT NULL, resultat TEXT, erreur TEXT, '
+                'intervalle REAL NOT NULL, PRIMARY KEY (tache, processus))'
+            )
+            self._local.connexion = connexion
+        return connexion
+
+    # Inscrit une tâche ; `delai` est l'attente avant sa première exécution
+    def ajouter(self, nom, fonction, intervalle, delai=0, locale=False, description=''):
+        self._taches[nom] = Tache(nom, fonction, intervalle, delai, locale, description)
+
+    @property
+    def meneur(self):
+        return self._meneur
+
+    # Lance le fil du processus courant (sans effet s'il tourne déjà)
+    def demarrer(self):
+        if self._fil is not None and self._processus == os.getpid() and self._fil.is_alive():
+            return
+        with self._verrou:
+            if self._fil is not None and self._processus == os.getpid() and self._fil.is_alive():
+                return
+            if self._processus != os.getpid():
+                # Processus issu d'un fork : le verrou du parent n'est pas à lui
+                self._verrou_meneur = VerrouFichier(self.chemin_base)
+                self._meneur = False
+                self._local = threading.local()
+            self._processus = os.getpid()
+            self._arret.clear()
+            self._fil = threading.Thread(target=self._boucle, name='taches', daemon=True)
+            self._fil.start()
+
+    def arreter(self):
+        self._arret.set()
+        if self._fil is not None and self._fil is not threading.current_thread():
+            self._fil.join()
+        if self._meneur:
+            self._verrou_meneur.liberer()
+            self._meneur = False
+
+    def _boucle(self):
+        while not self._arret.is_set():
+            if not self._meneur:
+                try:
+                    self._meneur = self._verrou_meneur.acquerir(attendre=False)
+                except OSError as e:
+                    logger.warning("Verrou du planificateur indisponible : %s", e)
+                if self._meneur:
+                    logger.info("Processus %d meneur des tâches planifiées", os.getpid())
+            maintenant = time.monotonic()
+            for tache in list(self._taches.values()):
+                if tache.prochaine <= maintenant and (tache.locale or self._meneur):
+                    self._executer(tache)
+            self._arret.wait(self.pas)
+
+    # Exécute une tâche tout de suite dans le fil courant ; retourne ses mesures
+    def executer(self, nom):
+        tache = self._taches[nom]
+        self._executer(tache)
+        return self._mesures(tache)
+
+    def _executer(self, tache):
+        if not tache.verrou.acquire(blocking=False):
+            # Déjà en cours dans ce processus
+            return
+        try:
+            tache.debut = time.time()
+            depart = time.perf_counter()
+            try:
+                resultat = tache.fonction()
+                tache.resultat = None if resultat is None else str(resultat)
+                tache.erreur = None
+            except Exception as e:
+                logger.exception("Échec de la tâche %s", tache.nom)
+                tache.echecs += 1
+                tache.erreur = f'{type(e).__name__}: {e}'
+            tache.duree = time.perf_counter() - depart
+            tache.executions += 1
+            tache.duree_totale += tache.duree
+            tache.duree_max = max(tache.duree_max, tache.duree)
+            tache.prochaine = time.monotonic() + tache.intervalle
+            self._enregistrer(tache)
+        finally:
+            tache.verrou.release()
+
+    def _enregistrer(self, tache):
+        try:
+            connexion = self._connexion()
+            with connexion:
+                connexion.execute('BEGIN IMMEDIATE')
+                connexion.execute(
+                    'INSERT OR REPLACE INTO executions VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    (tache.nom, os.getpid(), int(self._meneur), tache.executions, tache.echecs,
+                     tache.debut, tache.duree, tache.duree_totale, tache.duree_max,
+                     tache.resultat, tache.erreur, tache.intervalle)
+                )
+                # Mesures des processus arrêtés (ou qui ne sont plus meneurs)
+                connexion.execute('DELETE FROM executions WHERE debut + 3 * intervalle + 60 < ?',
+                                  (time.time(),))
+        except sqlite3.Error as e:
+            logger.warning("Mesures de la tâche %s non enregistrées : %s", tache.nom, e)
+
+    def _mesures(self, tache):
+        return {
+            'tache': tache.nom,
+            'description': tache.description,
+            'locale': tache.locale,
+            'intervalle': tache.intervalle,
+            'processus': os.getpid(),
+            'meneur': self._meneur,
+            'executions': tache.executions,
+            'echecs': tache.echecs,
+            'debut': tache.debut,
+            'duree': tache.duree,
+            'duree_moyenne': tache.duree_totale / tache.executions if tache.executions else None,
+            'duree_max': tache.duree_max,
+            'resultat': tache.resultat,
+            'erreur': tache.erreur
+        }
+
+    # Mesures de toutes les tâches, par processus, dans l'ordre d'inscription :
+    #     [{'tache', 'description', 'locale', 'intervalle', 'processus', 'meneur', 'executions',
+    #       'echecs', 'debut', 'duree', 'duree_moyenne', 'duree_max', 'resultat', 'erreur'}, ...]
+    # Les tâches encore jamais exécutées ont une ligne sans processus.
+    def etat(self):
+        try:
+            lignes = self._connexion().execute(
+                'SELECT tache, processus, meneur, executions, echecs, debut, duree, duree_totale, '
+                'duree_max, resultat, erreur FROM executions ORDER BY processus'
+            ).fetchall()
+        except sqlite3.Error as e:
+            logger.warning("Mesures des tâches illisibles : %s", e)
+            lignes = []
+        par_tache = {}
+        for (nom, processus, meneur, executions, echecs, debut, duree, duree_totale,
+             duree_max, resultat, erreur) in lignes:
+            par_tache.setdefault(nom, []).append({
+                'processus': processus,
+                'meneur': bool(meneur),
+                'executions': executions,
+                'echecs': echecs,
+                'debut': debut,
+                'duree': duree,
+                'duree_moyenne': duree_totale / executions if executions else None,
+                'duree_max': duree_max,
+                'resultat': resultat,
+                'erreur': erreur
+            })
+        resultat = []
+        for tache in self._taches.values():
+            definition = {'tache': tache.nom, 'description': tache.description,
+                          'locale': tache.locale, 'intervalle': tache.intervalle}
+            mesures = par_tache.get(tache.nom)
+            if not mesures:
+                resultat.append({**definition, 'processus': None, 'meneur': False, 'executions': 0,
+                                 'echecs': 0, 'debut': None, 'duree': None, 'duree_moyenne': None,
+                                 'duree_max': None, 'resultat': None, 'erreur': None})
+            for mesure in mesures or ():
+                resultat.append({**definition, **mesure})
+        return resultat
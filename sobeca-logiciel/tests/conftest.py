@@ -0,0 +1,5 @@
+# Les tests importent les modules de l'application (stockage.py, registre.py, ...) directement
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,124 @@
+import json
+import os
+import threading
+
+import evenements
+from evenements import JournalEvenements, ecrire_a_position
+from stockage import CacheCollections, StockageJSON
+
+
+def ajouts(debut, fin):
+    return [('ajout', {'id': str(i)}) for i in range(debut, fin)]
+
+
+def identifiants(journal):
+    return [element['id'] for element in journal.elements()]
+
+
+def test_lecteur_rattrape_apres_compaction(tmp_path):
+    ecrivain = JournalEvenements(str(tmp_path / 'sorties'), taille_segment=200)
+    lecteur = JournalEvenements(str(tmp_path / 'sorties'), taille_segment=200)
+    ecrivain.ajouter(ajouts(0, 20))
+    assert identifiants(lecteur) == [str(i) for i in range(20)]
+
+    ecrivain.ajouter([('suppression', str(i)) for i in range(10)] + [('remplacement', {'id': '15', 'v': 1})])
+    ecrivain.compacter()
+    ecrivain.ajouter(ajouts(20, 25))
+    # Les segments lus par le lecteur ont disparu : il relit le segment compacté puis la suite
+    assert identifiants(lecteur) == [str(i) for i in range(10, 25)]
+    assert lecteur.dernier == ecrivain.dernier
+    assert {'id': '15', 'v': 1} in lecteur.elements()
+    # Le segment compacté n'est plus complété : les ajouts suivants ouvrent un nouveau segment
+    assert len(os.listdir(ecrivain.repertoire)) == 2
+
+
+def test_ligne_incomplete_ignoree(tmp_path):
+    journal = JournalEvenements(str(tmp_path / 'sorties'))
+    journal.ajouter(ajouts(0, 2))
+    segment = os.path.join(journal.repertoire, os.listdir(journal.repertoire)[0])
+    taille = os.path.getsize(segment)
+    with open(segment, 'ab') as f:
+        f.write(b'{"n": 3, "ajout": {"id"')
+    lecteur = JournalEvenements(journal.repertoire)
+    assert identifiants(lecteur) == ['0', '1']
+    # L'écriture suivante remplace le reste de la ligne interrompue
+    ecrire_a_position(segment, taille, json.dumps({'n': 3, 'ajout': {'id': '2'}}) + '\n')
+    assert identifiants(lecteur) == ['0', '1', '2']
+
+
+def test_compactions_pendant_les_lectures(tmp_path):
+    ecrivain = JournalEvenements(str(tmp_path / 'sorties'), taille_segment=512)
+    lecteur = JournalEvenements(str(tmp_path / 'sorties'), taille_segment=512)
+    ecrivain.ajouter(ajouts(0, 1))
+    erreurs = []
+    fini = threading.Event()
+
+    def lire():
+        try:
+            precedent = 0
+            while not fini.is_set():
+                vus = identifiants(lecteur)
+                # Toujours un état complet : les ajouts dans l'ordre, sans trou ni doublon
+                assert vus == [str(i) for i in range(len(vus))]
+                assert len(vus) >= precedent
+                precedent = len(vus)
+        except Exception as e:
+            erreurs.append(e)
+
+    fil = threading.Thread(target=lire)
+    fil.start()
+    try:
+        for lot in range(1, 200):
+            ecrivain.ajouter(ajouts(lot * 5 - 4, lot * 5 + 1))
+            if lot % 20 == 0:
+                ecrivain.compacter()
+    finally:
+        fini.set()
+        fil.join()
+    assert erreurs == []
+    assert identifiants(lecteur) == [str(i) for i in range(996)]
+
+
+def test_segments_encore_ouverts_supprimes_a_la_compaction_suivante(tmp_path, monkeypatch):
+    ecrivain = JournalEvenements(str(tmp_path / 'sorties'), taille_segment=50)
+    for debut in range(0, 10, 2):
+        ecrivain.ajouter(ajouts(debut, debut + 2))
+    anciens = sorted(os.listdir(ecrivain.repertoire))
+    assert len(anciens) > 1
+
+    # Sous Windows, un segment ouvert par un lecteur ne peut pas être supprimé
+    def refuser(chemin):
+        raise PermissionError(chemin)
+
+    monkeypatch.setattr(evenements.os, 'remove', refuser)
+    ecrivain.compacter()
+    monkeypatch.undo()
+    ecrivain.ajouter(ajouts(10, 12))
+    lecteur = JournalEvenements(ecrivain.repertoire)
+    assert identifiants(lecteur) == [str(i) for i in range(12)]
+    assert set(anciens) < set(os.listdir(ecrivain.repertoire))
+
+    ecrivain.compacter()
+    assert os.listdir(ecrivain.repertoire) == ['000000000012.compacte.jsonl']
+    assert identifiants(lecteur) == [str(i) for i in range(12)]
+
+
+def test_fichier_json_importe_a_la_demande(tmp_path):
+    sorties = str(tmp_path / 'sorties.json')
+    with open(sorties, 'w', encoding='utf-8') as f:
+        json.dump([{'id': 'a'}], f)
+    stockage = StockageJSON(str(tmp_path / 'journal'), journaux=[sorties])
+    cache = CacheCollections(stockage)
+    stockage.recuperer([sorties])
+    cache.ajouter(sorties, {'id': 'b'})
+    # Sans migration, la collection reste un fichier JSON
+    assert not os.path.exists(str(tmp_path / 'sorties'))
+    with open(sorties, 'r', encoding='utf-8') as f:
+        assert [element['id'] for element in json.load(f)] == ['a', 'b']
+
+    assert stockage.importer_journaux() == {sorties: 2}
+    assert not os.path.exists(sorties)
+    assert os.path.exists(sorties + '.importe')
+    cache.ajouter(sorties, {'id': 'c'})
+    assert [element['id'] for element in cache.charger(sorties)] == ['a', 'b', 'c']
+    assert stockage.importer_journaux() == {}
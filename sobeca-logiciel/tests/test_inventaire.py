@@ -0,0 +1,62 @@
+import pytest
+
+from inventaire import ecarts, lire_feuille, quantites_comptees
+
+
+@pytest.mark.parametrize('texte', [
+    'reference;quantite\nF-01;4\nF-02;0\n',
+    'Référence,Qté\nF-01,4\nF-02,0\n',
+    '\ufeffREF;Quantité comptée\r\nF-01;4\r\nF-02;0\r\n',
+])
+def test_separateurs_et_en_tetes(texte):
+    lignes, erreurs = lire_feuille(texte)
+    assert erreurs == []
+    assert lignes == [{'piece': 'F-01', 'quantite': 4, 'ligne': 2},
+                      {'piece': 'F-02', 'quantite': 0, 'ligne': 3}]
+
+
+def test_colonnes_dans_un_autre_ordre():
+    lignes, _ = lire_feuille('designation;qte;piece_id\nFiltre, huile;3;p1\n')
+    assert lignes == [{'piece': 'p1', 'quantite': 3, 'ligne': 2}]
+
+
+def test_en_tetes_manquants():
+    lignes, erreurs = lire_feuille('piece;nombre\nF-01;4\n')
+    assert lignes == []
+    assert len(erreurs) == 1
+
+
+def test_feuille_vide():
+    assert lire_feuille('')[0] == []
+    assert len(lire_feuille('')[1]) == 1
+
+
+def test_lignes_invalides():
+    texte = 'reference;quantite\nF-01;4\nF-02;abc\n;;\nF-03;-1\n;2\nF-04\nF-05;7\n'
+    lignes, erreurs = lire_feuille(texte)
+    assert [ligne['piece'] for ligne in lignes] == ['F-01', 'F-05']
+    assert lignes[-1]['ligne'] == 8
+    # Une erreur par ligne fautive, avec son numéro ; la ligne vide est ignorée
+    assert [erreur.split(' :')[0] for erreur in erreurs] == ['Ligne 3', 'Ligne 5', 'Ligne 6', 'Ligne 7']
+
+
+def test_quantites_comptees_dans_l_ordre_d_arrivee():
+    comptages = [
+        {'piece_id': 'a', 'quantite': 1, 'mode': 'ajouter'},
+        {'piece_id': 'a', 'quantite': 1, 'mode': 'ajouter'},
+        {'piece_id': 'b', 'quantite': 5, 'mode': 'remplacer'},
+        {'piece_id': 'a', 'quantite': 10, 'mode': 'remplacer'},
+        {'piece_id': 'a', 'quantite': 2, 'mode': 'ajouter'},
+        {'piece_id': 'b', 'quantite': 3},
+    ]
+    assert quantites_comptees(comptages) == {'a': 12, 'b': 3}
+    assert quantites_comptees(comptages[:2]) == {'a': 2}
+    assert quantites_comptees([]) == {}
+
+
+def test_ecarts():
+    pieces = [{'id': 'a', 'quantite': 5}, {'id': 'b', 'quantite': '2'}, {'id': 'c', 'quantite': None}]
+    quantites = {'b': 4, 'a': 5}
+    assert [(ligne['piece']['id'], ligne['ecart']) for ligne in ecarts(pieces, quantites)] == [('a', 0), ('b', 2)]
+    tous = ecarts(pieces, quantites, non_comptees_a_zero=True)
+    assert tous[-1] == {'piece': pieces[2], 'quantite_systeme': 0, 'quantite_comptee': 0, 'ecart': 0}
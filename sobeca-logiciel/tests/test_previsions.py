@@ -0,0 +1,76 @@
+from datetime import date, timedelta
+
+import pytest
+
+from previsions import HORIZON_JOURS, PrevisionsStock
+from stockage import Collection
+
+np = pytest.importorskip('numpy')
+
+AUJOURD_HUI = date(2024, 6, 1)
+
+
+def sortie(piece_id, jours, quantite=1):
+    jour = AUJOURD_HUI - timedelta(days=jours)
+    return {'piece_id': piece_id, 'quantite': quantite, 'date_sortie': f'{jour.isoformat()} 10:00:00'}
+
+
+def previsions(stock, sorties, **reglages):
+    collections = {'stock': Collection(stock), 'sorties': Collection(sorties)}
+    prevision = PrevisionsStock(collections.__getitem__, 'stock', 'sorties', **reglages)
+    return {ligne['piece']['id']: ligne for ligne in prevision.previsions(aujourd_hui=AUJOURD_HUI)}
+
+
+def test_taux_et_date_de_rupture():
+    stock = [{'id': 'a', 'quantite': 30, 'quantite_min': 0}]
+    sorties = [sortie('a', jours) for jours in range(30)]
+    ligne = previsions(stock, sorties, methode='moyenne')['a']
+    assert ligne['taux'] == 1.0
+    assert ligne['jours_restants'] == 30
+    assert ligne['date_rupture'] == (AUJOURD_HUI + timedelta(days=30)).isoformat()
+    assert not ligne['a_commander']
+
+
+def test_une_sortie_ancienne_ne_prevoit_pas_de_rupture():
+    # Poids 0.9^89 : le taux exponentiel est infime, la rupture serait dans des millions de jours
+    stock = [{'id': 'a', 'quantite': 5000, 'quantite_min': 0}]
+    ligne = previsions(stock, [sortie('a', 89)])['a']
+    assert ligne['conso_exponentielle'] >= 0
+    assert ligne['jours_restants'] is None
+    assert ligne['date_rupture'] is None
+    assert not ligne['a_commander']
+
+
+def test_rupture_au_dela_de_l_horizon():
+    stock = [{'id': 'a', 'quantite': 10 * HORIZON_JOURS, 'quantite_min': 0}]
+    ligne = previsions(stock, [sortie('a', jours) for jours in range(30)], methode='moyenne')['a']
+    assert ligne['taux'] == 1.0
+    assert ligne['jours_restants'] is None
+
+
+def test_quantites_enregistrees_en_texte():
+    stock = [{'id': 'a', 'quantite': '5', 'quantite_min': '10'},
+             {'id': 'b', 'quantite': 'abc', 'quantite_min': None}]
+    lignes = previsions(stock, [sortie('a', 0, quantite='2'), sortie('b', 0)])
+    assert lignes['a']['a_commander']
+    assert lignes['a']['quantite_suggeree'] >= 5
+    assert lignes['b']['jours_restants'] == 0
+
+
+def test_a_commander_dans_le_delai_ou_sous_le_minimum():
+    stock = [{'id': 'rapide', 'quantite': 10, 'quantite_min': 0},
+             {'id': 'lent', 'quantite': 10, 'quantite_min': 0},
+             {'id': 'minimum', 'quantite': 1, 'quantite_min': 2}]
+    sorties = [sortie('rapide', jours) for jours in range(30)]
+    lignes = previsions(stock, sorties, methode='moyenne', delai=14)
+    assert lignes['rapide']['a_commander']
+    assert not lignes['lent']['a_commander']
+    assert lignes['minimum']['a_commander'] and lignes['minimum']['jours_restants'] is None
+
+
+def test_dates_invalides_et_hors_fenetre_ignorees():
+    stock = [{'id': 'a', 'quantite': 10, 'quantite_min': 0}]
+    sorties = [sortie('a', 200), sortie('a', -3), {'piece_id': 'a', 'quantite': 4, 'date_sortie': 'pas une date'}]
+    ligne = previsions(stock, sorties)['a']
+    assert ligne['taux'] == 0
+    assert ligne['jours_restants'] is None
@@ -0,0 +1,83 @@
+import pytest
+
+import registre
+from registre import RegistreStock
+from stockage import Collection
+
+
+def test_entree_recalcule_le_cout_moyen_pondere():
+    piece = {'id': 'a', 'quantite': 10, 'cout_moyen': 2.0}
+    registre.entree(piece, 30, prix=4.0)
+    assert piece['quantite'] == 40
+    assert piece['cout_moyen'] == 3.5
+
+
+def test_entree_sans_prix_garde_le_cout_moyen():
+    piece = {'id': 'a', 'quantite': 10, 'prix_achat': 2.5}
+    registre.entree(piece, 5)
+    assert piece['quantite'] == 15
+    assert piece['cout_moyen'] == 2.5
+
+
+@pytest.mark.parametrize('quantite', [0, -3])
+def test_entree_dans_un_stock_vide_prend_le_prix_de_l_entree(quantite):
+    piece = {'id': 'a', 'quantite': quantite, 'cout_moyen': 9.0}
+    registre.entree(piece, 5, prix=4.0)
+    assert piece['quantite'] == quantite + 5
+    assert piece['cout_moyen'] == 4.0
+
+
+def test_sortie_au_cout_moyen():
+    piece = {'id': 'a', 'quantite': 10, 'cout_moyen': 3.25}
+    assert registre.sortie(piece, 4) == 3.25
+    assert piece['quantite'] == 6
+    assert piece['cout_moyen'] == 3.25
+
+
+def test_sortie_d_une_piece_sans_cout_moyen():
+    # Pièce créée avant le registre : la sortie est valorisée au prix d'achat, qui devient son coût moyen
+    piece = {'id': 'a', 'quantite': 3, 'prix_achat': 7}
+    assert registre.sortie(piece, 1) == 7.0
+    assert piece['cout_moyen'] == 7.0
+    assert piece['quantite'] == 2
+
+
+def test_ajuster_surplus_et_manque():
+    piece = {'id': 'a', 'quantite': 10, 'cout_moyen': 2.0}
+    assert registre.ajuster(piece, 20, prix=4.0) == 10
+    assert piece['quantite'] == 20
+    assert piece['cout_moyen'] == 3.0
+    assert registre.ajuster(piece, 5) == -15
+    assert piece['quantite'] == 5
+    assert piece['cout_moyen'] == 3.0
+    assert registre.ajuster(piece, 5) == 0
+
+
+def test_quantites_enregistrees_en_texte():
+    assert registre.quantite_piece('5') == 5
+    assert registre.quantite_piece(None) == 0
+    assert registre.quantite_piece('abc') == 0
+    piece = {'id': 'a', 'quantite': '4', 'cout_moyen': 1.0, 'quantite_min': '5'}
+    assert registre.en_stock_faible(piece)
+    registre.entree(piece, 4, prix=4.0)
+    assert piece['quantite'] == 8
+    assert piece['cout_moyen'] == 2.5
+
+
+def test_totaux_par_fournisseur_suivent_le_stock():
+    collections = {'stock': Collection([
+        {'id': 'a', 'quantite': 4, 'cout_moyen': 2.5, 'fournisseur_id': 'f1', 'quantite_min': 5},
+        {'id': 'b', 'quantite': 0, 'prix_achat': 10, 'fournisseur_id': 'f2'},
+        {'id': 'c', 'quantite': '3', 'prix_achat': '2'},
+    ])}
+    stock = RegistreStock(collections.__getitem__, 'stock', 'sorties', 'historique')
+    assert stock.totaux() == {'valeur_stock': 16.0, 'nombre_pieces': 3, 'stock_faible': 1, 'ruptures': 1}
+    assert stock.totaux('f1') == {'valeur_stock': 10.0, 'nombre_pieces': 1, 'stock_faible': 1, 'ruptures': 0}
+
+    # Nouvelle collection : seule la pièce modifiée est recomptée
+    pieces = collections['stock'].copie()
+    registre.entree(pieces[0], 6, prix=5.0)
+    collections['stock'] = pieces
+    assert stock.totaux('f1') == {'valeur_stock': 40.0, 'nombre_pieces': 1, 'stock_faible': 0, 'ruptures': 0}
+    assert stock.totaux()['valeur_stock'] == 46.0
+    assert stock.totaux('inconnu') == {'valeur_stock': 0.0, 'nombre_pieces': 0, 'stock_faible': 0, 'ruptures': 0}
@@ -0,0 +1,102 @@
+import json
+import os
+
+import pytest
+
+import stockage
+from stockage import CacheCollections, StockageJSON, StockageSQLite
+
+
+@pytest.fixture
+def fichiers(tmp_path):
+    stock = str(tmp_path / 'stock.json')
+    sorties = str(tmp_path / 'sorties.json')
+    with open(stock, 'w', encoding='utf-8') as f:
+        json.dump([{'id': 'p', 'quantite': 5}], f)
+    with open(sorties, 'w', encoding='utf-8') as f:
+        json.dump([], f)
+    return str(tmp_path / 'journal'), stock, sorties
+
+
+def lire(chemin):
+    with open(chemin, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def sortir(cache, stock, sorties):
+    with cache.transaction([stock, sorties]) as tx:
+        pieces = tx.charger(stock)
+        pieces[0]['quantite'] -= 1
+        tx.enregistrer(stock, pieces)
+        tx.ajouter(sorties, {'id': 's1', 'piece_id': 'p', 'quantite': 1})
+
+
+@pytest.mark.parametrize('mode', ['json', 'sqlite'])
+def test_exception_annule_la_transaction(fichiers, mode):
+    journal, stock, sorties = fichiers
+    if mode == 'json':
+        cache = CacheCollections(StockageJSON(journal))
+    else:
+        cache = CacheCollections(StockageSQLite(os.path.join(os.path.dirname(stock), 'test.db')))
+        cache.enregistrer(stock, [{'id': 'p', 'quantite': 5}])
+    with pytest.raises(RuntimeError):
+        with cache.transaction([stock, sorties]) as tx:
+            pieces = tx.charger(stock)
+            pieces[0]['quantite'] = 0
+            tx.enregistrer(stock, pieces)
+            tx.ajouter(sorties, {'id': 's1'})
+            raise RuntimeError('interrompue')
+    assert cache.charger(stock)[0]['quantite'] == 5
+    assert list(cache.charger(sorties)) == []
+    # Rien n'a été écrit, et les verrous ont été rendus
+    sortir(cache, stock, sorties)
+    assert cache.charger(stock)[0]['quantite'] == 4
+
+
+def test_renommages_interrompus_rejoues_au_demarrage(fichiers, monkeypatch):
+    journal, stock, sorties = fichiers
+    remplacer = stockage._remplacer
+    appels = []
+
+    # Arrêt brutal après le journal et le premier renommage
+    def remplacer_puis_tomber(source, destination):
+        appels.append(destination)
+        if len(appels) == 3:
+            raise KeyboardInterrupt
+        remplacer(source, destination)
+
+    monkeypatch.setattr(stockage, '_remplacer', remplacer_puis_tomber)
+    with pytest.raises(KeyboardInterrupt):
+        sortir(CacheCollections(StockageJSON(journal)), stock, sorties)
+    monkeypatch.setattr(stockage, '_remplacer', remplacer)
+    assert len(os.listdir(journal)) == 1
+    assert (lire(stock)[0]['quantite'], len(lire(sorties))) in ((4, 0), (5, 1))
+
+    StockageJSON(journal).recuperer([stock, sorties])
+    assert lire(stock)[0]['quantite'] == 4
+    assert [sortie['id'] for sortie in lire(sorties)] == ['s1']
+    assert os.listdir(journal) == []
+    assert not [nom for nom in os.listdir(os.path.dirname(stock)) if '.tmp-' in nom]
+
+
+def test_ajouts_interrompus_rejoues_par_la_transaction_suivante(fichiers, monkeypatch):
+    journal, stock, sorties = fichiers
+    os.remove(sorties)
+    # Sans fichier JSON, les sorties démarrent en journal d'événements
+    journaux = [sorties]
+
+    def tomber(chemin, position, texte):
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(stockage, 'ecrire_a_position', tomber)
+    with pytest.raises(KeyboardInterrupt):
+        sortir(CacheCollections(StockageJSON(journal, journaux=journaux)), stock, sorties)
+    monkeypatch.undo()
+    assert lire(stock)[0]['quantite'] == 4
+    assert len(os.listdir(journal)) == 1
+
+    cache = CacheCollections(StockageJSON(journal, journaux=journaux))
+    with cache.transaction([sorties]):
+        pass
+    assert [sortie['id'] for sortie in cache.charger(sorties)] == ['s1']
+    assert os.listdir(journal) == []